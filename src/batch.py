@@ -0,0 +1,302 @@
+"""
+Ranking destinations for many teams in one run, e.g. every project team,
+each a subset of the config's origins with its own list of destinations.
+
+The route store is read once, into a single travel time matrix covering
+every team, which is put in shared memory so a pool of worker processes
+can score teams from it without each being sent a copy. Results are
+written out as JSON lines, in the order of the teams, as they're ready.
+"""
+
+import json
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple, Union
+
+import numpy as np
+
+from coordinates import RouteIndex
+from estimator import TravelTimeEstimator
+from metrics import metrics
+from objectives import Objective, evaluate_objectives, resolve_objective
+from route_store import open_route_store
+from scenarios import resolve_scenario
+from scoring import TravelTimeMatrix, top_n_indices
+
+# (origin rows, destination columns, origin weights, objective, top N)
+Task = Tuple[np.ndarray, np.ndarray, np.ndarray, Objective, int]
+
+
+class InvalidTeam(ValueError):
+    """
+    A team config that couldn't be read, named after where it came from.
+    """
+
+    def __init__(self, name: str, message: str):
+        super().__init__(message)
+        self.name = name
+
+
+def parse_team(text: str, name: str):
+    """
+    The team config in `text`, named `name` unless it has a "name", or an
+    `InvalidTeam` if it isn't a JSON object.
+    """
+    try:
+        team = json.loads(text)
+    except json.JSONDecodeError as e:
+        return InvalidTeam(name, f"Invalid JSON: {e.msg}")
+    if not isinstance(team, dict):
+        return InvalidTeam(name, "A team must be a JSON object")
+    team.setdefault("name", name)
+    return team
+
+
+def load_teams(path: str) -> Iterator[Union[Dict, InvalidTeam]]:
+    """
+    Team configs from a directory of .json files, in name order, or from a
+    JSONL file with one per line. A team from a file is named after the
+    file unless it has a "name".
+
+    A file or line that isn't a JSON object is yielded as an `InvalidTeam`
+    rather than stopping the rest being read.
+    """
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(".json"):
+                with open(os.path.join(path, filename), "r") as f:
+                    yield parse_team(f.read(), filename[: -len(".json")])
+        return
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield parse_team(line, f"line {line_number}")
+
+
+class SharedMatrix:
+    """
+    An array copied into shared memory, which worker processes attach to
+    by name (see `spec`) rather than each unpickling their own copy.
+    """
+
+    def __init__(self, array: np.ndarray):
+        self.memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(array.shape, array.dtype, buffer=self.memory.buf)
+        self.array[...] = array
+
+    @property
+    def spec(self) -> Tuple[str, Tuple[int, ...], str]:
+        return self.memory.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        del self.array  # The buffer can't be released while it's viewed
+        self.memory.close()
+        self.memory.unlink()
+
+
+def rank_team(times: np.ndarray, task: Task) -> Tuple[List[int], List[float]]:
+    """
+    The columns of `times` of a team's `top_n` best destinations, best
+    first, and their scores.
+    """
+    rows, columns, weights, objective, top_n = task
+    team_times = times[np.ix_(rows, columns)]
+    scores = evaluate_objectives([objective], team_times, weights)[objective.name]
+    best = top_n_indices(scores, top_n)
+    return columns[best].tolist(), scores[best].tolist()
+
+
+# The shared matrix, as attached to by each worker process
+_worker_memory: Optional[SharedMemory] = None
+_worker_times: Optional[np.ndarray] = None
+
+
+def _attach(spec: Tuple[str, Tuple[int, ...], str]):
+    global _worker_memory, _worker_times
+    name, shape, dtype = spec
+    _worker_memory = SharedMemory(name=name)
+    _worker_times = np.ndarray(shape, dtype, buffer=_worker_memory.buf)
+
+
+def _rank_team_in_worker(task: Task) -> Tuple[List[int], List[float]]:
+    return rank_team(_worker_times, task)
+
+
+class BatchRanker:
+    """
+    Turns team configs into scoring tasks over one matrix of every origin
+    and destination any team needs.
+
+    A team's "origins" are names of origins in the main config or, for
+    anyone not in it, {"name", "lat", "lon"} dicts, as are its optional
+    "destinations" (all of the config's by default). It may also choose
+    an "objective", define its own "objectives" (see `objectives.py`) and
+    set how many destinations to rank with "top".
+    """
+
+    def __init__(self, config: Dict, objective: Optional[str] = None, top_n: int = 5):
+        self.config = config
+        self.objective = objective
+        self.top_n = top_n
+        self.origins: List[Dict] = list(config["origins"])
+        self.destinations: List[Dict] = list(config["destinations"])
+        self.origin_rows = self._index(self.origins)
+        self.destination_columns = self._index(self.destinations)
+
+    @staticmethod
+    def _point(location: Dict) -> Tuple[float, float]:
+        return round(location["lat"], 4), round(location["lon"], 4)
+
+    def _index(self, locations: List[Dict]) -> Dict:
+        # Locations can be found by name or, if not in the config, by point
+        index = {}
+        for i, location in enumerate(locations):
+            index.setdefault(location["name"], i)
+            index.setdefault(self._point(location), i)
+        return index
+
+    def _lookup(self, spec, index: Dict, locations: List[Dict], kind: str) -> int:
+        if isinstance(spec, str):
+            if spec not in index:
+                raise ValueError(f"Unknown {kind}: {spec}")
+            return index[spec]
+        point = self._point(spec)
+        if point not in index:
+            index[point] = len(locations)
+            locations.append(spec)
+        return index[point]
+
+    def task(self, team: Dict) -> Task:
+        """
+        The scoring task for a team, adding any origins and destinations
+        it brings to those the matrix must cover.
+        """
+        if not team.get("origins"):
+            raise ValueError("A team needs at least one origin")
+        rows = [
+            self._lookup(spec, self.origin_rows, self.origins, "origin")
+            for spec in team["origins"]
+        ]
+        columns = [
+            self._lookup(
+                spec, self.destination_columns, self.destinations, "destination"
+            )
+            for spec in team.get("destinations", self.config["destinations"])
+        ]
+        objectives = {**self.config.get("objectives", {}), **team.get("objectives", {})}
+        objective = resolve_objective(
+            team.get("objective", self.objective), {"objectives": objectives}
+        )
+        weights = [self.origins[row].get("weight", 1) for row in rows]
+        if not any(weight > 0 for weight in weights):
+            raise ValueError("A team needs at least one origin with a positive weight")
+        top_n = int(team.get("top", self.top_n))
+        if top_n < 1:
+            raise ValueError("A team's top must be at least 1")
+        return (
+            np.array(rows, dtype=np.intp),
+            np.array(columns, dtype=np.intp),
+            np.array(weights, dtype=np.float64),
+            objective,
+            top_n,
+        )
+
+    def matrix(
+        self, index: RouteIndex, estimate_missing: bool = False
+    ) -> TravelTimeMatrix:
+        origins = [self._point(origin) for origin in self.origins]
+        destinations = [self._point(destination) for destination in self.destinations]
+        matrix = TravelTimeMatrix.from_index(index, origins, destinations)
+        if estimate_missing:
+            with metrics.phase("estimate"):
+                matrix.fill_missing(TravelTimeEstimator(index), origins, destinations)
+        return matrix
+
+    def result(self, team: Dict, task: Task, ranking: Tuple[List[int], List[float]]):
+        columns, scores = ranking
+        return {
+            "team": team["name"],
+            "objective": task[3].name,
+            "origins": len(task[0]),
+            "destinations": [
+                {
+                    **self.destinations[column],
+                    # JSON has no infinity; nobody can reach it from somewhere
+                    "score": score if np.isfinite(score) else None,
+                }
+                for column, score in zip(columns, scores)
+            ],
+        }
+
+
+def batch_rank(
+    config_file: str,
+    routes_file: str,
+    teams_path: str,
+    output: TextIO,
+    workers: Optional[int] = None,
+    scenario: Optional[str] = None,
+    objective: Optional[str] = None,
+    top_n: int = 5,
+    estimate_missing: bool = False,
+) -> Dict[str, int]:
+    """
+    Rank destinations for every team in `teams_path` (see `load_teams` and
+    `BatchRanker`), writing a JSON line per team to `output`. A team whose
+    config is invalid, or isn't even JSON, gets a line with an "error"
+    rather than stopping the batch. Returns how many teams were ranked and
+    how many failed.
+
+    Teams are scored by `workers` processes (default: one per CPU), or in
+    this process if that's 1.
+    """
+    with metrics.phase("load_config"), open(config_file, "r") as f:
+        config = json.load(f)
+    resolved = resolve_scenario(scenario, config)
+    ranker = BatchRanker(config, objective, top_n)
+
+    teams = list(load_teams(teams_path))
+    tasks = []
+    for team in teams:
+        if isinstance(team, InvalidTeam):
+            tasks.append(team)
+            continue
+        try:
+            tasks.append(ranker.task(team))
+        except (ValueError, KeyError, TypeError) as e:
+            tasks.append(e)
+
+    with metrics.phase("load_routes"):
+        with open_route_store(routes_file) as routes:
+            index = RouteIndex.from_routes(routes, resolved.mode, resolved.slot)
+    times = ranker.matrix(index, estimate_missing).times
+    valid = [task for task in tasks if not isinstance(task, Exception)]
+    counts = {"ranked": 0, "failed": 0}
+
+    def write(rankings: Iterator):
+        for team, task in zip(teams, tasks):
+            if isinstance(task, Exception):
+                name = task.name if isinstance(task, InvalidTeam) else team["name"]
+                line = {"team": name, "error": str(task)}
+                counts["failed"] += 1
+            else:
+                line = ranker.result(team, task, next(rankings))
+                counts["ranked"] += 1
+            output.write(json.dumps(line) + "\n")
+
+    workers = workers or os.cpu_count() or 1
+    with metrics.phase("score"):
+        if workers == 1 or len(valid) <= 1:
+            write(rank_team(times, task) for task in valid)
+        else:
+            shared = SharedMatrix(times)
+            try:
+                with Pool(
+                    workers, initializer=_attach, initargs=(shared.spec,)
+                ) as pool:
+                    chunksize = max(1, len(valid) // (workers * 4))
+                    write(pool.imap(_rank_team_in_worker, valid, chunksize))
+            finally:
+                shared.close()
+    return counts
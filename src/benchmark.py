@@ -0,0 +1,510 @@
+"""
+Micro-benchmarks for the hot paths of route fetching and ranking.
+
+Run from the repository root, e.g.:
+
+    python src/benchmark.py route-lookup
+
+`suite` times the whole pipeline on synthetic teams, using a fake Maps
+client, e.g.:
+
+    python src/benchmark.py suite --sizes 50x20,500x200 --latency 0.05 \
+        --output benchmark.json
+
+`batch-rank` times ranking many teams at once with different numbers of
+worker processes.
+
+Results are printed as JSON.
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from contextlib import redirect_stdout
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from batch import batch_rank
+from coordinates import RouteIndex, coordinate_key
+from fake_maps import FakeMapsClient
+from geo import haversine_km_matrix
+from metrics import metrics
+from route_payload import pack_route_matrix, unpack_route_matrix
+from route_store import open_route_store
+from runner import BestDestinationFinder, RouteUpdater, build_embedded_html
+
+# Synthetic people and hubs are scattered around these cities
+UK_CITIES = [
+    (51.507, -0.128),  # London
+    (52.486, -1.890),  # Birmingham
+    (53.481, -2.243),  # Manchester
+    (53.801, -1.549),  # Leeds
+    (54.978, -1.618),  # Newcastle
+    (51.455, -2.588),  # Bristol
+    (51.481, -3.179),  # Cardiff
+    (52.954, -1.158),  # Nottingham
+    (51.752, -1.258),  # Oxford
+    (52.205, 0.122),  # Cambridge
+    (50.376, -4.143),  # Plymouth
+    (55.953, -3.189),  # Edinburgh
+    (55.861, -4.252),  # Glasgow
+    (57.150, -2.094),  # Aberdeen
+    (54.597, -5.930),  # Belfast
+]
+
+
+def _best_of(func, repeat: int, number: int) -> float:
+    """Best time per call in seconds, which is the least noisy estimate."""
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def bench_route_lookup(
+    config_file: str = "locations_config.json",
+    routes_file: str = "routes.json",
+    repeat: int = 5,
+    number: int = 20,
+) -> Dict:
+    """
+    Time looking up every origin x destination route in the config, with
+    f-string route keys (as before) and with interned coordinate ids.
+    """
+    with open(config_file, "r") as f:
+        config = json.load(f)
+    with open_route_store(routes_file) as store:
+        routes = dict(store.items())
+    origins = [(round(o["lat"], 4), round(o["lon"], 4)) for o in config["origins"]]
+    destinations = [
+        (round(d["lat"], 4), round(d["lon"], 4)) for d in config["destinations"]
+    ]
+
+    def string_keys():
+        travel_times = []
+        for destination in destinations:
+            for origin in origins:
+                origin_str = f"{origin[0]:.2f},{origin[1]:.2f}"
+                dest_str = f"{destination[0]:.2f},{destination[1]:.2f}"
+                travel_times.append(routes.get(f"{origin_str}->{dest_str}", 1800))
+        return travel_times
+
+    index = RouteIndex.from_routes(routes)
+    point_ids = index.coordinates.point_ids
+
+    def interned_ids():
+        get = index.times.get
+        origin_ids = point_ids(origins)
+        return [
+            get((origin_id, dest_id), 1800)
+            for dest_id in point_ids(destinations)
+            for origin_id in origin_ids
+        ]
+
+    assert string_keys() == interned_ids()
+    before = _best_of(string_keys, repeat, number)
+    after = _best_of(interned_ids, repeat, number)
+    return {
+        "benchmark": "route-lookup",
+        "lookups": len(origins) * len(destinations),
+        "string_keys_ms": before * 1000,
+        "interned_ids_ms": after * 1000,
+        "speedup": before / after,
+        "index_build_ms": _best_of(lambda: RouteIndex.from_routes(routes), repeat, 1)
+        * 1000,
+    }
+
+
+def bench_html_payload(
+    config_file: str = "locations_config.json",
+    routes_file: str = "routes.json",
+    repeat: int = 5,
+    number: int = 20,
+) -> Dict:
+    """
+    Compare the size and decode time of the routes embedded by
+    `build_embedded_html` as base64 JSON and as a packed matrix, with and
+    without deflate.
+
+    Decoding is timed in Python, as a proxy for `JSON.parse(atob(...))` and
+    typed array decoding in the browser.
+    """
+    with open(config_file, "r") as f:
+        config = json.load(f)
+    with open_route_store(routes_file) as store:
+        routes = dict(store.items())
+
+    json_payload = base64.b64encode(json.dumps(routes).encode()).decode()
+    packed = pack_route_matrix(config, routes, compress=False)
+    deflated = pack_route_matrix(config, routes, compress=True)
+
+    def decode_json():
+        return json.loads(base64.b64decode(json_payload))
+
+    json_ms = _best_of(decode_json, repeat, number) * 1000
+    result = {
+        "benchmark": "html-payload",
+        "routes": len(routes),
+        "json_bytes": len(json_payload),
+        "json_decode_ms": json_ms,
+    }
+    for name, payload in [("packed", packed), ("deflated", deflated)]:
+        size = len(json.dumps(payload))
+        decode_ms = _best_of(lambda: unpack_route_matrix(payload), repeat, number)
+        result[f"{name}_bytes"] = size
+        result[f"{name}_decode_ms"] = decode_ms * 1000
+        result[f"{name}_size_ratio"] = len(json_payload) / size
+    return result
+
+
+def synthetic_config(n_origins: int, n_destinations: int, seed: int = 0) -> Dict:
+    """
+    A config with `n_origins` people spread around UK cities and
+    `n_destinations` hubs near their centres. The same arguments always
+    give the same config.
+    """
+    rng = np.random.default_rng(seed)
+
+    def locations(prefix: str, n: int, spread_degrees: float) -> List[Dict]:
+        centres = np.array(UK_CITIES)[rng.integers(len(UK_CITIES), size=n)]
+        points = centres + rng.normal(0, spread_degrees, size=(n, 2))
+        return [
+            {"name": f"{prefix} {i}", "lat": round(lat, 4), "lon": round(lon, 4)}
+            for i, (lat, lon) in enumerate(points.tolist())
+        ]
+
+    return {
+        "origins": locations("Person", n_origins, 0.3),
+        "destinations": locations("Hub", n_destinations, 0.05),
+    }
+
+
+def _bench_team(
+    directory: str,
+    n_origins: int,
+    n_destinations: int,
+    latency: float,
+    failure_rate: float,
+    workers: int,
+    seed: int,
+    store: str,
+) -> Dict:
+    name = f"{n_origins}x{n_destinations}"
+    config_file = os.path.join(directory, f"config-{name}.json")
+    routes_file = os.path.join(directory, f"routes-{name}.{store}")
+    with open(config_file, "w") as f:
+        json.dump(synthetic_config(n_origins, n_destinations, seed), f)
+
+    timings = {}
+
+    def timed(step, func):
+        start = time.perf_counter()
+        result = func()
+        timings[step] = time.perf_counter() - start
+        return result
+
+    metrics.reset()
+    client = FakeMapsClient(latency=latency, failure_rate=failure_rate, seed=seed)
+    updater = RouteUpdater("AIzaBenchmark", config_file, routes_file)
+    updater.gmaps = client
+    # update_routes prints a line per route, which would dominate the timing
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        timed(
+            "update_routes",
+            lambda: updater.update_routes(batched=True, workers=workers),
+        )
+    n_routes = len(updater.routes)
+    updater.close()
+    api_metrics = metrics.summary()
+
+    def load_config():
+        with open(config_file, "r") as f:
+            return json.load(f)
+
+    timings["load_config"] = _best_of(load_config, repeat=3, number=1)
+
+    def load_routes():
+        with open_route_store(routes_file) as routes:
+            return RouteIndex.from_routes(routes)
+
+    timings["load_routes"] = _best_of(load_routes, repeat=3, number=1)
+
+    def find_best_destinations():
+        finder = BestDestinationFinder("AIzaBenchmark", config_file, routes_file)
+        try:
+            return finder.find_best_destinations(5)
+        finally:
+            finder.close()
+
+    timed("find_best_destinations", find_best_destinations)
+    output_file = os.path.join(directory, f"location_finder-{name}.html")
+    timed(
+        "build_embedded_html",
+        lambda: build_embedded_html(config_file, routes_file, output_file),
+    )
+    timed(
+        "build_embedded_html_compact",
+        lambda: build_embedded_html(
+            config_file, routes_file, output_file, compact=True, precompute=True
+        ),
+    )
+    return {
+        "origins": n_origins,
+        "destinations": n_destinations,
+        "routes": n_routes,
+        "seconds": timings,
+        "api": {
+            "requests": client.calls,
+            "elements": client.elements,
+            "failures": client.failures,
+        },
+        "metrics": api_metrics,
+    }
+
+
+def bench_suite(
+    sizes: List[Tuple[int, int]] = ((50, 20), (200, 80)),
+    latency: float = 0.0,
+    failure_rate: float = 0.0,
+    workers: int = 8,
+    seed: int = 0,
+    store: str = "json",
+) -> Dict:
+    """
+    Time fetching every route for synthetic teams of each (origins,
+    destinations) size with a fake Maps client, then loading the config
+    and routes, ranking destinations and building the HTML page.
+
+    The fake client spends `latency` seconds on each request and fails a
+    `failure_rate` fraction of them transiently, so retries and backoff are
+    included. Routes are kept in a route store of type `store` ("json" or
+    "db").
+
+    Must be run from the repository root, where index.html is.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        results = [
+            _bench_team(
+                directory,
+                n_origins,
+                n_destinations,
+                latency,
+                failure_rate,
+                workers,
+                seed,
+                store,
+            )
+            for n_origins, n_destinations in sizes
+        ]
+    return {
+        "benchmark": "suite",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "latency": latency,
+        "failure_rate": failure_rate,
+        "workers": workers,
+        "seed": seed,
+        "store": store,
+        "results": results,
+    }
+
+
+def parse_sizes(sizes: str) -> List[Tuple[int, int]]:
+    """
+    Parse "50x20,500x200" into [(50, 20), (500, 200)].
+    """
+    return [
+        tuple(int(n) for n in size.split("x", 1)) for size in sizes.split(",") if size
+    ]
+
+
+CLI_COMMANDS = [
+    "update-locations",
+    "update-routes",
+    "find-locations",
+    "suggest-locations",
+    "build-html",
+    "annotate-destinations",
+    "serve",
+    "batch-rank",
+    "migrate",
+]
+
+
+def cli_imports_googlemaps() -> bool:
+    """
+    Whether `python src/cli.py` imports googlemaps before running a command,
+    checked in a fresh interpreter.
+    """
+    src = os.path.dirname(os.path.abspath(__file__))
+    check_imports = (
+        f"import sys; sys.path.insert(0, {src!r}); import cli;"
+        " print('googlemaps' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check_imports],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip() == "True"
+
+
+def bench_startup(repeat: int = 5) -> Dict:
+    """
+    Time starting the CLI for each subcommand (imports and argument
+    parsing, via --help) in a fresh interpreter, and check which
+    subcommands import googlemaps before doing any work.
+    """
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, *args], capture_output=True, text=True, check=True
+        )
+
+    def best_ms(*args):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(*args)
+            times.append(time.perf_counter() - start)
+        return min(times) * 1000
+
+    return {
+        "benchmark": "startup",
+        "python_ms": best_ms("-c", "pass"),
+        "imports_googlemaps": cli_imports_googlemaps(),
+        "commands_ms": {
+            command: best_ms(cli, command, "--help") for command in CLI_COMMANDS
+        },
+    }
+
+
+def bench_batch_rank(
+    n_origins: int = 1000,
+    n_destinations: int = 200,
+    n_teams: int = 400,
+    seed: int = 0,
+) -> Dict:
+    """
+    Time `batch_rank` for `n_teams` random teams drawn from a synthetic
+    config, with one worker process and with more, up to one per CPU.
+    Travel times are straight-line distances at 60 km/h.
+    """
+    rng = np.random.default_rng(seed)
+    config = synthetic_config(n_origins, n_destinations, seed)
+    origins = [(o["lat"], o["lon"]) for o in config["origins"]]
+    destinations = [(d["lat"], d["lon"]) for d in config["destinations"]]
+    seconds = haversine_km_matrix(np.array(origins), np.array(destinations)) * 60
+    names = [origin["name"] for origin in config["origins"]]
+    hubs = [destination["name"] for destination in config["destinations"]]
+
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = os.path.join(directory, "config.json")
+        routes_file = os.path.join(directory, "routes.db")
+        teams_file = os.path.join(directory, "teams.jsonl")
+        with open(config_file, "w") as f:
+            json.dump(config, f)
+        routes = open_route_store(routes_file)
+        routes.put_many(
+            {
+                f"{coordinate_key(o)}->{coordinate_key(d)}": int(seconds[i, j])
+                for i, o in enumerate(origins)
+                for j, d in enumerate(destinations)
+            }
+        )
+        routes.close()
+        with open(teams_file, "w") as f:
+            for i in range(n_teams):
+                size = int(rng.integers(5, n_origins // 2))
+                team = {
+                    "name": f"Team {i}",
+                    "origins": rng.choice(names, size, replace=False).tolist(),
+                    "destinations": rng.choice(
+                        hubs, n_destinations // 2, replace=False
+                    ).tolist(),
+                }
+                f.write(json.dumps(team) + "\n")
+
+        cpus = os.cpu_count() or 1
+        timings = {}
+        for workers in sorted({1, min(2, cpus), min(4, cpus), cpus}):
+            with open(os.devnull, "w") as devnull:
+                start = time.perf_counter()
+                batch_rank(
+                    config_file, routes_file, teams_file, devnull, workers=workers
+                )
+                timings[workers] = time.perf_counter() - start
+    return {
+        "benchmark": "batch-rank",
+        "origins": n_origins,
+        "destinations": n_destinations,
+        "teams": n_teams,
+        "cpus": cpus,
+        "seconds_by_workers": timings,
+        "speedup": timings[1] / timings[max(timings)],
+    }
+
+
+BENCHMARKS = {
+    "batch-rank": bench_batch_rank,
+    "html-payload": bench_html_payload,
+    "route-lookup": bench_route_lookup,
+    "startup": bench_startup,
+    "suite": bench_suite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run micro-benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    suite = parser.add_argument_group("suite options")
+    suite.add_argument(
+        "--sizes",
+        default="50x20,200x80",
+        help="Comma-separated team sizes as ORIGINSxDESTINATIONS",
+    )
+    suite.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per fake API request"
+    )
+    suite.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of fake API requests that fail transiently",
+    )
+    suite.add_argument(
+        "--workers", type=int, default=8, help="Number of concurrent API requests"
+    )
+    suite.add_argument("--seed", type=int, default=0, help="Seed for synthetic data")
+    suite.add_argument(
+        "--store", choices=["json", "db"], default="json", help="Route store type"
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.benchmark == "suite":
+        result = bench_suite(
+            parse_sizes(args.sizes),
+            latency=args.latency,
+            failure_rate=args.failure_rate,
+            workers=args.workers,
+            seed=args.seed,
+            store=args.store,
+        )
+    else:
+        result = BENCHMARKS[args.benchmark]()
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
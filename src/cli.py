@@ -1,12 +1,33 @@
 import argparse
+import cProfile
+import json
 import os
+import pstats
+import sys
 from dotenv import load_dotenv
 from runner import (
     BestDestinationFinder,
     RouteUpdater,
+    annotate_destinations,
+    best_of_scenarios,
     interpolate_staff_locations,
     build_embedded_html,
+    prune_routes,
 )
+from migrate_to_json import migrate_routes
+from route_store import open_route_store
+from meeting_point import MeetingPointOptimiser
+from metrics import metrics
+
+
+def read_origin_names(origins: str = None, origins_file: str = None):
+    names = []
+    if origins:
+        names.extend(name.strip() for name in origins.split(","))
+    if origins_file:
+        with open(origins_file, "r") as f:
+            names.extend(line.strip() for line in f)
+    return [name for name in names if name]
 
 
 def main():
@@ -14,6 +35,21 @@ def main():
     api_key = os.getenv("GOOGLE_MAPS_API_KEY")
 
     parser = argparse.ArgumentParser(description="Meeting Location Finder")
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="Write API call counts, cache hits, latencies and phase timings here",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the command with cProfile and print the slowest functions",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="PATH",
+        help="With --profile, save the stats here (e.g. for snakeviz) instead",
+    )
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     # Update locations command
@@ -25,6 +61,29 @@ def main():
         default="people.js",
         help="Path to the source json for people locations",
     )
+    update_locations_parser.add_argument(
+        "--config", default="locations_config.json", help="Path to the config file"
+    )
+    update_locations_parser.add_argument(
+        "--routes",
+        default="routes.json",
+        help="Path to the routes file (.json, or .db for SQLite)",
+    )
+    update_locations_parser.add_argument(
+        "--fetch-routes",
+        action="store_true",
+        help="Fetch the missing routes for people who were added or moved",
+    )
+    update_locations_parser.add_argument(
+        "--prune-routes",
+        action="store_true",
+        help="Delete routes from places nobody lives any more",
+    )
+    update_locations_parser.add_argument(
+        "--scenario",
+        action="append",
+        help="Scenario to fetch routes for with --fetch-routes; repeat for several",
+    )
 
     # Update routes subcommand
     update_routes_parser = subparsers.add_parser(
@@ -33,6 +92,78 @@ def main():
     update_routes_parser.add_argument(
         "--config", default="locations_config.json", help="Path to the config file"
     )
+    update_routes_parser.add_argument(
+        "--routes",
+        default="routes.json",
+        help="Path to the route store (routes.json or an SQLite .db)",
+    )
+    update_routes_parser.add_argument(
+        "--batched",
+        action="store_true",
+        help="Fetch missing routes in as few Distance Matrix requests as possible",
+    )
+    update_routes_parser.add_argument(
+        "--workers", type=int, default=1, help="Number of concurrent API requests"
+    )
+    update_routes_parser.add_argument(
+        "--qps",
+        type=float,
+        default=None,
+        help="Maximum API requests per second (default: unlimited)",
+    )
+    update_routes_parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=100,
+        help="Save after this many new routes",
+    )
+    update_routes_parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=60.0,
+        help="Save at least this often, in seconds",
+    )
+    update_routes_parser.add_argument(
+        "--prune-top",
+        type=int,
+        default=None,
+        help="Skip routes to destinations that can't make the top N",
+    )
+    update_routes_parser.add_argument(
+        "--max-age",
+        type=float,
+        default=None,
+        help="Fetch again routes older than this many days"
+        " (default: the scenario's TTL, if any)",
+    )
+    update_routes_parser.add_argument(
+        "--retry-errors",
+        action="store_true",
+        help="Fetch again routes that failed with an error",
+    )
+    update_routes_parser.add_argument(
+        "--budget",
+        type=int,
+        default=None,
+        help="Make at most this many API requests (per scenario); missing"
+        " routes first, then failed and stale ones, oldest first",
+    )
+    update_routes_parser.add_argument(
+        "--scenario",
+        action="append",
+        help="Scenario to fetch routes for: a name from the config's scenarios,"
+        " or mode/slot, e.g. driving/thu-09:00 (repeatable; default: default)",
+    )
+    update_routes_parser.add_argument(
+        "--max-speed",
+        type=float,
+        default=200.0,
+        help="Fastest possible journey speed in km/h, used by --prune-top",
+    )
+    update_routes_parser.add_argument(
+        "--objective",
+        help="Objective --prune-top keeps the top N under (see find-locations)",
+    )
 
     # Find best locations subcommand
     find_parser = subparsers.add_parser(
@@ -41,9 +172,80 @@ def main():
     find_parser.add_argument(
         "--config", default="locations_config.json", help="Path to the config file"
     )
+    find_parser.add_argument(
+        "--routes",
+        default="routes.json",
+        help="Path to the route store (routes.json or an SQLite .db)",
+    )
     find_parser.add_argument(
         "--top", type=int, default=5, help="Number of top locations to display"
     )
+    find_parser.add_argument(
+        "--k",
+        type=int,
+        default=1,
+        help="Choose this many venues together, each person going to their"
+        " quickest (e.g. 2 for a north and a south meeting); the venues"
+        " minimise the total travel time, counting everyone once whatever"
+        " their weight, and can't be combined with --objective",
+    )
+    find_parser.add_argument(
+        "--origins",
+        help="Comma-separated names of the origins to include (default: all)",
+    )
+    find_parser.add_argument(
+        "--origins-file",
+        help="File listing the names of the origins to include, one per line",
+    )
+    find_parser.add_argument(
+        "--estimate-missing",
+        action="store_true",
+        help="Estimate routes we haven't fetched instead of assuming 30 minutes",
+    )
+    find_parser.add_argument(
+        "--scenario",
+        action="append",
+        help="Scenario to rank for (see update-routes); if repeated, rank each"
+        " destination by its best score in any of them",
+    )
+    find_parser.add_argument(
+        "--objective",
+        help="How to score destinations: convenience (the default), mean, max,"
+        " p90, p95, mean_squares, co2, or one defined in the config",
+    )
+
+    # Suggest new meeting points subcommand
+    suggest_parser = subparsers.add_parser(
+        "suggest-locations",
+        help="Search for meeting points beyond the configured destinations",
+    )
+    suggest_parser.add_argument(
+        "--config", default="locations_config.json", help="Path to the config file"
+    )
+    suggest_parser.add_argument(
+        "--routes",
+        default="routes.json",
+        help="Path to the route store (routes.json or an SQLite .db)",
+    )
+    suggest_parser.add_argument(
+        "--top", type=int, default=5, help="Number of suggestions to display"
+    )
+    suggest_parser.add_argument(
+        "--budget",
+        type=int,
+        default=0,
+        help="Maximum API requests to spend checking candidates (default: none)",
+    )
+    suggest_parser.add_argument(
+        "--snap-km",
+        type=float,
+        default=5.0,
+        help="Snap candidates to known hubs within this distance",
+    )
+    suggest_parser.add_argument(
+        "--objective",
+        help="How to score meeting points (see find-locations)",
+    )
 
     # Build embedded HTML subcommand
     build_html_parser = subparsers.add_parser(
@@ -58,45 +260,334 @@ def main():
     build_html_parser.add_argument(
         "--output", default="location_finder.html", help="Path to the output HTML file"
     )
+    build_html_parser.add_argument(
+        "--estimate-missing",
+        action="store_true",
+        help="Embed estimates for routes we haven't fetched",
+    )
+    build_html_parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Embed routes as a packed matrix of minutes rather than JSON",
+    )
+    build_html_parser.add_argument(
+        "--no-compress",
+        action="store_true",
+        help="Don't deflate the packed matrix (for browsers without DecompressionStream)",
+    )
+
+    build_html_parser.add_argument(
+        "--precompute",
+        action="store_true",
+        help="Embed per-destination tables so the page re-ranks incrementally",
+    )
+    build_html_parser.add_argument(
+        "--objective",
+        help="Objective the page ranks by at first (see find-locations)",
+    )
+
+    # Annotate destinations subcommand
+    annotate_parser = subparsers.add_parser(
+        "annotate-destinations",
+        help="Look up and save the address of every destination in the config",
+    )
+    annotate_parser.add_argument(
+        "--config", default="locations_config.json", help="Path to the config file"
+    )
+    annotate_parser.add_argument(
+        "--geocode-cache",
+        default="geocode.db",
+        help="Path to the cache of addresses already looked up",
+    )
+    annotate_parser.add_argument(
+        "--workers", type=int, default=8, help="Number of concurrent API requests"
+    )
+
+    # Serve rankings subcommand
+    serve_parser = subparsers.add_parser(
+        "serve", help="Answer ranking queries over HTTP from data held in memory"
+    )
+    serve_parser.add_argument(
+        "--config", default="locations_config.json", help="Path to the config file"
+    )
+    serve_parser.add_argument(
+        "--routes",
+        default="routes.json",
+        help="Path to the routes file (.json, or .db for SQLite)",
+    )
+    serve_parser.add_argument(
+        "--scenario", help="Scenario to rank for (see locations_config.json)"
+    )
+    serve_parser.add_argument(
+        "--estimate-missing",
+        action="store_true",
+        help="Estimate routes we haven't fetched rather than assuming 30 minutes",
+    )
+    serve_parser.add_argument(
+        "--objective",
+        help="How to score destinations unless a query says otherwise (see"
+        " find-locations)",
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    serve_parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    serve_parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=2.0,
+        help="Seconds between checks for changes to the config and routes",
+    )
+
+    # Batch rank subcommand
+    batch_parser = subparsers.add_parser(
+        "batch-rank", help="Rank destinations for many teams at once"
+    )
+    batch_parser.add_argument(
+        "--teams",
+        required=True,
+        help="Directory of team configs (.json), or a JSONL file of them",
+    )
+    batch_parser.add_argument(
+        "--config", default="locations_config.json", help="Path to the config file"
+    )
+    batch_parser.add_argument(
+        "--routes",
+        default="routes.json",
+        help="Path to the routes file (.json, or .db for SQLite)",
+    )
+    batch_parser.add_argument(
+        "--output",
+        default="-",
+        help="Path to write a JSON line per team to (default: standard output)",
+    )
+    batch_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes (default: one per CPU)",
+    )
+    batch_parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help='Number of top locations per team, unless a team sets "top"',
+    )
+    batch_parser.add_argument(
+        "--objective",
+        help="Objective to rank by, unless a team sets one (see find-locations)",
+    )
+    batch_parser.add_argument(
+        "--scenario", help="Scenario to rank for (see locations_config.json)"
+    )
+    batch_parser.add_argument(
+        "--estimate-missing",
+        action="store_true",
+        help="Estimate routes we haven't fetched rather than assuming 30 minutes",
+    )
+
+    # Migrate routes subcommand
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Copy routes from one route store into another"
+    )
+    migrate_parser.add_argument(
+        "--source", default="routes.json", help="Path to the route store to read"
+    )
+    migrate_parser.add_argument(
+        "--dest", default="routes.db", help="Path to the route store to write"
+    )
 
     args = parser.parse_args()
 
-    if not api_key:
+    # Other commands only read cached routes, and only need a key for
+    # lookups they can't answer from a cache
+    needs_api = (
+        args.command in ("update-routes", "annotate-destinations")
+        or (args.command == "update-locations" and args.fetch_routes)
+        or (args.command == "suggest-locations" and args.budget > 0)
+    )
+    if not api_key and needs_api:
         print("Error: GOOGLE_MAPS_API_KEY environment variable is not set.")
         return
 
-    if (
-        args.command != "build-html"
-        and args.command != "update-locations"
-        and not os.path.exists(args.config)
-    ):
+    if args.command in (
+        "update-routes",
+        "find-locations",
+        "suggest-locations",
+        "annotate-destinations",
+        "serve",
+        "batch-rank",
+    ) and not os.path.exists(args.config):
         print(f"Error: Config file not found: {args.config}")
         print("Please make sure the config file exists and the path is correct.")
         return
 
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
     try:
         if args.command == "update-locations":
-            interpolate_staff_locations(args.source_file)
+            changes = interpolate_staff_locations(args.source_file, args.config)
+            for change in ("added", "moved", "removed"):
+                names = [
+                    (origin[1] if change == "moved" else origin)["name"]
+                    for origin in changes[change]
+                ]
+                print(f"{change.capitalize()}: {len(names)}")
+                for name in names:
+                    print(f"  {name}")
+            changed = changes["added"] + [new for _, new in changes["moved"]]
+            if args.fetch_routes and changed:
+                for scenario in args.scenario or [None]:
+                    updater = RouteUpdater(api_key, args.config, args.routes, scenario)
+                    missing = updater.missing_routes(origins=changed)
+                    print(f"Fetching {len(missing)} routes for {updater.scenario.name}")
+                    updater.fetch_routes(missing, batched=True)
+                    updater.close()
+            if args.prune_routes:
+                with open(args.config, "r") as f:
+                    origins = json.load(f)["origins"]
+                routes = open_route_store(args.routes)
+                print(f"Pruned {prune_routes(routes, origins)} routes")
+                routes.close()
         elif args.command == "update-routes":
-            updater = RouteUpdater(api_key, args.config)
-            updater.update_routes()
-            updater.close()
+            for scenario in args.scenario or [None]:
+                updater = RouteUpdater(api_key, args.config, args.routes, scenario)
+                if args.scenario:
+                    print(f"Scenario: {updater.scenario.name}")
+                updater.update_routes(
+                    batched=args.batched,
+                    workers=args.workers,
+                    qps=args.qps,
+                    checkpoint_every=args.checkpoint_every,
+                    checkpoint_interval=args.checkpoint_interval,
+                    prune_top=args.prune_top,
+                    max_speed_kmh=args.max_speed,
+                    objective=args.objective,
+                    max_age_days=args.max_age,
+                    retry_errors=args.retry_errors,
+                    budget=args.budget,
+                )
+                updater.close()
         elif args.command == "find-locations":
-            finder = BestDestinationFinder(api_key, args.config)
-            all_destinations = finder.find_best_destinations(
-                len(finder.config["destinations"])
-            )
-            top_destinations = all_destinations[: args.top]
+            finders = [
+                BestDestinationFinder(
+                    api_key,
+                    args.config,
+                    args.routes,
+                    estimate_missing=args.estimate_missing,
+                    scenario=scenario,
+                    objective=args.objective,
+                )
+                for scenario in args.scenario or [None]
+            ]
+            origin_names = read_origin_names(args.origins, args.origins_file)
+            finder = finders[0]
+            origins = None
+            rows = slice(None)
+            if origin_names:
+                rows = sorted(finder.origin_ids(origin_names))
+                origins = [finder.config["origins"][i] for i in rows]
+
+            if finder.objective.name == "convenience":
+                score_label = "Convenience score"
+            else:
+                score_label = f"Score ({finder.objective.name})"
+
+            if args.k > 1:
+                if len(finders) > 1:
+                    raise ValueError("--k can only be used with a single --scenario")
+                if args.objective:
+                    raise ValueError("--k can't be used with --objective")
+                venues, groups, optimal = finder.find_best_venue_set(
+                    args.k, origin_names
+                )
+                print(
+                    f"Best {len(venues)} Venues, Each Person Going to Their Quickest:"
+                )
+                if not optimal:
+                    print("(the best found, but not proven the best possible)")
+                for i, (location, group) in enumerate(zip(venues, groups), 1):
+                    print(f"{i}. {location['name']}")
+                    if "address" in location:
+                        print(f"   Address: {location['address']}")
+                    names = ", ".join(origin["name"] for origin in group)
+                    print(f"   People ({len(group)}): {names}")
+                    if group:
+                        travel_times = finder.calculate_travel_times(
+                            finder.get_coordinates(group),
+                            (location["lat"], location["lon"]),
+                        )
+                        score = finder.calculate_convenience_score(travel_times, group)
+                        print(
+                            f"   {score_label}: {finder.objective.format_score(score)}"
+                        )
+                        finder.plot_travel_times_histogram(location, group)
+                    print()
+                finder.close()
+                return
+
+            if len(finders) > 1:
+                ranking = best_of_scenarios(finders, args.top, origin_names)
+            else:
+                if origin_names:
+                    top_destinations = finder.rank_for(origin_names, args.top)
+                else:
+                    top_destinations = finder.find_best_destinations(args.top)
+                ranking = [
+                    (location, score, finder.scenario)
+                    for location, score in top_destinations
+                ]
+            finder_for = {finder.scenario.name: finder for finder in finders}
+            if args.estimate_missing:
+                matrices = {
+                    finder.scenario.name: finder.travel_time_matrix()
+                    for finder in finders
+                }
 
             print(f"Top {args.top} Best Destinations:")
-            for i, (location, score) in enumerate(top_destinations, 1):
+            for i, (location, score, scenario) in enumerate(ranking, 1):
+                finder = finder_for[scenario.name]
                 print(f"{i}. {location['name']}")
-                print(f"   Convenience score: {int(score)}")
-                finder.plot_travel_times_histogram(location)
+                print(f"   {score_label}: {finder.objective.format_score(score)}")
+                if "address" in location:
+                    print(f"   Address: {location['address']}")
+                if len(finders) > 1:
+                    print(f"   Best scenario: {scenario.name}")
+                if args.estimate_missing:
+                    matrix = matrices[scenario.name]
+                    column = finder.config["destinations"].index(location)
+                    estimated = matrix.missing[rows, column].sum()
+                    uncertain = matrix.low_confidence[rows, column].sum()
+                    if estimated:
+                        print(
+                            f"   Estimated travel times: {estimated} ({uncertain} low confidence)"
+                        )
+                finder.plot_travel_times_histogram(location, origins)
                 print()
 
-            finder.plot_destinations(all_destinations)
-            finder.close()
+            for finder in finders:
+                finder.close()
+        elif args.command == "suggest-locations":
+            updater = RouteUpdater(api_key, args.config, args.routes)
+            optimiser = MeetingPointOptimiser(
+                updater,
+                budget=args.budget,
+                snap_km=args.snap_km,
+                objective=args.objective,
+            )
+            suggestions = optimiser.suggest(args.top)
+            objective = optimiser.objective
+            if objective.name == "convenience":
+                score_label = "Convenience score"
+            else:
+                score_label = f"Score ({objective.name})"
+
+            print(f"Top {args.top} Suggested Meeting Points:")
+            for i, suggestion in enumerate(suggestions, 1):
+                print(f"{i}. {suggestion['name']}")
+                print(f"   Location: {suggestion['lat']}, {suggestion['lon']}")
+                score = objective.format_score(suggestion["score"])
+                print(f"   {score_label}: {score} ({suggestion['source']})")
+            print(f"API requests used: {optimiser.requests_used}")
+            updater.close()
         elif args.command == "build-html":
             if not os.path.exists(args.config):
                 print(f"Warning: Config file not found: {args.config}")
@@ -104,13 +595,85 @@ def main():
             if not os.path.exists(args.routes):
                 print(f"Warning: Routes file not found: {args.routes}")
                 print("Using default routes if available.")
-            build_embedded_html(args.config, args.routes, args.output)
+            build_embedded_html(
+                args.config,
+                args.routes,
+                args.output,
+                estimate_missing=args.estimate_missing,
+                compact=args.compact,
+                compress=not args.no_compress,
+                precompute=args.precompute,
+                objective=args.objective,
+            )
             print(f"Self-contained HTML file created: {args.output}")
+        elif args.command == "annotate-destinations":
+            destinations = annotate_destinations(
+                api_key, args.config, args.geocode_cache, workers=args.workers
+            )
+            for destination in destinations:
+                address = destination.get("address", "Address not found")
+                print(f"{destination['name']}: {address}")
+            print(f"Saved {len(destinations)} addresses to {args.config}")
+        elif args.command == "serve":
+            from server import RankingService, make_server
+
+            service = RankingService(
+                args.config,
+                args.routes,
+                args.scenario,
+                args.estimate_missing,
+                args.objective,
+            )
+            service.watch(args.reload_interval)
+            server = make_server(service, args.host, args.port)
+            print(f"Serving rankings on http://{args.host}:{server.server_port}/rank")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+        elif args.command == "batch-rank":
+            from batch import batch_rank
+
+            options = dict(
+                workers=args.workers,
+                scenario=args.scenario,
+                objective=args.objective,
+                top_n=args.top,
+                estimate_missing=args.estimate_missing,
+            )
+            if args.output == "-":
+                batch_rank(args.config, args.routes, args.teams, sys.stdout, **options)
+            else:
+                with open(args.output, "w") as f:
+                    counts = batch_rank(
+                        args.config, args.routes, args.teams, f, **options
+                    )
+                print(
+                    f"Ranked {counts['ranked']} teams ({counts['failed']} failed):"
+                    f" {args.output}"
+                )
+        elif args.command == "migrate":
+            count = migrate_routes(args.source, args.dest)
+            print(f"Copied {count} routes from {args.source} to {args.dest}")
         else:
             parser.print_help()
     except FileNotFoundError as e:
         print(f"Error: {str(e)}")
         print("Please make sure the required files exist and the paths are correct.")
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+    finally:
+        if profiler:
+            profiler.disable()
+            if args.profile_output:
+                profiler.dump_stats(args.profile_output)
+            else:
+                stats = pstats.Stats(profiler, stream=sys.stderr)
+                stats.sort_stats("cumulative").print_stats(30)
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from route_store import DEFAULT_MODE, DEFAULT_SLOT, format_route_key, scenario_suffix
+
+
+def coordinate_key(point: Tuple[float, float]) -> str:
+    """
+    The string used for a point in route keys, e.g. "51.75,-1.26".
+    """
+    return f"{point[0]:.2f},{point[1]:.2f}"
+
+
+def parse_coordinate_key(key: str) -> Tuple[float, float]:
+    lat, lon = key.split(",")
+    return float(lat), float(lon)
+
+
+class CoordinateIndex:
+    """
+    Assigns a stable integer id to each distinct coordinate key.
+
+    Points are rounded to two decimal places, as in route keys, so every
+    point that would share a route key shares an id.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.keys: List[str] = []
+        self._point_ids: Dict[Tuple[float, float], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def key_id(self, key: str) -> int:
+        """
+        The id for a coordinate key, assigning a new one if necessary.
+        """
+        id_ = self.ids.get(key)
+        if id_ is None:
+            id_ = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return id_
+
+    def point_id(self, point: Tuple[float, float]) -> int:
+        """
+        The id for a (lat, lon) point, assigning a new one if necessary.
+        """
+        id_ = self._point_ids.get(point)
+        if id_ is None:
+            id_ = self._point_ids[point] = self.key_id(coordinate_key(point))
+        return id_
+
+    def point_ids(self, points: List[Tuple[float, float]]) -> List[int]:
+        return [self.point_id(point) for point in points]
+
+    def key(self, id_: int) -> str:
+        return self.keys[id_]
+
+
+class RouteIndex:
+    """
+    Travel times keyed by (origin id, destination id) rather than by
+    "origin->destination" strings, so hot loops look routes up without
+    formatting any strings.
+
+    An index holds the routes of one scenario (travel mode and time slot).
+    Translation to and from string route keys only happens in
+    `from_routes` and `route_key`.
+    """
+
+    def __init__(
+        self,
+        coordinates: Optional[CoordinateIndex] = None,
+        mode: str = DEFAULT_MODE,
+        slot: str = DEFAULT_SLOT,
+    ):
+        self.coordinates = coordinates or CoordinateIndex()
+        self.mode = mode
+        self.slot = slot
+        self.times: Dict[Tuple[int, int], float] = {}
+
+    @classmethod
+    def from_routes(
+        cls,
+        routes: Mapping[str, float],
+        mode: str = DEFAULT_MODE,
+        slot: str = DEFAULT_SLOT,
+    ) -> "RouteIndex":
+        index = cls(mode=mode, slot=slot)
+        key_id = index.coordinates.key_id
+        scenario = scenario_suffix(mode, slot)
+        for route_key, duration in routes.items():
+            route, _, route_scenario = route_key.partition("@")
+            if route_scenario != scenario:
+                continue
+            origin, destination = route.split("->")
+            index.times[(key_id(origin), key_id(destination))] = duration
+        return index
+
+    def route_key(self, origin_id: int, destination_id: int) -> str:
+        return format_route_key(
+            self.coordinates.key(origin_id),
+            self.coordinates.key(destination_id),
+            self.mode,
+            self.slot,
+        )
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __contains__(self, ids: Tuple[int, int]) -> bool:
+        return ids in self.times
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return iter(self.times)
+
+    def get(self, ids: Tuple[int, int], default: Optional[float] = None):
+        return self.times.get(ids, default)
+
+    def set(self, ids: Tuple[int, int], duration: float):
+        self.times[ids] = duration
+
+    def lookup_matrix(
+        self, origin_ids: List[int], destination_ids: List[int]
+    ) -> np.ndarray:
+        """
+        A float32 origins x destinations matrix of travel times, with NaN
+        wherever there's no route.
+        """
+        get = self.times.get
+        nan = float("nan")
+        return np.fromiter(
+            (get((o, d), nan) for o in origin_ids for d in destination_ids),
+            dtype=np.float32,
+            count=len(origin_ids) * len(destination_ids),
+        ).reshape(len(origin_ids), len(destination_ids))
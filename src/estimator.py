@@ -0,0 +1,141 @@
+from typing import Tuple
+
+import numpy as np
+
+from coordinates import RouteIndex, parse_coordinate_key
+from geo import haversine_km_array, haversine_km_matrix
+
+
+def known_routes(index: RouteIndex) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The (lat, lon) origins and destinations, and travel times, of every
+    route in `index` that has a transit connection.
+    """
+    pairs = []
+    durations = []
+    for (origin_id, dest_id), duration in index.times.items():
+        if np.isfinite(duration) and duration > 0:
+            pairs.append((origin_id, dest_id))
+            durations.append(duration)
+    if not pairs:
+        return np.empty((0, 2)), np.empty((0, 2)), np.empty(0)
+
+    points = np.array([parse_coordinate_key(key) for key in index.coordinates.keys])
+    pairs = np.array(pairs)
+    return points[pairs[:, 0]], points[pairs[:, 1]], np.array(durations, dtype=float)
+
+
+def pair_distances(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in kilometres between matching rows of two
+    (n, 2) arrays of (lat, lon) points.
+    """
+    return haversine_km_array(
+        origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1]
+    )
+
+
+class DistanceModel:
+    """
+    Estimates travel time as a linear function of great-circle distance,
+    fitted by least squares to the routes we've already fetched.
+    """
+
+    def __init__(self, intercept: float = 600.0, seconds_per_km: float = 60.0):
+        self.intercept = intercept
+        self.seconds_per_km = seconds_per_km
+
+    @classmethod
+    def fit(cls, index: RouteIndex) -> "DistanceModel":
+        origins, destinations, durations = known_routes(index)
+        if len(durations) < 2:
+            return cls()
+        distances = pair_distances(origins, destinations)
+        if np.ptp(distances) == 0:
+            return cls()
+        seconds_per_km, intercept = np.polyfit(distances, durations, 1)
+        return cls(intercept, seconds_per_km)
+
+    def predict(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """
+        Estimated travel times from each origin to each destination.
+        """
+        distances = haversine_km_matrix(origins, destinations)
+        return self.intercept + self.seconds_per_km * distances
+
+
+class TravelTimeEstimator:
+    """
+    Estimates travel times for routes we haven't fetched, from the ones we
+    have.
+
+    A `DistanceModel` gives a baseline for any pair. That is corrected by
+    the average error of the baseline on the `neighbours` most similar
+    known routes (those whose origin and destination are both nearby),
+    weighted by how similar they are. This picks up local effects, like
+    a town with a fast rail link, that distance alone misses.
+
+    An estimate is flagged as confident when its neighbours are, on average,
+    within `confident_km` (origin and destination distances combined).
+    """
+
+    CHUNK_SIZE = 512  # pairs estimated at once, to bound memory use
+
+    def __init__(
+        self, index: RouteIndex, neighbours: int = 8, confident_km: float = 30.0
+    ):
+        self.model = DistanceModel.fit(index)
+        self.neighbours = neighbours
+        self.confident_km = confident_km
+        self.origins, self.destinations, durations = known_routes(index)
+        baseline = self.model.intercept + self.model.seconds_per_km * pair_distances(
+            self.origins, self.destinations
+        )
+        self.residuals = durations - baseline
+
+    def estimate(
+        self, origins: np.ndarray, destinations: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Estimated travel times between matching rows of two (n, 2) arrays of
+        (lat, lon) points, and whether each estimate is confident.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        estimates = self.model.intercept + self.model.seconds_per_km * pair_distances(
+            origins, destinations
+        )
+        confident = np.zeros(len(origins), dtype=bool)
+        k = min(self.neighbours, len(self.residuals))
+        if k == 0:
+            return np.maximum(estimates, 0), confident
+
+        for start in range(0, len(origins), self.CHUNK_SIZE):
+            chunk = slice(start, start + self.CHUNK_SIZE)
+            similarity = haversine_km_matrix(
+                origins[chunk], self.origins
+            ) + haversine_km_matrix(destinations[chunk], self.destinations)
+            nearest = np.argpartition(similarity, k - 1, axis=1)[:, :k]
+            distances = np.take_along_axis(similarity, nearest, axis=1)
+            weights = 1 / (distances + 1.0)
+            correction = (self.residuals[nearest] * weights).sum(axis=1) / weights.sum(
+                axis=1
+            )
+            estimates[chunk] += correction
+            confident[chunk] = distances.mean(axis=1) <= self.confident_km
+        return np.maximum(estimates, 0), confident
+
+    def predict(
+        self, origins: np.ndarray, destinations: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Like `estimate`, for every origin x destination combination.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        estimates, confident = self.estimate(
+            np.repeat(origins, len(destinations), axis=0),
+            np.tile(destinations, (len(origins), 1)),
+        )
+        shape = (len(origins), len(destinations))
+        return estimates.reshape(shape), confident.reshape(shape)
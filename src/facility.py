@@ -0,0 +1,168 @@
+"""
+Choosing several venues at once, e.g. one meeting in the north and one in
+the south, with everyone going to whichever venue is quickest for them.
+
+This is the k-median problem: pick k destinations (columns) of an origins x
+destinations travel time matrix minimising the total, over origins, of
+each origin's fastest time to any chosen destination. Trying every
+combination is out of the question beyond a handful of venues, so we
+build a set greedily, improve it by swapping venues in and out, and then,
+within a budget, search for a better set by branch and bound, which proves
+the result optimal for small problems.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+# Stands in for routes with no transit connection, so that every set of
+# venues has a finite cost and sets that leave someone stranded lose
+UNREACHABLE_SECONDS = 10**7
+
+
+def _finite(times: np.ndarray) -> np.ndarray:
+    times = np.asarray(times, dtype=np.float64)
+    return np.where(np.isfinite(times), times, UNREACHABLE_SECONDS)
+
+
+def k_median_cost(times: np.ndarray, venues: List[int]) -> float:
+    """
+    The total of each origin's fastest time to any of `venues`.
+    """
+    return float(_finite(times)[:, venues].min(axis=1).sum())
+
+
+def greedy_k_median(times: np.ndarray, k: int) -> List[int]:
+    """
+    Add venues one at a time, each time the one that most reduces the
+    total travel time.
+    """
+    times = _finite(times)
+    venues = []
+    best = np.full(times.shape[0], np.inf)
+    for _ in range(min(k, times.shape[1])):
+        totals = np.minimum(best[:, None], times).sum(axis=0)
+        totals[venues] = np.inf
+        venue = int(np.argmin(totals))
+        venues.append(venue)
+        best = np.minimum(best, times[:, venue])
+    return venues
+
+
+def _nearest_two(times: np.ndarray, venues: List[int]) -> Tuple[np.ndarray, ...]:
+    """
+    For each origin, the position in `venues` of its nearest venue, the
+    time to it, and the time to its second nearest (inf if there's only
+    one venue).
+    """
+    chosen = times[:, venues]
+    order = np.argsort(chosen, axis=1, kind="stable")
+    rows = np.arange(len(chosen))
+    nearest = order[:, 0]
+    if len(venues) > 1:
+        second = chosen[rows, order[:, 1]]
+    else:
+        second = np.full(len(chosen), np.inf)
+    return nearest, chosen[rows, nearest], second
+
+
+def swap_local_search(
+    times: np.ndarray, venues: List[int], max_rounds: int = 100
+) -> List[int]:
+    """
+    Improve a set of venues by repeatedly making the single swap of a
+    chosen venue for an unchosen one that most reduces the total travel
+    time, until no swap helps.
+
+    Each round considers every possible swap, but without recomputing each
+    origin's best time from scratch: removing a venue only affects the
+    origins for which it was nearest, who fall back to their second
+    nearest.
+    """
+    times = _finite(times)
+    venues = list(venues)
+    for _ in range(max_rounds):
+        nearest, first, second = _nearest_two(times, venues)
+        current = first.sum()
+        best_total, best_swap = current, None
+        for position in range(len(venues)):
+            without = np.where(nearest == position, second, first)
+            totals = np.minimum(without[:, None], times).sum(axis=0)
+            totals[venues] = np.inf
+            candidate = int(np.argmin(totals))
+            # Only take swaps that help by more than rounding error
+            if totals[candidate] < best_total - 1e-9 * max(1.0, current):
+                best_total, best_swap = totals[candidate], (position, candidate)
+        if best_swap is None:
+            break
+        position, candidate = best_swap
+        venues[position] = candidate
+    return venues
+
+
+def branch_and_bound_k_median(
+    times: np.ndarray, k: int, venues: List[int], max_nodes: int = 20000
+) -> Tuple[List[int], bool]:
+    """
+    Search for a set of `k` venues with a lower total travel time than
+    `venues`. Returns the best set found, and whether it's proven optimal
+    (the search finished within `max_nodes` partial sets).
+
+    Venues are added in order of their total travel time, best first. A
+    partial set is abandoned once even its best case, in which every
+    origin gets its fastest time to a chosen venue or any venue that could
+    still be added, is no better than the best set so far.
+    """
+    times = _finite(times)
+    n_origins, n_destinations = times.shape
+    k = min(k, n_destinations)
+    order = np.argsort(times.sum(axis=0), kind="stable")
+    ordered = times[:, order]
+    # Each origin's fastest time to any venue from column j on
+    fastest_from = np.minimum.accumulate(ordered[:, ::-1], axis=1)[:, ::-1]
+
+    best_venues = list(venues)
+    best_total = k_median_cost(times, venues)
+    tolerance = 1e-9 * max(1.0, best_total)
+    nodes = 0
+    # (bound, next column, columns chosen, each origin's best time so far)
+    stack = [(0.0, 0, [], np.full(n_origins, np.inf))]
+    while stack:
+        bound, start, chosen, best = stack.pop()
+        if bound >= best_total - tolerance:
+            continue
+        if len(chosen) == k:
+            best_total, best_venues = bound, [int(order[j]) for j in chosen]
+            continue
+        remaining = k - len(chosen) - 1  # After adding the next venue
+        children = []
+        for j in range(start, n_destinations - remaining):
+            nodes += 1
+            if nodes > max_nodes:
+                return best_venues, False
+            with_j = np.minimum(best, ordered[:, j])
+            if remaining:
+                child_bound = np.minimum(with_j, fastest_from[:, j + 1]).sum()
+            else:
+                child_bound = with_j.sum()
+            if child_bound < best_total - tolerance:
+                children.append((child_bound, j + 1, chosen + [j], with_j))
+        # Explore the most promising child first
+        stack.extend(sorted(children, key=lambda child: -child[0]))
+    return best_venues, True
+
+
+def solve_k_median(
+    times: np.ndarray, k: int, max_nodes: int = 20000
+) -> Tuple[List[int], np.ndarray, bool]:
+    """
+    A good set of `k` venues (destination indices), the position in it of
+    the venue each origin is assigned to (its fastest), and whether the set
+    is proven optimal. See `branch_and_bound_k_median` for `max_nodes`.
+    """
+    if k < 1:
+        raise ValueError(f"Need at least one venue, got {k}")
+    venues = swap_local_search(times, greedy_k_median(times, k))
+    venues, optimal = branch_and_bound_k_median(times, k, venues, max_nodes)
+    assignment = np.argmin(_finite(times)[:, venues], axis=1)
+    return venues, assignment, optimal
@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+from typing import List, Tuple, Union
+
+from googlemaps.exceptions import ApiError
+
+from geo import haversine_km
+
+LatLng = Tuple[float, float]
+
+
+class FakeMapsClient:
+    """
+    A stand-in for `googlemaps.Client` that answers Distance Matrix requests
+    locally and deterministically, so route fetching can be exercised without
+    an API key. `latency` seconds are spent on every request, to make the
+    effect of concurrency on wall-clock time measurable.
+
+    A `failure_rate` fraction of requests fail with a transient
+    UNKNOWN_ERROR. Which ones fail depends only on `seed`, the request and
+    how many times it has been made, not on the order requests arrive in
+    from worker threads, so runs are reproducible.
+
+    Travel times are derived from the great-circle distance between each
+    origin and destination. Every request is recorded, so tests can assert on
+    the number of calls and elements (which is what Google bills for).
+    """
+
+    def __init__(
+        self,
+        speed_kmh: float = 60.0,
+        overhead_seconds: int = 600,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.speed_kmh = speed_kmh
+        self.overhead_seconds = overhead_seconds
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.elements = 0
+        self.failures = 0
+        self.requests = []
+        self.attempts = {}
+
+    def travel_time(self, origin: LatLng, destination: LatLng) -> int:
+        distance = haversine_km(origin, destination)
+        return int(self.overhead_seconds + distance / self.speed_kmh * 3600)
+
+    def distance_matrix(
+        self,
+        origins: Union[List[LatLng], LatLng],
+        destinations: Union[List[LatLng], LatLng],
+        **kwargs,
+    ):
+        origins = _as_list(origins)
+        destinations = _as_list(destinations)
+        with self.lock:
+            self.calls += 1
+            self.elements += len(origins) * len(destinations)
+            self.requests.append((origins, destinations, kwargs))
+            request = (tuple(origins), tuple(destinations))
+            attempt = self.attempts.get(request, 0)
+            self.attempts[request] = attempt + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate:
+            draw = random.Random(f"{self.seed}:{request}:{attempt}").random()
+            if draw < self.failure_rate:
+                with self.lock:
+                    self.failures += 1
+                raise ApiError("UNKNOWN_ERROR")
+        return {
+            "status": "OK",
+            "rows": [
+                {
+                    "elements": [
+                        {
+                            "status": "OK",
+                            "duration": {"value": self.travel_time(o, d)},
+                        }
+                        for d in destinations
+                    ]
+                }
+                for o in origins
+            ],
+        }
+
+
+def _as_list(locations) -> List[LatLng]:
+    # The real client accepts either a single location or a list of them
+    if isinstance(locations, tuple) and not isinstance(locations[0], (list, tuple)):
+        return [locations]
+    return [tuple(location) for location in locations]
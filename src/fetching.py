@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# API statuses worth retrying: the request itself was fine, Google just
+# couldn't (or wouldn't) answer it right now
+RETRYABLE_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+# API statuses meaning no further request will succeed until the quota resets
+QUOTA_STATUSES = {"OVER_DAILY_LIMIT", "OVER_QUERY_LIMIT"}
+
+
+class TokenBucket:
+    """
+    A thread-safe token-bucket rate limiter.
+
+    Tokens are added at `rate` per second up to `capacity`; each call to
+    `acquire` takes one token, blocking until one is available.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                # Allow for rounding error so a whole token is never missed
+                if self.tokens >= 1 - 1e-9:
+                    self.tokens = max(0.0, self.tokens - 1)
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    # Imported here so importing this module doesn't import googlemaps
+    from googlemaps.exceptions import ApiError, HTTPError, Timeout, TransportError
+
+    if isinstance(error, HTTPError):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(error, (TransportError, Timeout)):
+        return True
+    if isinstance(error, ApiError):
+        return error.status in RETRYABLE_STATUSES
+    return False
+
+
+def is_quota_exhausted(error: Exception) -> bool:
+    from googlemaps.exceptions import ApiError
+
+    return isinstance(error, ApiError) and error.status in QUOTA_STATUSES
+
+
+def call_with_backoff(
+    func: Callable,
+    *args,
+    retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    sleep: Optional[Callable[[float], None]] = None,
+):
+    """
+    Call `func(*args)`, retrying with exponential backoff (plus jitter) when
+    it raises a transient error. Non-transient errors, and the last transient
+    one once `retries` is exhausted, are re-raised.
+    """
+    sleep = sleep or time.sleep
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2**attempt)
+            sleep(delay + random.uniform(0, delay / 10))
+            attempt += 1
+
+
+def fetch_all(
+    func: Callable,
+    jobs: List[Tuple],
+    workers: int = 1,
+    rate_limiter: Optional[TokenBucket] = None,
+    retries: int = 5,
+    base_delay: float = 1.0,
+) -> Iterator[Tuple[Tuple, object, Optional[Exception]]]:
+    """
+    Run `func(*job)` for every job, using up to `workers` threads.
+
+    Yields `(job, result, error)` in the same order as `jobs`, whatever order
+    the requests actually complete in, so callers merge results
+    deterministically. Exactly one of `result` and `error` is set.
+    """
+
+    def run(job):
+        def attempt():
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            return func(*job)
+
+        try:
+            return (
+                call_with_backoff(attempt, retries=retries, base_delay=base_delay),
+                None,
+            )
+        except Exception as e:
+            return None, e
+
+    if workers <= 1:
+        for job in jobs:
+            result, error = run(job)
+            yield job, result, error
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, job) for job in jobs]
+        try:
+            for job, future in zip(jobs, futures):
+                result, error = future.result()
+                yield job, result, error
+        finally:
+            # Don't keep spending quota if the caller stops early
+            for future in futures:
+                future.cancel()
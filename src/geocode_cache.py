@@ -0,0 +1,79 @@
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+
+class GeocodeCache:
+    """
+    Addresses keyed by coordinate key (see `coordinate_key`), so reverse
+    geocoding a point costs one API request ever, not one per report.
+
+    Addresses are kept in an SQLite table on disk, with a least recently
+    used cache of up to `maxsize` of them in memory in front of it, so
+    repeated lookups don't touch the database either. Writes are committed
+    on save.
+    """
+
+    BATCH_SIZE = 500  # keys per query, well within SQLite's variable limit
+
+    def __init__(self, path: str = "geocode.db", maxsize: int = 1024):
+        self.path = path
+        self.maxsize = maxsize
+        self.recent: "OrderedDict[str, str]" = OrderedDict()
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS addresses (
+                key TEXT PRIMARY KEY,
+                address TEXT NOT NULL,
+                fetched_at REAL
+            )
+            """)
+
+    def _remember(self, key: str, address: str):
+        self.recent[key] = address
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.maxsize:
+            self.recent.popitem(last=False)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """
+        Look up several addresses at once, omitting any that aren't cached.
+        """
+        found = {}
+        wanted = []
+        for key in dict.fromkeys(keys):
+            if key in self.recent:
+                self.recent.move_to_end(key)
+                found[key] = self.recent[key]
+            else:
+                wanted.append(key)
+        for i in range(0, len(wanted), self.BATCH_SIZE):
+            batch = wanted[i : i + self.BATCH_SIZE]
+            placeholders = ", ".join(["?"] * len(batch))
+            rows = self.connection.execute(
+                f"SELECT key, address FROM addresses WHERE key IN ({placeholders})",
+                batch,
+            )
+            for key, address in rows:
+                found[key] = address
+                self._remember(key, address)
+        return found
+
+    def put_many(self, addresses: Dict[str, str]):
+        fetched_at = time.time()
+        self.connection.executemany(
+            "INSERT INTO addresses (key, address, fetched_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET"
+            " address = excluded.address, fetched_at = excluded.fetched_at",
+            [(key, address, fetched_at) for key, address in addresses.items()],
+        )
+        for key, address in addresses.items():
+            self._remember(key, address)
+
+    def save(self):
+        self.connection.commit()
+
+    def close(self):
+        self.save()
+        self.connection.close()
@@ -0,0 +1,240 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from coordinates import parse_coordinate_key
+from estimator import DistanceModel, TravelTimeEstimator
+from geo import haversine_km_matrix
+from objectives import evaluate_objectives, origin_weights, resolve_objective
+from scoring import TravelTimeMatrix
+
+KM_PER_DEGREE = 111.2
+
+
+def geometric_median(
+    points: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    iterations: int = 200,
+    tolerance_km: float = 0.01,
+) -> np.ndarray:
+    """
+    The (lat, lon) point minimising the (weighted) sum of distances to
+    `points`, found with Weiszfeld's algorithm starting from the weighted
+    centroid.
+
+    Distances are measured in a flat projection centred on the points,
+    which is accurate enough at the scale of Great Britain.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    weights = np.ones(len(points)) if weights is None else np.asarray(weights)
+    scale = np.array(
+        [KM_PER_DEGREE, KM_PER_DEGREE * np.cos(np.radians(points[:, 0].mean()))]
+    )
+    xy = points * scale
+
+    estimate = np.average(xy, axis=0, weights=weights)
+    for _ in range(iterations):
+        # Clamp distances so an estimate landing on a point can't divide by 0
+        distances = np.maximum(np.linalg.norm(xy - estimate, axis=1), 1e-9)
+        pull = weights / distances
+        new_estimate = (xy * pull[:, None]).sum(axis=0) / pull.sum()
+        converged = np.linalg.norm(new_estimate - estimate) < tolerance_km
+        estimate = new_estimate
+        if converged:
+            break
+    return estimate / scale
+
+
+class MeetingPointOptimiser:
+    """
+    Searches for good meeting points anywhere, not just among the
+    destinations in the config.
+
+    The search starts at the weighted geometric median of the origins and
+    refines a grid of candidate points around the best estimated score,
+    coarse to fine. Travel times for candidates are estimated from distance, so the
+    search itself costs nothing; only the most promising candidates are then
+    checked against real routes. Candidates near a hub we already have routes
+    for are snapped to it, and routes already in the store are reused, so
+    API requests are only spent (up to `budget` of them) on genuinely new
+    points.
+
+    Points are scored under `objective` (default: the config's default),
+    with origins weighted as in the config, as `find-locations` does.
+    """
+
+    def __init__(
+        self,
+        updater,
+        budget: int = 0,
+        snap_km: float = 5.0,
+        grid_size: int = 9,
+        levels: int = 5,
+        initial_span_km: float = 200.0,
+        objective: str = None,
+    ):
+        self.updater = updater
+        self.budget = budget
+        self.snap_km = snap_km
+        self.grid_size = grid_size
+        self.levels = levels
+        self.initial_span_km = initial_span_km
+        self.objective = resolve_objective(objective, updater.config)
+        self.weights = origin_weights(updater.config["origins"])
+        self.requests_used = 0
+
+    @property
+    def origins(self) -> List[Tuple[float, float]]:
+        return self.updater.get_coordinates(self.updater.config["origins"])
+
+    def scores(self, times: np.ndarray) -> np.ndarray:
+        """
+        Score every point (column) of an origins x points matrix.
+        """
+        objective = self.objective
+        return evaluate_objectives([objective], times, self.weights)[objective.name]
+
+    def known_hubs(self) -> List[Dict]:
+        """
+        Every point we have routes to from all origins: the destinations in
+        the config, plus any point probed on an earlier run.
+        """
+        index = self.updater.route_index
+        hubs = {
+            index.coordinates.point_id(point): {"name": d["name"], "point": point}
+            for d, point in zip(
+                self.updater.config["destinations"],
+                self.updater.get_coordinates(self.updater.config["destinations"]),
+            )
+        }
+        origin_ids = set(index.coordinates.point_ids(self.origins))
+        reached = {}
+        for origin_id, dest_id in index:
+            if origin_id in origin_ids:
+                reached.setdefault(dest_id, set()).add(origin_id)
+        for dest_id, reached_from in reached.items():
+            if dest_id not in hubs and reached_from == origin_ids:
+                key = index.coordinates.key(dest_id)
+                hubs[dest_id] = {"name": key, "point": parse_coordinate_key(key)}
+        return list(hubs.values())
+
+    def search_candidates(
+        self, model: DistanceModel, seed: np.ndarray, count: int
+    ) -> List[Tuple[Tuple[float, float], float]]:
+        """
+        Coarse-to-fine grid search on estimated scores around `seed`.
+
+        Returns up to `count` (point, estimated score) pairs, best first, at
+        least `snap_km` apart and rounded to route key precision.
+        """
+        origins = np.array(self.origins)
+        centre = np.asarray(seed)
+        span_km = self.initial_span_km
+        evaluated = {}
+        offsets = np.linspace(-0.5, 0.5, self.grid_size)
+        for _ in range(self.levels):
+            span = np.array(
+                [
+                    span_km / KM_PER_DEGREE,
+                    span_km / (KM_PER_DEGREE * np.cos(np.radians(centre[0]))),
+                ]
+            )
+            lat, lon = np.meshgrid(
+                centre[0] + offsets * span[0], centre[1] + offsets * span[1]
+            )
+            grid = np.round(np.column_stack([lat.ravel(), lon.ravel()]), 2)
+            scores = self.scores(model.predict(origins, grid))
+            for point, score in zip(grid.tolist(), scores):
+                evaluated[tuple(point)] = float(score)
+            centre = grid[np.argmin(scores)]
+            span_km /= 2
+
+        candidates = []
+        for point, score in sorted(evaluated.items(), key=lambda item: item[1]):
+            if len(candidates) == count:
+                break
+            if candidates:
+                chosen = np.array([p for p, _ in candidates])
+                if haversine_km_matrix([point], chosen).min() < self.snap_km:
+                    continue
+            candidates.append((point, score))
+        return candidates
+
+    def actual_score(self, point: Tuple[float, float]) -> Optional[float]:
+        """
+        The score for `point`, if we have routes to it from
+        every origin.
+        """
+        matrix = TravelTimeMatrix.from_index(
+            self.updater.route_index, self.origins, [point]
+        )
+        if matrix.missing.any():
+            return None
+        return float(self.scores(matrix.times)[0])
+
+    def probe(self, point: Tuple[float, float]) -> Optional[float]:
+        """
+        Fetch the missing routes to `point` if the remaining budget allows,
+        and return its score.
+        """
+        index = self.updater.route_index
+        point_id = index.coordinates.point_id
+        missing = [
+            (origin, point)
+            for origin in dict.fromkeys(self.origins)
+            if (point_id(origin), point_id(point)) not in index
+        ]
+        cost = len(self.updater.plan_batches(missing))
+        if self.requests_used + cost > self.budget:
+            return None
+        self.requests_used += cost
+        self.updater.fetch_routes(missing, batched=True)
+        return self.actual_score(point)
+
+    def suggest(self, top_n: int = 5) -> List[Dict]:
+        """
+        Suggested meeting points, best first.
+
+        Each has a `source`: "cached" if scored from routes we already had,
+        "probed" if we fetched routes for it, or "estimated" if its score is
+        only an estimate (see `TravelTimeEstimator`). `hub` names the known
+        hub a candidate was snapped to, if any.
+        """
+        origins = np.array(self.origins)
+        model = DistanceModel.fit(self.updater.route_index)
+        estimator = TravelTimeEstimator(self.updater.route_index)
+        seed = geometric_median(origins, self.weights)
+        hubs = self.known_hubs()
+        hub_points = np.array([hub["point"] for hub in hubs]).reshape(-1, 2)
+
+        suggestions = {}
+        for point, _ in self.search_candidates(model, seed, top_n * 3):
+            hub = None
+            if len(hubs):
+                distances = haversine_km_matrix([point], hub_points)[0]
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= self.snap_km:
+                    hub = hubs[nearest]
+                    point = hub["point"]
+            if point in suggestions:
+                continue
+
+            score = self.actual_score(point)
+            source = "cached"
+            if score is None:
+                score = self.probe(point)
+                source = "probed"
+            if score is None:
+                estimates, _ = estimator.predict(origins, [point])
+                score = float(self.scores(estimates)[0])
+                source = "estimated"
+            suggestions[point] = {
+                "name": hub["name"] if hub else f"{point[0]:.2f},{point[1]:.2f}",
+                "lat": point[0],
+                "lon": point[1],
+                "score": score,
+                "source": source,
+                "hub": hub["name"] if hub else None,
+            }
+
+        return sorted(suggestions.values(), key=lambda s: s["score"])[:top_n]
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Percentiles are of at most this many of the most recent samples
+MAX_LATENCY_SAMPLES = 10000
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    The `q`th percentile (0-100) of sorted `samples`, by nearest rank.
+    """
+    rank = max(1, -(-len(samples) * q // 100))
+    return samples[int(rank) - 1]
+
+
+class Latency:
+    """
+    A running summary of one kind of call's latency. The count, mean,
+    maximum and histogram cover every sample; percentiles cover the most
+    recent `MAX_LATENCY_SAMPLES`, so a long-running server's memory stays
+    bounded however many requests it answers.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {f"<={bound}ms": 0 for bound in LATENCY_BUCKETS_MS}
+        self.buckets[f">{LATENCY_BUCKETS_MS[-1]}ms"] = 0
+        self.recent = deque(maxlen=MAX_LATENCY_SAMPLES)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        ms = seconds * 1000
+        bound = next((b for b in LATENCY_BUCKETS_MS if ms <= b), None)
+        key = f"<={bound}ms" if bound else f">{LATENCY_BUCKETS_MS[-1]}ms"
+        self.buckets[key] += 1
+        self.recent.append(seconds)
+
+    def summary(self) -> Dict:
+        samples = sorted(self.recent)
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p90_ms": percentile(samples, 90) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": self.max * 1000,
+            "histogram": dict(self.buckets),
+        }
+
+
+class Metrics:
+    """
+    Counters, latency histograms and phase timings for a run, so we can see
+    where its time and API quota went.
+
+    Counters count events such as API requests and cache hits. Latencies
+    are recorded per call (e.g. each Distance Matrix request) and summarised
+    as percentiles and a histogram (see `Latency`). Phases (loading, fetching, saving,
+    scoring) accumulate the wall-clock time spent in them. Everything is
+    thread-safe, as API calls are made from worker threads.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters: Dict[str, int] = {}
+            self.latencies: Dict[str, Latency] = {}
+            self.phases: Dict[str, List[float]] = {}
+
+    def increment(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(name, Latency()).add(seconds)
+
+    @contextmanager
+    def timed(self, name: str):
+        """
+        Record how long the block takes as one latency sample of `name`,
+        whether or not it raises.
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - start)
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Add the time the block takes to phase `name`.
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            with self.lock:
+                self.phases.setdefault(name, []).append(elapsed)
+
+    def summary(self) -> Dict:
+        with self.lock:
+            latency = {
+                name: recorded.summary() for name, recorded in self.latencies.items()
+            }
+            return {
+                "counters": dict(sorted(self.counters.items())),
+                "latency": latency,
+                "phases": {
+                    name: {"seconds": sum(times), "count": len(times)}
+                    for name, times in self.phases.items()
+                },
+            }
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+# The metrics for this process, recorded by the runner and written out by
+# the CLI's --metrics-json
+metrics = Metrics()
@@ -0,0 +1,43 @@
+import os
+
+from route_store import open_route_store
+
+
+def migrate_routes(source_file: str, dest_file: str, batch_size: int = 1000) -> int:
+    """
+    Copy every route from one route store into another, e.g. from routes.json
+    into an SQLite database or back again. The backend of each is chosen from
+    its file extension.
+
+    Routes are written in batches so the destination never has to hold a
+    second copy of everything. Existing routes in the destination are
+    overwritten, along with when each was fetched and its status. Returns
+    the number of routes copied.
+
+    :param source_file: Path to the store to read from
+    :param dest_file: Path to the store to write to
+    :param batch_size: Number of routes to write per transaction
+    """
+    if not os.path.exists(source_file):
+        raise FileNotFoundError(f"Routes file not found: {source_file}")
+    with open_route_store(source_file) as source, open_route_store(dest_file) as dest:
+
+        def copy(batch):
+            # Group routes by when and how they were fetched, to keep that too
+            by_info = {}
+            infos = source.fetch_info(batch)
+            for key, duration in batch.items():
+                by_info.setdefault(infos.get(key, (None, None)), {})[key] = duration
+            for (fetched_at, status), routes in by_info.items():
+                dest.put_many(routes, fetched_at=fetched_at, status=status)
+            return len(batch)
+
+        count = 0
+        batch = {}
+        for key, duration in source.items():
+            batch[key] = duration
+            if len(batch) >= batch_size:
+                count += copy(batch)
+                batch = {}
+        count += copy(batch)
+    return count
@@ -0,0 +1,280 @@
+"""
+Scoring objectives: the ways we can turn everyone's travel times to a
+destination into a single score, lower being better.
+
+An objective is data (a kind and its parameters) rather than code, so the
+same definitions can be embedded in the page built by `build-html`, whose
+JavaScript implements each kind exactly as `evaluate_objectives` does here.
+Extra objectives can be defined in the config's optional "objectives"
+section, e.g.
+
+    "objectives": {
+        "fair": {"kind": "weighted", "average_weight": 0.5,
+                 "maximum_weight": 0.5, "cap_minutes": 180}
+    }
+
+Origins may have a "weight" (default 1), e.g. 2 for someone who'll bring a
+colleague, or 0 for someone who'll join remotely.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from scoring import AVERAGE_WEIGHT, MAXIMUM_WEIGHT, SubsetScorer
+
+KINDS = {
+    "weighted": "a weighted sum of the average and the longest travel time",
+    "percentile": "the travel time that this percentage of people are within",
+    "rms": "the root mean square travel time, which penalises long journeys",
+    "co2": "estimated kg of CO2 emitted, in proportion to time travelled",
+}
+
+# About 50 km/h door to door at 0.04 kg of CO2 per passenger km, roughly
+# the UK average for rail
+KG_CO2_PER_HOUR = 2.0
+
+
+class Objective:
+    """
+    How to score a destination from the travel times to it, which are
+    counted in proportion to each person's weight, and first capped at
+    `cap_minutes` if that's set (unreachable destinations stay unreachable).
+
+    - "weighted": `average_weight` x the average plus `maximum_weight` x
+      the longest travel time
+    - "percentile": the `percentile`th percentile travel time, by nearest
+      rank, so 90 is the time 90% of people are within
+    - "rms": the root mean square travel time, which ranks destinations as
+      the mean of squared times does but stays in seconds
+    - "co2": the total hours travelled x `kg_co2_per_hour`
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = "weighted",
+        description: Optional[str] = None,
+        average_weight: float = AVERAGE_WEIGHT,
+        maximum_weight: float = MAXIMUM_WEIGHT,
+        percentile: float = 90.0,
+        kg_co2_per_hour: float = KG_CO2_PER_HOUR,
+        cap_minutes: Optional[float] = None,
+    ):
+        if kind not in KINDS:
+            raise ValueError(
+                f"Unknown objective kind {kind!r} (expected one of {', '.join(KINDS)})"
+            )
+        if not 0 < percentile <= 100:
+            raise ValueError(f"Percentile must be in (0, 100], got {percentile}")
+        self.name = name
+        self.kind = kind
+        self.description = description or KINDS[kind].capitalize()
+        self.average_weight = average_weight
+        self.maximum_weight = maximum_weight
+        self.percentile = percentile
+        self.kg_co2_per_hour = kg_co2_per_hour
+        self.cap_minutes = cap_minutes
+
+    def __repr__(self) -> str:
+        return f"Objective({self.name!r}, {self.kind!r})"
+
+    @property
+    def cap_seconds(self) -> Optional[float]:
+        return None if self.cap_minutes is None else self.cap_minutes * 60
+
+    def format_score(self, score: float) -> str:
+        if self.kind == "co2":
+            return f"{score:.1f} kg CO2"
+        return str(int(score)) if np.isfinite(score) else "unreachable"
+
+    def to_json(self) -> Dict:
+        """
+        The definition, as embedded in the page (see `index.html`).
+        """
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "description": self.description,
+            "average_weight": self.average_weight,
+            "maximum_weight": self.maximum_weight,
+            "percentile": self.percentile,
+            "kg_co2_per_hour": self.kg_co2_per_hour,
+            "cap_seconds": self.cap_seconds,
+        }
+
+    def from_average_and_maximum(
+        self, avg_time: np.ndarray, max_time: np.ndarray
+    ) -> np.ndarray:
+        """
+        The score of a "weighted" objective from precomputed averages and
+        maxima, e.g. those of `SubsetScorer`. Terms with no weight are left
+        out, so that an unreachable destination doesn't score 0 x inf.
+        """
+        score = np.zeros(np.shape(avg_time))
+        if self.average_weight:
+            score = score + avg_time * self.average_weight
+        if self.maximum_weight:
+            score = score + max_time * self.maximum_weight
+        return score
+
+    def evaluate(
+        self,
+        times: np.ndarray,
+        weights: np.ndarray,
+        order: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Score every destination (column) of `times`, whose origins (rows)
+        all have a positive weight. `order` is `times` argsorted down each
+        column, needed for percentiles.
+        """
+        cap = self.cap_seconds
+        total_weight = weights.sum()
+        if self.kind == "percentile":
+            columns = np.arange(times.shape[1])
+            cumulative = np.cumsum(weights[order], axis=0)
+            rank = np.argmax(cumulative >= total_weight * self.percentile / 100, axis=0)
+            # Capping doesn't change the order, so cap the percentile itself
+            times = times[order[rank, columns], columns]
+        if cap is not None:
+            times = np.where(np.isinf(times), times, np.minimum(times, cap))
+        if self.kind == "percentile":
+            return times
+
+        if self.kind == "rms":
+            return np.sqrt((times**2 * weights[:, None]).sum(axis=0) / total_weight)
+        total = (times * weights[:, None]).sum(axis=0)
+        if self.kind == "weighted":
+            avg_time = total / total_weight
+            return self.from_average_and_maximum(avg_time, times.max(axis=0))
+        return total / 3600 * self.kg_co2_per_hour
+
+
+DEFAULT_OBJECTIVE = Objective(
+    "convenience",
+    description="70% the average travel time and 30% the longest, balancing"
+    " convenience for the group with fairness to whoever travels furthest",
+)
+
+BUILTIN_OBJECTIVES = {
+    objective.name: objective
+    for objective in [
+        DEFAULT_OBJECTIVE,
+        Objective(
+            "mean",
+            average_weight=1,
+            maximum_weight=0,
+            description="The average travel time",
+        ),
+        Objective(
+            "max",
+            average_weight=0,
+            maximum_weight=1,
+            description="The longest travel time",
+        ),
+        Objective(
+            "p90",
+            "percentile",
+            percentile=90,
+            description="The travel time 90% of people are within",
+        ),
+        Objective(
+            "p95",
+            "percentile",
+            percentile=95,
+            description="The travel time 95% of people are within",
+        ),
+        Objective("mean_squares", "rms"),
+        Objective("co2", "co2"),
+    ]
+}
+
+
+def load_objectives(config: Dict) -> Dict[str, Objective]:
+    """
+    The built in objectives plus any defined in the config's optional
+    "objectives" section, which may redefine them.
+    """
+    objectives = dict(BUILTIN_OBJECTIVES)
+    for name, options in config.get("objectives", {}).items():
+        objectives[name] = Objective(name, **options)
+    return objectives
+
+
+def resolve_objective(name: Optional[str], config: Dict) -> Objective:
+    """
+    The objective called `name` in the config or built in. None means the
+    default.
+    """
+    objectives = load_objectives(config)
+    if name is None:
+        return objectives[DEFAULT_OBJECTIVE.name]
+    if name not in objectives:
+        raise ValueError(
+            f"Unknown objective {name!r} (expected one of {', '.join(objectives)})"
+        )
+    return objectives[name]
+
+
+def origin_weights(origins: List[Dict]) -> np.ndarray:
+    return np.array([origin.get("weight", 1) for origin in origins], dtype=np.float64)
+
+
+def evaluate_objectives(
+    objectives: List[Objective],
+    times: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Score every destination (column) of an origins x destinations matrix
+    under each of `objectives`, keyed by name.
+
+    Work shared between objectives, such as dropping origins with no
+    weight and sorting each column for percentiles, is done once, so
+    scoring under every objective costs little more than under one.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if weights is None:
+        weights = np.ones(times.shape[0])
+    weights = np.asarray(weights, dtype=np.float64)
+    counted = weights > 0
+    if not counted.any():
+        raise ValueError("At least one origin with a positive weight is needed")
+    if not counted.all():
+        times, weights = times[counted], weights[counted]
+
+    order = None
+    if any(objective.kind == "percentile" for objective in objectives):
+        order = np.argsort(times, axis=0, kind="stable")
+    return {
+        objective.name: objective.evaluate(times, weights, order)
+        for objective in objectives
+    }
+
+
+def subset_objective_scores(
+    objective: Objective,
+    scorer: SubsetScorer,
+    weights: np.ndarray,
+    origin_ids: frozenset,
+) -> np.ndarray:
+    """
+    Score every destination under `objective`, counting only the origins at
+    `origin_ids` of the matrix `scorer` was built from, each weighted as
+    in `weights`. Unweighted averages and maxima come from the scorer's
+    precomputed totals; other objectives score the origins' rows.
+    """
+    rows = np.array(sorted(origin_ids), dtype=np.intp)
+    weights = weights[rows]
+    if (
+        objective.kind == "weighted"
+        and objective.cap_minutes is None
+        and (weights == 1).all()
+    ):
+        scores = scorer.scores(rows)
+        return objective.from_average_and_maximum(
+            scores["avg_time"], scores["max_time"]
+        )
+    times = scorer.times[:, rows].T
+    return evaluate_objectives([objective], times, weights)[objective.name]
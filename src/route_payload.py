@@ -0,0 +1,120 @@
+import base64
+import zlib
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+
+from coordinates import coordinate_key
+from scoring import SubsetScorer, TravelTimeMatrix
+
+PAYLOAD_FORMAT = "route-matrix-v1"
+
+
+def _unique_keys(locations: List[Dict]) -> List[str]:
+    return list(
+        dict.fromkeys(
+            coordinate_key((round(loc["lat"], 4), round(loc["lon"], 4)))
+            for loc in locations
+        )
+    )
+
+
+def pack_route_matrix(
+    config: Dict, routes: Mapping[str, float], compress: bool = True
+) -> Dict:
+    """
+    Pack the routes between the origins and destinations in `config` into a
+    compact payload for the HTML page.
+
+    Rather than a dict of "origin->destination" strings, the payload has a
+    table of origin keys, a table of destination keys and a row-major
+    origins x destinations matrix of travel times in whole minutes, as
+    little-endian Uint16 (or Uint32 if any time won't fit), base64-encoded
+    and optionally deflated. The page decodes it straight into a typed array.
+
+    The largest value of the type marks a route we haven't fetched, and the
+    one below it a route with no transit connection.
+    """
+    origins = _unique_keys(config["origins"])
+    destinations = _unique_keys(config["destinations"])
+    seconds = np.array(
+        [
+            routes.get(f"{origin}->{destination}", np.nan)
+            for origin in origins
+            for destination in destinations
+        ],
+        dtype=np.float64,
+    )
+
+    reachable = np.isfinite(seconds)
+    reachable_minutes = np.round(seconds[reachable] / 60)
+    # The two largest values are reserved for missing and unreachable routes
+    bits = 16 if reachable_minutes.max(initial=0) < 0xFFFE else 32
+    missing = (1 << bits) - 1
+    minutes = np.full(len(seconds), missing, dtype=f"<u{bits // 8}")
+    minutes[reachable] = reachable_minutes
+    minutes[np.isinf(seconds)] = missing - 1
+    data = minutes.tobytes()
+    if compress:
+        data = zlib.compress(data, 9)
+
+    return {
+        "format": PAYLOAD_FORMAT,
+        "origins": origins,
+        "destinations": destinations,
+        "bits": bits,
+        "compression": "deflate" if compress else None,
+        "minutes": base64.b64encode(data).decode(),
+    }
+
+
+def unpack_route_matrix(payload: Dict) -> Tuple[List[str], List[str], np.ndarray]:
+    """
+    The origin keys, destination keys and origins x destinations matrix of
+    travel times in seconds from a payload made by `pack_route_matrix`,
+    decoded as the page does. Missing routes are NaN, unreachable ones inf.
+    """
+    data = base64.b64decode(payload["minutes"])
+    if payload["compression"] == "deflate":
+        data = zlib.decompress(data)
+    bits = payload["bits"]
+    minutes = np.frombuffer(data, dtype=f"<u{bits // 8}")
+    missing = (1 << bits) - 1
+
+    seconds = minutes.astype(np.float64) * 60
+    seconds[minutes == missing] = np.nan
+    seconds[minutes == missing - 1] = np.inf
+    shape = (len(payload["origins"]), len(payload["destinations"]))
+    return payload["origins"], payload["destinations"], seconds.reshape(shape)
+
+
+def ranking_tables(config: Dict, routes: Mapping[str, float]) -> Dict:
+    """
+    Per-destination tables from which the page can score any subset of the
+    origins incrementally (see `SubsetScorer`), rather than rescanning every
+    route each time.
+
+    `times` has a row per destination and a column per origin, in config
+    order, in whole seconds; unreachable routes are None and missing ones
+    30 minutes, as the page assumes. `sums` and `unreachable` are each
+    row's total finite time and number of unreachable routes over all
+    origins, and `slowest_first` each row's origins from slowest to fastest,
+    so the page can find the maximum for a subset without sorting.
+    """
+    points = [
+        (round(loc["lat"], 4), round(loc["lon"], 4))
+        for loc in config["origins"] + config["destinations"]
+    ]
+    n_origins = len(config["origins"])
+    matrix = TravelTimeMatrix.from_routes(
+        routes, points[:n_origins], points[n_origins:]
+    )
+    scorer = SubsetScorer(np.round(matrix.times.astype(np.float64)))
+    return {
+        "times": [
+            [int(t) if np.isfinite(t) else None for t in row] for row in scorer.times
+        ],
+        "sums": scorer.total.astype(int).tolist(),
+        "unreachable": scorer.total_unreachable.tolist(),
+        "slowest_first": scorer.slowest_first.tolist(),
+    }
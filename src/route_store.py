@@ -0,0 +1,479 @@
+import json
+import os
+import sqlite3
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# (fetched_at, status) for a route; either may be None if not recorded
+FetchInfo = Tuple[Optional[float], Optional[str]]
+
+# The scenario every route fetched so far was requested for: public transport,
+# arriving at 14:00 on a Thursday. Routes for this scenario use the plain
+# "origin->destination" key, so existing routes.json files stay valid.
+DEFAULT_MODE = "transit"
+DEFAULT_SLOT = "thu-14:00"
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# The outcome of fetching a route: a travel time, no transit connection, or
+# an error (whose duration is stored as inf)
+STATUS_OK = "ok"
+STATUS_NO_ROUTE = "no_route"
+STATUS_ERROR = "error"
+
+
+def scenario_suffix(mode: str = DEFAULT_MODE, slot: str = DEFAULT_SLOT) -> str:
+    """
+    What follows the "@" in the route keys of a scenario, e.g.
+    "driving/thu-09:00", or "" for the default scenario, whose keys have none.
+    """
+    if (mode, slot) == (DEFAULT_MODE, DEFAULT_SLOT):
+        return ""
+    return f"{mode}/{slot}"
+
+
+def format_route_key(
+    origin: str, destination: str, mode: str = DEFAULT_MODE, slot: str = DEFAULT_SLOT
+) -> str:
+    """
+    Build the string key for a route, e.g. "51.75,-1.26->52.49,-1.89".
+
+    Routes for any scenario other than the default get a "@mode/slot" suffix.
+    """
+    key = f"{origin}->{destination}"
+    suffix = scenario_suffix(mode, slot)
+    if suffix:
+        key = f"{key}@{suffix}"
+    return key
+
+
+def parse_route_key(key: str) -> Tuple[str, str, str, str]:
+    """
+    Split a route key into (origin, destination, mode, slot).
+    """
+    route, _, scenario = key.partition("@")
+    origin, destination = route.split("->")
+    if scenario:
+        mode, slot = scenario.split("/", 1)
+    else:
+        mode, slot = DEFAULT_MODE, DEFAULT_SLOT
+    return origin, destination, mode, slot
+
+
+class RouteStore(MutableMapping):
+    """
+    A persistent mapping of route key to travel time in seconds.
+
+    Stores behave like the dict of routes we used to pass around, plus
+    batch operations that backends can implement efficiently. Used in a
+    `with` block, a store is closed (and so saved) at the end of it.
+    """
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        """
+        Look up several routes at once, omitting any that aren't stored.
+        """
+        return {key: self[key] for key in keys if key in self}
+
+    def put_many(
+        self,
+        routes: Dict[str, float],
+        fetched_at: Optional[float] = None,
+        status: Optional[str] = None,
+    ):
+        """
+        Insert or update several routes at once, recording when they were
+        fetched (a Unix timestamp) and with what status, if given.
+        """
+        for key, duration in routes.items():
+            self[key] = duration
+
+    def fetch_info(self, keys: Iterable[str]) -> Dict[str, FetchInfo]:
+        """
+        When each of several routes was fetched and with what status,
+        omitting any with nothing recorded (e.g. routes fetched before
+        this was recorded).
+        """
+        return {}
+
+    def prune_origins(self, keep: Iterable[str]) -> int:
+        """
+        Delete every route, in any scenario, from an origin (a coordinate
+        key) not in `keep`. Returns the number of routes deleted.
+        """
+        keep = set(keep)
+        stale = [key for key in self if parse_route_key(key)[0] not in keep]
+        for key in stale:
+            del self[key]
+        return len(stale)
+
+    def save(self):
+        raise NotImplementedError
+
+    def checkpoint(self):
+        """
+        Make the changes so far durable, e.g. partway through a long run.
+        By default the same as `save`; backends for which a full save is
+        costly can do something cheaper.
+        """
+        self.save()
+
+    def close(self):
+        self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONRouteStore(RouteStore):
+    """
+    Routes kept in a single JSON object, as read by index.html.
+
+    The file is read on first use and rewritten in full on save, so this
+    backend suits the few thousand routes we have today; use the SQLite
+    backend for anything larger.
+
+    Fetch times and statuses are kept in a separate file alongside
+    (routes.meta.json for routes.json), so the routes file stays a plain
+    key to duration mapping.
+
+    Rewriting the whole file at every checkpoint of a long run would cost
+    time in proportion to the size of the store each time, so `checkpoint`
+    instead appends the changes since the last one to a journal
+    (routes.journal.jsonl), which is replayed when the store is next read.
+    `save` rewrites the files in full and deletes the journal.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.meta_path = f"{os.path.splitext(path)[0]}.meta.json"
+        self.journal_path = f"{os.path.splitext(path)[0]}.journal.jsonl"
+        self._routes = None
+        self._fetch_info = None
+        # Changes not yet in the journal: route key -> duration, or None if
+        # deleted, and route key -> [fetched_at, status]
+        self._changed: Dict[str, Optional[float]] = {}
+        self._changed_info: Dict[str, list] = {}
+        self._journal_repaired = False
+
+    @property
+    def routes(self) -> Dict[str, float]:
+        if self._routes is None:
+            self._load()
+        return self._routes
+
+    @property
+    def fetch_infos(self) -> Dict[str, list]:
+        if self._fetch_info is None:
+            self._load()
+        return self._fetch_info
+
+    def _load(self):
+        self._routes = self._read(self.path)
+        self._fetch_info = self._read(self.meta_path)
+        try:
+            with open(self.journal_path, "rb") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Cut short by a crash, or still being appended by another
+                # process; only a writer repairs the file (see
+                # `_append_to_journal`)
+                continue
+            for key, duration in entry["routes"].items():
+                if duration is None:
+                    self._routes.pop(key, None)
+                    self._fetch_info.pop(key, None)
+                else:
+                    self._routes[key] = duration
+            self._fetch_info.update(entry["fetch_info"])
+
+    @staticmethod
+    def _read(path: str) -> Dict:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def __getitem__(self, key: str) -> float:
+        return self.routes[key]
+
+    def __setitem__(self, key: str, duration: float):
+        self.routes[key] = duration
+        self._changed[key] = duration
+
+    def __delitem__(self, key: str):
+        del self.routes[key]
+        self.fetch_infos.pop(key, None)
+        self._changed[key] = None
+        self._changed_info.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        return key in self.routes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.routes)
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+    def put_many(
+        self,
+        routes: Dict[str, float],
+        fetched_at: Optional[float] = None,
+        status: Optional[str] = None,
+    ):
+        self.routes.update(routes)
+        self._changed.update(routes)
+        if fetched_at is not None or status is not None:
+            infos = self.fetch_infos
+            for key in routes:
+                old_fetched_at, old_status = infos.get(key, (None, None))
+                infos[key] = self._changed_info[key] = [
+                    old_fetched_at if fetched_at is None else fetched_at,
+                    old_status if status is None else status,
+                ]
+
+    def fetch_info(self, keys: Iterable[str]) -> Dict[str, FetchInfo]:
+        infos = self.fetch_infos
+        return {key: tuple(infos[key]) for key in keys if key in infos}
+
+    def checkpoint(self):
+        self._append_to_journal()
+
+    def _append_to_journal(self):
+        if not (self._changed or self._changed_info):
+            return
+        entry = {"routes": self._changed, "fetch_info": self._changed_info}
+        self._drop_partial_line()
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._changed = {}
+        self._changed_info = {}
+
+    def _drop_partial_line(self):
+        # A crash mid-append leaves a line with no newline; cut it off so
+        # that our entry doesn't run on from it. Once we've appended, the
+        # journal ends with our own complete line.
+        if self._journal_repaired:
+            return
+        self._journal_repaired = True
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) == b"\n":
+                    return
+                f.seek(0)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        os.truncate(self.journal_path, data.rfind(b"\n") + 1)
+
+    def save(self):
+        if self._routes is None:
+            return
+        unchanged = not (
+            self._changed or self._changed_info or os.path.exists(self.journal_path)
+        )
+        if unchanged and os.path.exists(self.path):
+            # Nothing to write, so a reader closing the store leaves the file
+            # alone for whoever is writing it
+            return
+        # Journal anything outstanding first, so that if we crash before
+        # the journal is deleted, replaying it still gives what we saved
+        self._append_to_journal()
+        self._write(self.path, self._routes)
+        if self._fetch_info:
+            self._write(self.meta_path, self._fetch_info)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def _write(self, path: str, data: Dict):
+        # Write to a temporary file and rename it over the old one, so a crash
+        # mid-write never leaves a truncated routes.json behind
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class SQLiteRouteStore(RouteStore):
+    """
+    Routes kept in an indexed SQLite table, one row per
+    (origin, destination, mode, slot).
+
+    Lookups go straight to the database, so nothing is loaded up front.
+    Writes are batched into a transaction that is committed on save.
+    """
+
+    BATCH_SIZE = 200  # keys per query, well within SQLite's variable limit
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS routes (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                slot TEXT NOT NULL,
+                duration NUMERIC,
+                fetched_at REAL,
+                status TEXT,
+                PRIMARY KEY (origin, destination, mode, slot)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS routes_by_destination
+                ON routes (destination, mode, slot);
+            """)
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(routes)")
+        }
+        # Databases created before fetch times and statuses were recorded
+        for column, column_type in [("fetched_at", "REAL"), ("status", "TEXT")]:
+            if column not in columns:
+                self.connection.execute(
+                    f"ALTER TABLE routes ADD COLUMN {column} {column_type}"
+                )
+
+    def __getitem__(self, key: str) -> float:
+        row = self.connection.execute(
+            "SELECT duration FROM routes"
+            " WHERE origin = ? AND destination = ? AND mode = ? AND slot = ?",
+            parse_route_key(key),
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __setitem__(self, key: str, duration: float):
+        self.put_many({key: duration})
+
+    def __delitem__(self, key: str):
+        cursor = self.connection.execute(
+            "DELETE FROM routes"
+            " WHERE origin = ? AND destination = ? AND mode = ? AND slot = ?",
+            parse_route_key(key),
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        for row in self.connection.execute(
+            "SELECT origin, destination, mode, slot FROM routes"
+        ):
+            yield format_route_key(*row)
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+    def items(self):
+        # Avoid a query per key when streaming the whole table
+        for row in self.connection.execute(
+            "SELECT origin, destination, mode, slot, duration FROM routes"
+        ):
+            yield format_route_key(*row[:4]), row[4]
+
+    def _select_many(self, columns: str, keys: Iterable[str], where: str = "1"):
+        """
+        Yield (route key, *columns) for each of `keys` that is stored and
+        matches `where`.
+        """
+        keys = list(keys)
+        for i in range(0, len(keys), self.BATCH_SIZE):
+            batch = [parse_route_key(key) for key in keys[i : i + self.BATCH_SIZE]]
+            placeholders = ", ".join(["(?, ?, ?, ?)"] * len(batch))
+            rows = self.connection.execute(
+                f"SELECT origin, destination, mode, slot, {columns} FROM routes"
+                f" WHERE (origin, destination, mode, slot) IN (VALUES {placeholders})"
+                f" AND {where}",
+                [value for route in batch for value in route],
+            )
+            for row in rows:
+                yield (format_route_key(*row[:4]), *row[4:])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        return {key: duration for key, duration in self._select_many("duration", keys)}
+
+    def fetch_info(self, keys: Iterable[str]) -> Dict[str, FetchInfo]:
+        return {
+            key: (fetched_at, status)
+            for key, fetched_at, status in self._select_many(
+                "fetched_at, status",
+                keys,
+                "(fetched_at IS NOT NULL OR status IS NOT NULL)",
+            )
+        }
+
+    def put_many(
+        self,
+        routes: Dict[str, float],
+        fetched_at: Optional[float] = None,
+        status: Optional[str] = None,
+    ):
+        self.connection.executemany(
+            "INSERT INTO routes"
+            " (origin, destination, mode, slot, duration, fetched_at, status)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (origin, destination, mode, slot)"
+            " DO UPDATE SET duration = excluded.duration,"
+            " fetched_at = coalesce(excluded.fetched_at, fetched_at),"
+            " status = coalesce(excluded.status, status)",
+            [
+                (*parse_route_key(key), duration, fetched_at, status)
+                for key, duration in routes.items()
+            ],
+        )
+
+    def prune_origins(self, keep: Iterable[str]) -> int:
+        keep = set(keep)
+        stale = [
+            origin
+            for (origin,) in self.connection.execute(
+                "SELECT DISTINCT origin FROM routes"
+            )
+            if origin not in keep
+        ]
+        before = len(self)
+        self.connection.executemany(
+            "DELETE FROM routes WHERE origin = ?", [(origin,) for origin in stale]
+        )
+        return before - len(self)
+
+    def save(self):
+        self.connection.commit()
+
+    def close(self):
+        self.save()
+        self.connection.close()
+
+
+def open_route_store(path: str) -> RouteStore:
+    """
+    Open the route store at `path`, choosing the backend from its extension:
+    SQLite for .db/.sqlite/.sqlite3 (or ":memory:"), JSON otherwise.
+    """
+    if path == ":memory:" or os.path.splitext(path)[1] in SQLITE_EXTENSIONS:
+        return SQLiteRouteStore(path)
+    return JSONRouteStore(path)
@@ -1,78 +1,213 @@
-import googlemaps
-from datetime import datetime, timedelta
-from typing import List, Tuple, Dict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
 import json
 import os
+import time
 import json
 import base64
 import json
 import ast
+import re
+import itertools
+import numpy as np
+from functools import cached_property, lru_cache
+from fetching import TokenBucket, fetch_all, is_quota_exhausted, is_retryable
+from route_store import (
+    STATUS_ERROR,
+    STATUS_NO_ROUTE,
+    STATUS_OK,
+    RouteStore,
+    format_route_key,
+    open_route_store,
+)
+from route_payload import pack_route_matrix, ranking_tables
+from coordinates import RouteIndex, coordinate_key, parse_coordinate_key
+from estimator import TravelTimeEstimator
+from facility import solve_k_median
+from geo import haversine_km_matrix
+from geocode_cache import GeocodeCache
+from metrics import metrics
+from objectives import (
+    evaluate_objectives,
+    load_objectives,
+    origin_weights,
+    resolve_objective,
+    subset_objective_scores,
+)
+from scenarios import Scenario, resolve_scenario
+from scoring import SubsetScorer, TravelTimeMatrix, top_n_indices
+
+# Per-request limits of the Google Distance Matrix API
+MAX_ORIGINS_PER_REQUEST = 25
+MAX_DESTINATIONS_PER_REQUEST = 25
+MAX_ELEMENTS_PER_REQUEST = 100
+
+
+# A person in people.js, e.g. { name: "Jo Bloggs", location: [51.75, -1.26], ... }
+PERSON_PATTERN = re.compile(r"\{[^{}]*\}")
+NAME_PATTERN = re.compile(r"""\bname:\s*("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')""")
+LOCATION_PATTERN = re.compile(
+    r"\blocation:\s*\[\s*([-+\d.eE]+)\s*,\s*([-+\d.eE]+)\s*\]"
+)
+
+
+def parse_people(content: str) -> Iterator[Dict]:
+    """
+    Yield an origin ({"name", "lat", "lon"}) for each person in the contents
+    of people.js, as they're found.
+
+    Only each person's name and location are picked out, rather than
+    rewriting the whole file into a Python literal and evaluating it.
+    """
+    for person in PERSON_PATTERN.finditer(content):
+        name = NAME_PATTERN.search(person[0])
+        location = LOCATION_PATTERN.search(person[0])
+        if name and location:
+            yield {
+                "name": ast.literal_eval(name[1]),
+                "lat": float(location[1]),
+                "lon": float(location[2]),
+            }
+
+
+def unparsed_people(content: str, origins: List[Dict]) -> List[str]:
+    """
+    The names in the contents of people.js of anyone `parse_people` didn't
+    find, e.g. because their entry has no location, or one we can't read.
+    """
+    found = {origin["name"] for origin in origins}
+    names = (ast.literal_eval(name[1]) for name in NAME_PATTERN.finditer(content))
+    return [name for name in dict.fromkeys(names) if name not in found]
 
 
 def convert_staff_locations(input_file):
     """Convert data as stored in our current team manual page into a format
-    that can be used by this software"""
-    # Read the input file
+    that can be used by this software.
+
+    Also returns, as "unparsed", the names of anyone whose entry couldn't be
+    read (see `unparsed_people`), warning about each."""
     with open(input_file, "r") as f:
         content = f.read()
+    origins = list(parse_people(content))
+    unparsed = unparsed_people(content, origins)
+    for name in unparsed:
+        print(f"Warning: couldn't read the location of {name} in {input_file}")
+    return {"origins": origins, "unparsed": unparsed}
 
-    # Remove the 'export default' part and semicolon at the end
-    data_string = content.replace("export default", "").strip()[:-1]
-
-    # Replace JavaScript-style property names with Python-style
-    data_string = data_string.replace("name:", '"name":')
-    data_string = data_string.replace("location:", '"location":')
-    data_string = data_string.replace("github:", '"github":')
-
-    # Use ast.literal_eval to safely evaluate the string as a Python expression
-    data_list = ast.literal_eval(data_string)
-
-    # Transform the data
-    origins = []
-    for item in data_list:
-        origins.append(
-            {
-                "name": item["name"],
-                "lat": item["location"][0],
-                "lon": item["location"][1],
-            }
-        )
 
-    output_data = {"origins": origins}
+def diff_origins(old: List[Dict], new: List[Dict]) -> Dict[str, List]:
+    """
+    Compare two lists of origins by name.
 
-    return output_data
+    Returns the origins that were "added" and "removed", and (old, new)
+    pairs for those that "moved".
+    """
+    old_by_name = {origin["name"]: origin for origin in old}
+    new_by_name = {origin["name"]: origin for origin in new}
+    return {
+        "added": [o for name, o in new_by_name.items() if name not in old_by_name],
+        "moved": [
+            (old_by_name[name], o)
+            for name, o in new_by_name.items()
+            if name in old_by_name
+            and (o["lat"], o["lon"])
+            != (old_by_name[name]["lat"], old_by_name[name]["lon"])
+        ],
+        "removed": [o for name, o in old_by_name.items() if name not in new_by_name],
+    }
 
 
-def interpolate_staff_locations(input_file):
+def interpolate_staff_locations(
+    input_file, config_file: str = "locations_config.json"
+) -> Dict[str, List]:
+    """
+    Replace the origins in the config with the people in `input_file`, and
+    return how they changed (see `diff_origins`). Anything else the config
+    records about someone already in it, such as their "weight", is kept.
+    People whose entry couldn't be read are kept as they were rather than
+    removed, so their routes aren't pruned. The config is only rewritten
+    if something changed.
+    """
     output_data = convert_staff_locations(input_file=input_file)
-    with open("locations_config.json", "r") as f:
+    with open(config_file, "r") as f:
         content = json.load(f)
-        content.update(output_data)
-    with open("locations_config.json", "w") as f:
-        json.dump(content, f, indent=2)
+    old_by_name = {origin["name"]: origin for origin in content.get("origins", [])}
+    origins = [
+        {**old_by_name.get(person["name"], {}), **person}
+        for person in output_data["origins"]
+    ] + [old_by_name[name] for name in output_data["unparsed"] if name in old_by_name]
+    changes = diff_origins(content.get("origins", []), origins)
+    if any(changes.values()) or content.get("origins") != origins:
+        content["origins"] = origins
+        with open(config_file, "w") as f:
+            json.dump(content, f, indent=2)
+    return changes
+
+
+def prune_routes(routes: RouteStore, origins: List[Dict]) -> int:
+    """
+    Delete every route from a point that isn't one of `origins` (e.g. the
+    old home of someone who moved or left). Returns the number deleted.
+    """
+    deleted = routes.prune_origins(
+        coordinate_key((round(o["lat"], 4), round(o["lon"], 4))) for o in origins
+    )
+    routes.save()
+    return deleted
+
+
+def maps_client(api_key: str):
+    """
+    A Google Maps client. googlemaps (and requests) are only imported when
+    one is first needed, so commands that only read cached routes start
+    quicker and work without an API key.
+    """
+    if not api_key:
+        raise ValueError("GOOGLE_MAPS_API_KEY environment variable is not set.")
+    import googlemaps
+
+    return googlemaps.Client(key=api_key)
 
 
 class RouteUpdater:
     def __init__(
-        self, api_key: str, config_file: str, routes_file: str = "routes.json"
+        self,
+        api_key: str,
+        config_file: str,
+        routes_file: str = "routes.json",
+        scenario: str = None,
     ):
-        self.gmaps = googlemaps.Client(key=api_key)
+        self.api_key = api_key
         self.config = self.load_config(config_file)
+        self.scenario = resolve_scenario(scenario, self.config)
         self.routes_file = routes_file
         self.routes = self.load_routes()
+        # API requests left in this run's budget, if it has one
+        self.requests_remaining = None
 
-    def load_routes(self):
-        try:
-            with open(self.routes_file, "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+    @cached_property
+    def gmaps(self):
+        return maps_client(self.api_key)
+
+    def load_routes(self) -> RouteStore:
+        return open_route_store(self.routes_file)
+
+    @cached_property
+    def route_index(self) -> RouteIndex:
+        """
+        The cached routes for our scenario keyed by coordinate ids, kept in
+        step with `self.routes` by `update_routes`.
+        """
+        with metrics.phase("load_routes"):
+            return RouteIndex.from_routes(
+                self.routes, self.scenario.mode, self.scenario.slot
+            )
 
     def load_config(self, config_file: str) -> Dict:
         if not os.path.exists(config_file):
             raise FileNotFoundError(f"Config file not found: {config_file}")
         try:
-            with open(config_file, "r") as f:
+            with metrics.phase("load_config"), open(config_file, "r") as f:
                 return json.load(f)
         except json.JSONDecodeError:
             raise ValueError(f"Invalid JSON in config file: {config_file}")
@@ -80,62 +215,447 @@ class RouteUpdater:
     def get_coordinates(self, locations: List[Dict]) -> List[Tuple[float, float]]:
         return [(round(loc["lat"], 4), round(loc["lon"], 4)) for loc in locations]
 
-    def update_routes(self):
+    def route_key(
+        self, origin: Tuple[float, float], destination: Tuple[float, float]
+    ) -> str:
+        origin_str = f"{origin[0]:.2f},{origin[1]:.2f}"
+        dest_str = f"{destination[0]:.2f},{destination[1]:.2f}"
+        return format_route_key(
+            origin_str, dest_str, self.scenario.mode, self.scenario.slot
+        )
+
+    def arrival_time(self) -> datetime:
+        return self.scenario.arrival_time()
+
+    def stale_routes(
+        self, max_age_days: float = None, retry_errors: bool = False
+    ) -> Dict[Tuple[int, int], float]:
+        """
+        The (origin id, destination id) pairs in the config whose cached
+        route needs fetching again, because it's older than `max_age_days`
+        (by default, the scenario's TTL) or, with `retry_errors`, because
+        fetching it failed. Each maps to when it was fetched.
+
+        Routes cached before fetch times and statuses were recorded count
+        as infinitely old, and those with no travel time as failed.
+        """
+        if max_age_days is None and self.scenario.ttl_days is None:
+            if not retry_errors:
+                return {}
+        index = self.route_index
+        origin_ids = index.coordinates.point_ids(
+            self.get_coordinates(self.config["origins"])
+        )
+        destination_ids = index.coordinates.point_ids(
+            self.get_coordinates(self.config["destinations"])
+        )
+        keys = {
+            index.route_key(*ids): ids
+            for ids in itertools.product(origin_ids, destination_ids)
+            if ids in index
+        }
+        infos = self.routes.fetch_info(keys)
+        now = time.time()
+        stale = {}
+        for key, ids in keys.items():
+            fetched_at, status = infos.get(key, (None, None))
+            if status is None and np.isinf(index.get(ids)):
+                status = STATUS_ERROR
+            if (retry_errors and status == STATUS_ERROR) or self.scenario.is_stale(
+                fetched_at, now, max_age_days
+            ):
+                stale[ids] = fetched_at
+        return stale
+
+    def missing_routes(
+        self,
+        max_age_days: float = None,
+        retry_errors: bool = False,
+        origins: List[Dict] = None,
+    ) -> List[Tuple[Tuple[float, float], Tuple[float, float]]]:
+        """
+        Return the (origin, destination) pairs whose route key is not yet
+        cached, followed by those whose cached route needs fetching again
+        (see `stale_routes`), oldest first. Pass `origins` to only consider
+        routes from those origins rather than everyone in the config.
+
+        Several people can share a route key (e.g. they live in the same town),
+        so each key is only returned once.
+        """
+        origins = self.get_coordinates(
+            self.config["origins"] if origins is None else origins
+        )
+        destinations = self.get_coordinates(self.config["destinations"])
+
+        point_id = self.route_index.coordinates.point_id
+        origin_ids = [(origin, point_id(origin)) for origin in origins]
+        destination_ids = [
+            (destination, point_id(destination)) for destination in destinations
+        ]
+
+        stale = self.stale_routes(max_age_days, retry_errors)
+        missing = []
+        refresh = []
+        seen = set()
+        for origin, origin_id in origin_ids:
+            for destination, destination_id in destination_ids:
+                ids = (origin_id, destination_id)
+                if ids in seen:
+                    continue
+                seen.add(ids)
+                if ids not in self.route_index:
+                    missing.append((origin, destination))
+                elif ids in stale:
+                    refresh.append((stale[ids] or 0, (origin, destination)))
+        refresh.sort(key=lambda item: item[0])
+        return missing + [pair for _, pair in refresh]
+
+    def plan_batches(
+        self, missing: List[Tuple[Tuple[float, float], Tuple[float, float]]]
+    ) -> List[Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]]:
+        """
+        Group missing pairs into Distance Matrix requests that stay within the
+        API's per-request limits.
+
+        Origins missing exactly the same destinations are grouped together, so
+        every element of every request is a route we actually need.
+        """
+        destinations_by_origin = {}
+        for origin, destination in missing:
+            destinations_by_origin.setdefault(origin, []).append(destination)
+
+        origins_by_destinations = {}
+        for origin, destinations in destinations_by_origin.items():
+            origins_by_destinations.setdefault(tuple(destinations), []).append(origin)
+
+        batches = []
+        max_destinations = min(MAX_DESTINATIONS_PER_REQUEST, MAX_ELEMENTS_PER_REQUEST)
+        for destinations, origins in origins_by_destinations.items():
+            for d in range(0, len(destinations), max_destinations):
+                dest_chunk = list(destinations[d : d + max_destinations])
+                max_origins = min(
+                    MAX_ORIGINS_PER_REQUEST, MAX_ELEMENTS_PER_REQUEST // len(dest_chunk)
+                )
+                for o in range(0, len(origins), max_origins):
+                    batches.append((origins[o : o + max_origins], dest_chunk))
+        return batches
+
+    def fetch_matrix(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+    ) -> Dict[str, float]:
+        """
+        Fetch travel times for every origin/destination combination in a single
+        Distance Matrix request, keyed by (origin, destination).
+        """
+        metrics.increment("api.distance_matrix.requests")
+        metrics.increment(
+            "api.distance_matrix.elements", len(origins) * len(destinations)
+        )
+        try:
+            with metrics.timed("api.distance_matrix"):
+                matrix = self.gmaps.distance_matrix(
+                    origins,
+                    destinations,
+                    **self.scenario.request_options(self.arrival_time()),
+                )
+        except Exception:
+            metrics.increment("api.distance_matrix.errors")
+            raise
+        durations = {}
+        for origin, row in zip(origins, matrix["rows"]):
+            for destination, element in zip(destinations, row["elements"]):
+                if "duration" in element:
+                    duration = element["duration"]["value"]
+                else:
+                    duration = float("inf")  # Use infinity for no route
+                durations[(origin, destination)] = duration
+        return durations
+
+    def lower_bound_scores(
+        self, max_speed_kmh: float, objective: str = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The lowest score each destination could possibly get under
+        `objective` (default: the config's default), weighting origins as in
+        the config, and whether all its routes are cached (in which case the
+        bound is its actual score).
+
+        Missing routes are assumed to be as fast as travelling in a straight
+        line at `max_speed_kmh`, which no real journey beats. Every kind of
+        objective only gets worse as a travel time grows (provided its
+        weights aren't negative), so the optimistic times bound the score.
+        """
         origins = self.get_coordinates(self.config["origins"])
         destinations = self.get_coordinates(self.config["destinations"])
+        matrix = TravelTimeMatrix.from_index(self.route_index, origins, destinations)
+        fastest = haversine_km_matrix(origins, destinations) / max_speed_kmh * 3600
+        optimistic = np.where(matrix.missing, fastest, matrix.times)
+        resolved = resolve_objective(objective, self.config)
+        weights = origin_weights(self.config["origins"])
+        scores = evaluate_objectives([resolved], optimistic, weights)[resolved.name]
+        return scores, ~matrix.missing.any(axis=0)
 
-        for origin in origins:
-            for destination in destinations:
-                origin_str = f"{origin[0]:.2f},{origin[1]:.2f}"
-                dest_str = f"{destination[0]:.2f},{destination[1]:.2f}"
-                route_key = f"{origin_str}->{dest_str}"
-
-                if route_key not in self.routes:
-                    if origin == dest_str:
-                        self.routes[route_key] = 0
-                    else:
-                        try:
-                            next_thursday = datetime.now() + timedelta(
-                                days=(3 - datetime.now().weekday() + 7) % 7
-                            )
-                            next_thursday = next_thursday.replace(
-                                hour=14, minute=0, second=0, microsecond=0
-                            )
-                            matrix = self.gmaps.distance_matrix(
-                                [origin],
-                                destination,
-                                mode="transit",
-                                transit_mode="bus|subway|train",
-                                arrival_time=next_thursday,
+    def destinations_per_round(self, n_origins: int, at_least: int) -> int:
+        """
+        How many destinations to fetch together (at least `at_least`) so that
+        batched requests for all `n_origins` origins are as full as possible.
+        """
+
+        def fullness(n_destinations):
+            per_request = min(
+                MAX_ORIGINS_PER_REQUEST, MAX_ELEMENTS_PER_REQUEST // n_destinations
+            )
+            requests = -(-n_origins // per_request)
+            return n_origins * n_destinations / (requests * MAX_ELEMENTS_PER_REQUEST)
+
+        sizes = range(at_least, max(at_least, MAX_DESTINATIONS_PER_REQUEST) + 1)
+        return max(sizes, key=lambda n: (fullness(n), -n))
+
+    def update_routes(
+        self,
+        prune_top: int = None,
+        max_speed_kmh: float = 200.0,
+        objective: str = None,
+        max_age_days: float = None,
+        retry_errors: bool = False,
+        budget: int = None,
+        **options,
+    ):
+        """
+        Fetch every route that is not already cached, then refresh any
+        that are stale (see `stale_routes` for `max_age_days` and
+        `retry_errors`), oldest first, then save.
+
+        With `budget=n`, stop after n API requests; whatever is left is
+        fetched by the next run. A scheduled run with a budget keeps the
+        routes fresh at a fixed cost.
+
+        With `prune_top=k`, only fetch missing routes to destinations that
+        could still make the top k: destinations are fetched a few at a
+        time, most promising first, and any whose lower-bound score (see
+        `lower_bound_scores`) is worse than the current k-th best actual
+        score are skipped. Scores are under `objective` (default: the
+        config's default), with origins weighted as in the config, so the
+        top k are those `find-locations` would rank with that objective.
+        Skipped routes stay missing, so a later run without pruning fetches
+        them.
+
+        See `fetch_routes` for the other options.
+        """
+        self.requests_remaining = budget
+        refresh = {"max_age_days": max_age_days, "retry_errors": retry_errors}
+        wanted = self.missing_routes(**refresh)
+        point_ids = self.route_index.coordinates.point_ids
+        n_routes = len(
+            set(point_ids(self.get_coordinates(self.config["origins"])))
+        ) * len(set(point_ids(self.get_coordinates(self.config["destinations"]))))
+        # Misses are counted as they're requested (see `fetch_routes`), so
+        # routes skipped by pruning or the budget aren't among them
+        metrics.increment("routes.cache_hits", n_routes - len(wanted))
+        if not prune_top:
+            self.fetch_routes(wanted, **options)
+            return
+
+        destinations = self.get_coordinates(self.config["destinations"])
+        n_origins = len(set(point_ids(self.get_coordinates(self.config["origins"]))))
+        per_round = self.destinations_per_round(n_origins, prune_top)
+        attempted = set()
+        while True:
+            scores, complete = self.lower_bound_scores(max_speed_kmh, objective)
+            if complete.sum() >= prune_top:
+                kth_best = np.sort(scores[complete])[prune_top - 1]
+            else:
+                kth_best = float("inf")
+            candidates = [
+                i
+                for i in np.argsort(scores, kind="stable")
+                if not complete[i] and i not in attempted and scores[i] <= kth_best
+            ][:per_round]
+            if not candidates or self.requests_remaining == 0:
+                break
+            attempted.update(candidates)
+            wanted = {destinations[i] for i in candidates}
+            self.fetch_routes(
+                [(o, d) for o, d in self.missing_routes() if d in wanted], **options
+            )
+
+        point_id = self.route_index.coordinates.point_id
+        stale = [
+            (o, d)
+            for o, d in self.missing_routes(**refresh)
+            if (point_id(o), point_id(d)) in self.route_index
+        ]
+        if stale:
+            self.fetch_routes(stale, **options)
+
+        skipped = self.missing_routes()
+        if options.get("batched"):
+            requests_saved = len(self.plan_batches(skipped))
+        else:
+            requests_saved = len(skipped)
+        print(
+            f"Skipped {len(skipped)} routes to destinations that can't make the "
+            f"top {prune_top}, saving {requests_saved} API requests"
+        )
+
+    def fetch_routes(
+        self,
+        pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]],
+        batched: bool = False,
+        workers: int = 1,
+        qps: float = None,
+        retries: int = 5,
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 60.0,
+    ):
+        """
+        Fetch and store the route for each (origin, destination) pair, then
+        save.
+
+        By default each pair is fetched with its own request. With
+        `batched=True`, pairs are grouped into as few Distance Matrix requests
+        as the API limits allow.
+
+        Requests are spread over `workers` threads and, if `qps` is given,
+        limited to that many per second. Requests failing with
+        OVER_QUERY_LIMIT or a transient error are retried up to `retries`
+        times with exponential backoff. Results are merged in request order,
+        so the outcome doesn't depend on which request finishes first.
+
+        Routes are checkpointed (see `RouteStore.checkpoint`) every
+        `checkpoint_every` new routes or `checkpoint_interval` seconds, and
+        saved at the end even if the run is interrupted, so paid-for
+        results are never lost. Requests that still fail
+        transiently are left uncached rather than stored as `inf`, and the
+        run stops early if the API quota is exhausted; either way, running
+        again picks up where this run stopped.
+        """
+        point_id = self.route_index.coordinates.point_id
+        missing = []
+        for origin, destination in pairs:
+            if point_id(origin) == point_id(destination):
+                self.store_routes({(origin, destination): 0})
+            else:
+                missing.append((origin, destination))
+
+        if batched:
+            batches = self.plan_batches(missing)
+        else:
+            batches = [([origin], [destination]) for origin, destination in missing]
+        if self.requests_remaining is not None:
+            deferred = batches[self.requests_remaining :]
+            batches = batches[: self.requests_remaining]
+            self.requests_remaining -= len(batches)
+            if deferred:
+                routes_left = sum(len(o) * len(d) for o, d in deferred)
+                print(f"API budget reached; {routes_left} routes left for the next run")
+        metrics.increment(
+            "routes.cache_misses", sum(len(o) * len(d) for o, d in batches)
+        )
+
+        with metrics.phase("fetch"):
+            self._fetch_batches(
+                batches, workers, qps, retries, checkpoint_every, checkpoint_interval
+            )
+
+    def _fetch_batches(
+        self,
+        batches: List[Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]],
+        workers: int,
+        qps: float,
+        retries: int,
+        checkpoint_every: int,
+        checkpoint_interval: float,
+    ):
+        rate_limiter = TokenBucket(qps) if qps else None
+        results = fetch_all(
+            self.fetch_matrix,
+            batches,
+            workers=workers,
+            rate_limiter=rate_limiter,
+            retries=retries,
+        )
+        unsaved = 0
+        last_saved = time.monotonic()
+        try:
+            for (origins, destinations), durations, error in results:
+                if error is not None:
+                    print(
+                        f"Error calculating travel time from {origins} to {destinations}: {error}"
+                    )
+                    metrics.increment("routes.errors", len(origins) * len(destinations))
+                    if is_quota_exhausted(error):
+                        print("API quota exhausted; run again later to resume")
+                        break
+                    if is_retryable(error):
+                        continue  # Leave uncached so the next run retries it
+                    durations = {
+                        (origin, destination): float("inf")  # Use infinity for errors
+                        for origin in origins
+                        for destination in destinations
+                    }
+                    self.store_routes(durations, status=STATUS_ERROR)
+                else:
+                    metrics.increment("routes.fetched", len(durations))
+                    for (origin, destination), duration in durations.items():
+                        if duration == float("inf"):
+                            metrics.increment("routes.no_route")
+                            print(
+                                f"No transit route found from {origin} to {destination}"
                             )
-                            element = matrix["rows"][0]["elements"][0]
-                            if "duration" in element:
-                                duration = element["duration"]["value"]
-                                print(
-                                    f"Transit route found from {origin} to {destination}: {duration}"
-                                )
-                            else:
-                                print(
-                                    f"No transit route found from {origin} to {destination}"
-                                )
-                                duration = float("inf")  # Use infinity for no route
-                            self.routes[route_key] = duration
-                        except Exception as e:
+                        else:
                             print(
-                                f"Error calculating travel time from {origin} to {destination}: {e}"
+                                f"Transit route found from {origin} to {destination}: {duration}"
                             )
-                            self.routes[route_key] = float(
-                                "inf"
-                            )  # Use infinity for errors
+                    self.store_routes(durations)
+
+                unsaved += len(durations)
+                if (
+                    unsaved >= checkpoint_every
+                    or time.monotonic() - last_saved >= checkpoint_interval
+                ):
+                    self.checkpoint_routes()
+                    unsaved = 0
+                    last_saved = time.monotonic()
+        finally:
+            results.close()
+            self.save_routes()
 
-        self.save_routes()
+    def store_routes(self, durations: Dict[Tuple, float], status: str = None):
+        """
+        Add fetched travel times, keyed by (origin, destination), to the route
+        store and index, recording when they were fetched and their status.
+
+        By default, routes are recorded as found, or as having no route if
+        their travel time is `inf`.
+        """
+        point_id = self.route_index.coordinates.point_id
+        routes_by_status = {}
+        for (origin, destination), duration in durations.items():
+            ids = (point_id(origin), point_id(destination))
+            self.route_index.set(ids, duration)
+            route_status = status or (
+                STATUS_NO_ROUTE if duration == float("inf") else STATUS_OK
+            )
+            routes_by_status.setdefault(route_status, {})[
+                self.route_index.route_key(*ids)
+            ] = duration
+        fetched_at = time.time()
+        for route_status, routes in routes_by_status.items():
+            self.routes.put_many(routes, fetched_at=fetched_at, status=route_status)
+
+    def checkpoint_routes(self):
+        with metrics.phase("checkpoint"):
+            self.routes.checkpoint()
 
     def save_routes(self):
-        with open(self.routes_file, "w") as f:
-            json.dump(self.routes, f)
+        with metrics.phase("save"):
+            self.routes.save()
 
     def close(self):
-        self.save_routes()
+        self.routes.close()
 
 
 class BestDestinationFinder:
@@ -145,23 +665,44 @@ class BestDestinationFinder:
         config_file: str,
         routes_file: str = "routes.json",
         db_file: str = None,
+        estimate_missing: bool = False,
+        scenario: str = None,
+        geocode_file: str = "geocode.db",
+        objective: str = None,
     ):
-        self.gmaps = googlemaps.Client(key=api_key)
+        self.api_key = api_key
         self.config = self.load_config(config_file)
+        self.scenario = resolve_scenario(scenario, self.config)
+        self.objective = resolve_objective(objective, self.config)
+        self.weights = origin_weights(self.config["origins"])
         self.routes_file = routes_file
-        self.routes = self.load_routes()
         self.db_file = db_file
+        self.geocode_file = geocode_file
+        self.estimate_missing = estimate_missing
+        self.routes = self.load_routes()
+        self._rank_subset = lru_cache(maxsize=1024)(self._rank_subset_uncached)
 
-    def load_routes(self):
-        try:
-            with open(self.routes_file, "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+    @cached_property
+    def gmaps(self):
+        return maps_client(self.api_key)
+
+    def load_routes(self) -> RouteStore:
+        return open_route_store(self.db_file or self.routes_file)
+
+    @cached_property
+    def route_index(self) -> RouteIndex:
+        with metrics.phase("load_routes"):
+            return RouteIndex.from_routes(
+                self.routes, self.scenario.mode, self.scenario.slot
+            )
+
+    @cached_property
+    def estimator(self) -> TravelTimeEstimator:
+        return TravelTimeEstimator(self.route_index)
 
     def load_config(self, config_file: str) -> Dict:
         try:
-            with open(config_file, "r") as f:
+            with metrics.phase("load_config"), open(config_file, "r") as f:
                 return json.load(f)
         except FileNotFoundError:
             raise FileNotFoundError(f"Config file not found: {config_file}")
@@ -172,69 +713,253 @@ class BestDestinationFinder:
     def calculate_travel_times(
         self, origins: List[Tuple[float, float]], destination: Tuple[float, float]
     ) -> List[int]:
+        index = self.route_index
+        dest_id = index.coordinates.point_id(destination)
         travel_times = []
-        for origin in origins:
-            origin_str = f"{origin[0]:.2f},{origin[1]:.2f}"
-            dest_str = f"{destination[0]:.2f},{destination[1]:.2f}"
-            route_key = f"{origin_str}->{dest_str}"
-            if route_key in self.routes:
-                travel_times.append(self.routes[route_key])
-            else:
-                travel_times.append(
-                    1800
-                )  # Use 30 minutes (1800 seconds) as default for missing routes
+        for origin, origin_id in zip(origins, index.coordinates.point_ids(origins)):
+            travel_time = index.get((origin_id, dest_id))
+            if travel_time is None:
+                if self.estimate_missing:
+                    estimates, _ = self.estimator.estimate([origin], [destination])
+                    travel_time = float(estimates[0])
+                else:
+                    # Use 30 minutes (1800 seconds) as default for missing routes
+                    travel_time = 1800
+            travel_times.append(travel_time)
         return travel_times
 
-    def calculate_convenience_score(self, travel_times: List[int]) -> float:
+    def calculate_convenience_score(
+        self, travel_times: List[int], origins: List[Dict] = None
+    ) -> float:
         """
-        Calculate a convenience score based on travel times.
+        Calculate a convenience score based on travel times, under the
+        finder's objective (see `objectives.py`).
 
-        This score is a weighted combination of the average travel time (70% weight)
-        and the maximum travel time (30% weight). This approach balances overall
-        convenience for the group with fairness to the person with the longest journey.
+        By default this score is a weighted combination of the average travel
+        time (70% weight) and the maximum travel time (30% weight). This
+        approach balances overall convenience for the group with fairness to
+        the person with the longest journey.
 
         A lower score indicates a more convenient location.
 
         :param travel_times: List of travel times in seconds
+        :param origins: The origins the travel times are from, counted by
+            their weights (default: everyone counts once)
         :return: Convenience score (lower is better)
         """
-        avg_time = sum(travel_times) / len(travel_times)
-        max_time = max(travel_times)
-        return avg_time * 0.7 + max_time * 0.3
+        times = np.array(travel_times, dtype=np.float64)[:, None]
+        weights = None if origins is None else origin_weights(origins)
+        objective = self.objective
+        scores = evaluate_objectives([objective], times, weights)[objective.name]
+        return float(scores[0])
 
-    def find_best_destinations(self, top_n: int = 5) -> List[Tuple[Dict, float]]:
+    def objective_scores(self, times: np.ndarray, rows=None) -> np.ndarray:
+        """
+        Score every destination (column) of `times` under the finder's
+        objective, weighting each origin (row) as in the config, or as the
+        origins at `rows` if given.
+        """
+        weights = self.weights if rows is None else self.weights[rows]
+        objective = self.objective
+        return evaluate_objectives([objective], times, weights)[objective.name]
+
+    def travel_time_matrix(self) -> TravelTimeMatrix:
+        """
+        Travel times from every origin to every destination in the config.
+
+        Missing routes count as 30 minutes, or if `estimate_missing` is set,
+        are estimated from the routes we do have.
+        """
         origins = self.get_coordinates(self.config["origins"])
         destinations = self.get_coordinates(self.config["destinations"])
+        matrix = TravelTimeMatrix.from_index(self.route_index, origins, destinations)
+        if self.estimate_missing:
+            with metrics.phase("estimate"):
+                matrix.fill_missing(self.estimator, origins, destinations)
+        return matrix
 
-        all_destinations = []
-
-        for i, dest in enumerate(destinations):
-            travel_times = self.calculate_travel_times(origins, dest)
-            score = self.calculate_convenience_score(travel_times)
-            all_destinations.append((self.config["destinations"][i], score))
+    def find_best_destinations(self, top_n: int = 5) -> List[Tuple[Dict, float]]:
+        matrix = self.travel_time_matrix()
+        with metrics.phase("score"):
+            scores = self.objective_scores(matrix.times)
 
         # Sort destinations by score (lower is better) and return top N
-        return sorted(all_destinations, key=lambda x: x[1])[:top_n]
+        return [
+            (self.config["destinations"][i], float(scores[i]))
+            for i in top_n_indices(scores, top_n)
+        ]
+
+    def scores(self, origin_names: List[str] = None) -> np.ndarray:
+        """
+        The convenience score of every destination in the config, counting
+        only the named origins if given.
+        """
+        if origin_names:
+            with metrics.phase("score"):
+                return self.subset_scores(self.origin_ids(origin_names))
+        times = self.travel_time_matrix().times
+        with metrics.phase("score"):
+            return self.objective_scores(times)
+
+    def subset_scores(self, origin_ids: frozenset) -> np.ndarray:
+        """
+        The score of every destination counting only the origins at
+        `origin_ids` (see `objectives.subset_objective_scores`).
+        """
+        return subset_objective_scores(
+            self.objective, self.subset_scorer, self.weights, origin_ids
+        )
 
-    def get_address(self, lat_lng: Tuple[float, float]) -> str:
-        rounded_lat_lng = (round(lat_lng[0], 2), round(lat_lng[1], 2))
-        result = self.gmaps.reverse_geocode(rounded_lat_lng)
+    def find_best_venue_set(
+        self, k: int, origin_names: List[str] = None
+    ) -> Tuple[List[Dict], List[List[Dict]], bool]:
+        """
+        The `k` destinations that minimise the total travel time when each
+        person goes to whichever of them is quickest (e.g. a north and a
+        south meeting of a split off-site), counting only the named origins
+        if given.
+
+        Every person counts once, whatever their weight, and the finder's
+        objective isn't used: the total travel time is what's minimised.
+
+        Returns the destinations, the origins going to each, and whether
+        the set is proven optimal (see `facility.solve_k_median`).
+        """
+        times = self.travel_time_matrix().times
+        origins = self.config["origins"]
+        if origin_names:
+            rows = sorted(self.origin_ids(origin_names))
+            times = times[rows]
+            origins = [origins[i] for i in rows]
+        with metrics.phase("score"):
+            venues, assignment, optimal = solve_k_median(times, k)
+        return (
+            [self.config["destinations"][venue] for venue in venues],
+            [
+                [origin for origin, a in zip(origins, assignment) if a == position]
+                for position in range(len(venues))
+            ],
+            optimal,
+        )
+
+    def missing_routes(self, origin_names: List[str] = None) -> np.ndarray:
+        """
+        Which routes from each origin (row) to each destination (column) in
+        the config are neither cached nor estimated, counting only the named
+        origins if given.
+        """
+        missing = self.travel_time_matrix().missing
+        if self.estimate_missing:
+            missing = np.zeros_like(missing)
+        if origin_names:
+            return missing[sorted(self.origin_ids(origin_names))]
+        return missing
+
+    @cached_property
+    def subset_scorer(self) -> SubsetScorer:
+        return SubsetScorer(self.travel_time_matrix().times)
+
+    def origin_ids(self, origin_names: List[str]) -> frozenset:
+        """
+        The indices in the config of the named origins.
+        """
+        ids = {origin["name"]: i for i, origin in enumerate(self.config["origins"])}
+        unknown = [name for name in origin_names if name not in ids]
+        if unknown:
+            raise ValueError(f"Unknown origins: {', '.join(unknown)}")
+        return frozenset(ids[name] for name in origin_names)
+
+    def rank_for(
+        self, origin_names: List[str], top_n: int = 5
+    ) -> List[Tuple[Dict, float]]:
+        """
+        Like `find_best_destinations`, but only counting the named origins
+        (e.g. the members of one project team).
+
+        Answers come from precomputed per-destination aggregates, and the
+        most recent queries are cached, so repeated queries are cheap.
+        """
+        ranking = self._rank_subset(self.origin_ids(origin_names), top_n)
+        return [(self.config["destinations"][i], score) for i, score in ranking]
+
+    def _rank_subset_uncached(
+        self, origin_ids: frozenset, top_n: int
+    ) -> Tuple[Tuple[int, float], ...]:
+        scores = self.subset_scores(origin_ids)
+        return tuple((int(i), float(scores[i])) for i in top_n_indices(scores, top_n))
+
+    @cached_property
+    def geocode_cache(self) -> GeocodeCache:
+        return GeocodeCache(self.geocode_file)
+
+    def reverse_geocode(self, lat_lng: Tuple[float, float]) -> Optional[str]:
+        """
+        The address of a point, or None if Google has none for it.
+        """
+        metrics.increment("api.reverse_geocode.requests")
+        try:
+            with metrics.timed("api.reverse_geocode"):
+                result = self.gmaps.reverse_geocode(lat_lng)
+        except Exception:
+            metrics.increment("api.reverse_geocode.errors")
+            raise
         if result:
             return result[0]["formatted_address"]
-        return "Address not found"
+        return None
+
+    def get_address(self, lat_lng: Tuple[float, float]) -> Optional[str]:
+        return self.get_addresses([lat_lng])[0]
+
+    def get_addresses(
+        self, points: List[Tuple[float, float]], workers: int = 8
+    ) -> List[Optional[str]]:
+        """
+        The address of each (lat, lon) point, to the nearest 0.01 degree.
 
-    def plot_travel_times_histogram(self, location: Dict):
+        Addresses are looked up in the geocode cache first; the rest are
+        reverse geocoded using up to `workers` concurrent requests, and
+        cached. Points whose lookup fails or finds no address are None, and
+        are tried again next time.
+        """
+        keys = [coordinate_key(point) for point in points]
+        addresses = self.geocode_cache.get_many(keys)
+        misses = [key for key in dict.fromkeys(keys) if key not in addresses]
+        metrics.increment("geocode.cache_hits", len(addresses))
+        metrics.increment("geocode.cache_misses", len(misses))
+
+        found = {}
+        jobs = [(parse_coordinate_key(key),) for key in misses]
+        for (lat_lng,), address, error in fetch_all(
+            self.reverse_geocode, jobs, workers=workers
+        ):
+            if error is not None:
+                print(f"Error looking up the address of {lat_lng}: {error}")
+                continue
+            if address is None:
+                print(f"No address found for {lat_lng}")
+                continue
+            found[coordinate_key(lat_lng)] = address
+        if found:
+            self.geocode_cache.put_many(found)
+            self.geocode_cache.save()
+        addresses.update(found)
+        return [addresses.get(key) for key in keys]
+
+    def plot_travel_times_histogram(self, location: Dict, origins: List[Dict] = None):
         """
         Plot travel times for a given location as a horizontal histogram using Unicode characters.
 
         :param location: Dictionary containing location information (lat, lon, name)
+        :param origins: Origins to plot travel times from (default: all of them)
         """
-        origins = self.get_coordinates(self.config["origins"])
+        origins = self.get_coordinates(
+            self.config["origins"] if origins is None else origins
+        )
         destination = (location["lat"], location["lon"])
         travel_times = self.calculate_travel_times(origins, destination)
 
         # Convert travel times from seconds to minutes
-        travel_times_minutes = [t // 60 for t in travel_times if t != float("inf")]
+        travel_times_minutes = [int(t // 60) for t in travel_times if t != float("inf")]
 
         if not travel_times_minutes:
             print(f"No valid travel times for {location['name']}")
@@ -277,41 +1002,178 @@ class BestDestinationFinder:
             )
 
     def close(self):
-        pass  # No need to save routes in this class
+        # No need to save routes in this class, only any addresses looked up
+        if "geocode_cache" in self.__dict__:
+            self.geocode_cache.close()
+
+
+def annotate_destinations(
+    api_key: str,
+    config_file: str,
+    geocode_file: str = "geocode.db",
+    workers: int = 8,
+) -> List[Dict]:
+    """
+    Look up the address of every destination in the config, add it to each
+    as "address" and save the config. Addresses come from the geocode
+    cache where possible, so running this again is cheap. Destinations
+    whose address isn't found are left as they were.
+
+    Returns the annotated destinations.
+    """
+    finder = BestDestinationFinder(api_key, config_file, geocode_file=geocode_file)
+    destinations = finder.config["destinations"]
+    addresses = finder.get_addresses(
+        finder.get_coordinates(destinations), workers=workers
+    )
+    finder.close()
+    for destination, address in zip(destinations, addresses):
+        if address is not None:
+            destination["address"] = address
+    with open(config_file, "w") as f:
+        json.dump(finder.config, f, indent=2)
+    return destinations
+
+
+def best_of_scenarios(
+    finders: List[BestDestinationFinder],
+    top_n: int = 5,
+    origin_names: List[str] = None,
+) -> List[Tuple[Dict, float, Scenario]]:
+    """
+    Rank destinations by their best score in any of several scenarios (one
+    finder per scenario, all with the same config), e.g. to choose between
+    a morning and an afternoon meeting for each venue.
+
+    Returns (destination, score, scenario) for the `top_n` best, where
+    `scenario` is the one giving that destination its best score.
+
+    Unless missing routes are being estimated, a scenario only competes for
+    a destination if it has every route to it, so a scenario we've barely
+    fetched can't win on the 30 minute default.
+    """
+    scores = np.vstack([finder.scores(origin_names) for finder in finders])
+    incomplete = np.vstack(
+        [finder.missing_routes(origin_names).any(axis=0) for finder in finders]
+    )
+    # Where no scenario is complete, fall back to comparing them all
+    competing = ~incomplete | incomplete.all(axis=0)
+    best = np.argmin(np.where(competing, scores, np.inf), axis=0)
+    best_scores = scores[best, np.arange(scores.shape[1])]
+    destinations = finders[0].config["destinations"]
+    return [
+        (destinations[i], float(best_scores[i]), finders[best[i]].scenario)
+        for i in top_n_indices(best_scores, top_n)
+    ]
+
+
+def estimate_missing_routes(
+    config: Dict, routes: Dict[str, float]
+) -> Tuple[Dict[str, int], Dict[str, bool]]:
+    """
+    Estimated travel times, keyed by route key, for every origin/destination
+    pair in the config that isn't in `routes`, and whether each estimate is
+    low confidence (see `TravelTimeEstimator.estimate`).
+    """
+    index = RouteIndex.from_routes(routes)
+    coordinates = index.coordinates
+    origins = [(loc["lat"], loc["lon"]) for loc in config["origins"]]
+    destinations = [(loc["lat"], loc["lon"]) for loc in config["destinations"]]
+    missing = {}
+    for origin in origins:
+        for destination in destinations:
+            ids = (coordinates.point_id(origin), coordinates.point_id(destination))
+            if ids not in index:
+                missing[index.route_key(*ids)] = (origin, destination)
+    if not missing:
+        return {}, {}
+    estimates, confident = TravelTimeEstimator(index).estimate(
+        [origin for origin, _ in missing.values()],
+        [destination for _, destination in missing.values()],
+    )
+    return (
+        {key: int(estimate) for key, estimate in zip(missing, estimates)},
+        {key: not bool(sure) for key, sure in zip(missing, confident)},
+    )
 
 
 def build_embedded_html(
-    config_file: str, routes_file: str, output_file: str = "location_finder.html"
+    config_file: str,
+    routes_file: str,
+    output_file: str = "location_finder.html",
+    estimate_missing: bool = False,
+    compact: bool = False,
+    compress: bool = True,
+    precompute: bool = False,
+    objective: str = None,
 ):
     """
     Build a self-contained HTML file with embedded JSON data.
 
     :param config_file: Path to the locations config JSON file
-    :param routes_file: Path to the routes JSON file
+    :param routes_file: Path to the route store (routes.json or an SQLite .db)
     :param output_file: Path to the output HTML file
+    :param estimate_missing: Embed estimates for routes we haven't fetched,
+        rather than letting the page assume 30 minutes, along with which
+        routes are estimated so the page can say so
+    :param compact: Embed routes as a packed matrix of minutes (see
+        `pack_route_matrix`) rather than as JSON
+    :param compress: Deflate the packed matrix, if `compact`
+    :param precompute: Also embed tables from which the page scores
+        destinations incrementally (see `ranking_tables`)
+    :param objective: The objective the page ranks by at first; it can
+        switch to any of the others (see `objectives.py`)
     """
-    with open(config_file, "r") as f:
+    with metrics.phase("load_config"), open(config_file, "r") as f:
         config_data = json.load(f)
 
-    with open(routes_file, "r") as f:
-        routes_data = json.load(f)
+    if not os.path.exists(routes_file):
+        raise FileNotFoundError(f"Routes file not found: {routes_file}")
+    with metrics.phase("load_routes"), open_route_store(routes_file) as routes:
+        routes_data = dict(routes.items())
+    # Route key -> whether the estimate is low confidence
+    estimated = {}
+    if estimate_missing:
+        with metrics.phase("estimate"):
+            estimates, estimated = estimate_missing_routes(config_data, routes_data)
+        routes_data.update(estimates)
 
     with open("index.html", "r") as f:
         html_template = f.read()
 
     # Encode JSON data as base64
-    config_base64 = base64.b64encode(json.dumps(config_data).encode()).decode()
-    routes_base64 = base64.b64encode(json.dumps(routes_data).encode()).decode()
+    with metrics.phase("encode"):
+        config_base64 = base64.b64encode(json.dumps(config_data).encode()).decode()
+        if compact:
+            payload = pack_route_matrix(config_data, routes_data, compress=compress)
+            load_routes = f"routes = await decodeRouteMatrix({json.dumps(payload)});"
+        else:
+            routes_json = json.dumps(routes_data).encode()
+            routes_base64 = base64.b64encode(routes_json).decode()
+            load_routes = f'routes = JSON.parse(atob("{routes_base64}"));'
+        if precompute:
+            tables = ranking_tables(config_data, routes_data)
+            load_routes += f"\n            initRanking({json.dumps(tables)});"
+    # The page scores destinations with the same definitions as the CLI
+    default = resolve_objective(objective, config_data)
+    objectives = [default] + [
+        other
+        for other in load_objectives(config_data).values()
+        if other.name != default.name
+    ]
+    objectives_json = json.dumps([other.to_json() for other in objectives])
 
     # Replace the loadData function in the HTML template
     embedded_html = html_template.replace(
         "async function loadData() {",
         f"""async function loadData() {{
             const configBase64 = "{config_base64}";
-            const routesBase64 = "{routes_base64}";
             config = JSON.parse(atob(configBase64));
-            routes = JSON.parse(atob(routesBase64));
+            {load_routes}
+            estimatedRoutes = {json.dumps(estimated)};
+            objectives = {objectives_json};
             populateOriginSelect();
+            populateObjectiveSelect();
         """,
     )
 
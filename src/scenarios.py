@@ -0,0 +1,129 @@
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from route_store import DEFAULT_MODE, DEFAULT_SLOT
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# Distance Matrix request options for each travel mode we support
+MODES = {
+    "transit": {"mode": "transit", "transit_mode": "bus|subway|train"},
+    "rail": {"mode": "transit", "transit_mode": "rail"},  # Train, tram and subway
+    "driving": {"mode": "driving"},
+}
+
+SLOT_PATTERN = re.compile(r"^(mon|tue|wed|thu|fri|sat|sun)-([01]\d|2[0-3]):([0-5]\d)$")
+
+
+class Scenario:
+    """
+    The circumstances a route is fetched for: a travel mode (see `MODES`)
+    and a time slot such as "thu-09:00", meaning arrive by 09:00 next
+    Thursday.
+
+    Routes are cached per scenario. If `ttl_days` is set, routes fetched
+    longer ago than that are stale and get fetched again; otherwise they
+    never expire.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        mode: str = DEFAULT_MODE,
+        slot: str = DEFAULT_SLOT,
+        ttl_days: Optional[float] = None,
+    ):
+        if mode not in MODES:
+            raise ValueError(
+                f"Unknown travel mode {mode!r} (expected one of {', '.join(MODES)})"
+            )
+        if not SLOT_PATTERN.match(slot):
+            raise ValueError(f"Invalid time slot {slot!r} (expected e.g. 'thu-14:00')")
+        self.name = name
+        self.mode = mode
+        self.slot = slot
+        self.ttl_days = ttl_days
+
+    def __repr__(self) -> str:
+        return f"Scenario({self.name!r}, {self.mode!r}, {self.slot!r})"
+
+    def arrival_time(self, now: Optional[datetime] = None) -> datetime:
+        """
+        The next time on or after today matching the slot.
+        """
+        now = now or datetime.now()
+        day, time = self.slot.split("-")
+        hour, minute = (int(part) for part in time.split(":"))
+        days_ahead = (DAYS.index(day) - now.weekday() + 7) % 7
+        return (now + timedelta(days=days_ahead)).replace(
+            hour=hour, minute=minute, second=0, microsecond=0
+        )
+
+    def request_options(self, arrival_time: datetime) -> Dict:
+        """
+        Keyword arguments for a Distance Matrix request in this scenario.
+        """
+        options = dict(MODES[self.mode])
+        if self.mode == "driving":
+            # Driving directions only take a departure time; leaving at the
+            # slot time gets typical traffic for that time of day
+            options["departure_time"] = arrival_time
+        else:
+            options["arrival_time"] = arrival_time
+        return options
+
+    def is_stale(
+        self,
+        fetched_at: Optional[float],
+        now: float,
+        max_age_days: Optional[float] = None,
+    ) -> bool:
+        """
+        Whether a route fetched at `fetched_at` (a Unix timestamp) is older
+        than `max_age_days`, or by default the scenario's TTL. A route with
+        no recorded fetch time (cached before fetch times were recorded)
+        could be any age, so it's stale whenever there is a limit.
+        """
+        if max_age_days is None:
+            max_age_days = self.ttl_days
+        if max_age_days is None:
+            return False
+        if fetched_at is None:
+            return True
+        return now - fetched_at > max_age_days * 24 * 60 * 60
+
+
+DEFAULT_SCENARIO = Scenario("default")
+
+
+def load_scenarios(config: Dict) -> Dict[str, Scenario]:
+    """
+    The scenarios defined in the config's optional "scenarios" section,
+    e.g. {"morning": {"mode": "transit", "slot": "thu-09:00", "ttl_days": 30}},
+    plus "default" (public transport arriving at 14:00 on Thursday) unless
+    the config redefines it.
+    """
+    scenarios = {DEFAULT_SCENARIO.name: DEFAULT_SCENARIO}
+    for name, options in config.get("scenarios", {}).items():
+        scenarios[name] = Scenario(name, **options)
+    return scenarios
+
+
+def resolve_scenario(spec: Optional[str], config: Dict) -> Scenario:
+    """
+    The scenario named `spec` in the config, or an ad hoc one given as
+    "mode/slot" (e.g. "driving/mon-09:30"). None means the default.
+    """
+    scenarios = load_scenarios(config)
+    if spec is None:
+        return scenarios[DEFAULT_SCENARIO.name]
+    if spec in scenarios:
+        return scenarios[spec]
+    if "/" in spec:
+        mode, slot = spec.split("/", 1)
+        return Scenario(spec, mode, slot)
+    raise ValueError(
+        f"Unknown scenario {spec!r} (expected one of {', '.join(scenarios)},"
+        " or mode/slot)"
+    )
@@ -0,0 +1,184 @@
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+
+from coordinates import RouteIndex, coordinate_key
+from route_store import RouteStore
+
+# Travel time assumed for any route we haven't fetched yet
+MISSING_ROUTE_SECONDS = 1800
+
+# Weights of the average and maximum travel time in the convenience score
+AVERAGE_WEIGHT = 0.7
+MAXIMUM_WEIGHT = 0.3
+
+
+class TravelTimeMatrix:
+    """
+    Travel times in seconds from every origin (row) to every destination
+    (column), built once from the route store so that scoring is a handful
+    of vectorised operations rather than a dict lookup per pair.
+
+    Routes with no transit connection are `inf`. Routes we haven't fetched
+    are `MISSING_ROUTE_SECONDS`, and flagged in `missing`, unless they've
+    been filled in by `fill_missing`.
+    """
+
+    def __init__(self, times: np.ndarray, missing: np.ndarray):
+        self.times = times
+        self.missing = missing
+        self.low_confidence = np.zeros_like(missing)
+
+    def fill_missing(
+        self,
+        estimator,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+    ):
+        """
+        Replace the default travel time of every missing route with an
+        estimate, flagging those the estimator isn't confident about in
+        `low_confidence`.
+        """
+        rows, columns = np.nonzero(self.missing)
+        if len(rows) == 0:
+            return
+        estimates, confident = estimator.estimate(
+            np.asarray(origins)[rows], np.asarray(destinations)[columns]
+        )
+        self.times[rows, columns] = estimates
+        self.low_confidence[rows, columns] = ~confident
+
+    @classmethod
+    def from_routes(
+        cls,
+        routes: Mapping[str, float],
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+        default: float = MISSING_ROUTE_SECONDS,
+    ) -> "TravelTimeMatrix":
+        origin_keys = [coordinate_key(origin) for origin in origins]
+        dest_keys = [coordinate_key(destination) for destination in destinations]
+        keys = [f"{o}->{d}" for o in origin_keys for d in dest_keys]
+        if isinstance(routes, RouteStore):
+            routes = routes.get_many(keys)
+
+        times = np.fromiter(
+            (routes.get(key, np.nan) for key in keys),
+            dtype=np.float32,
+            count=len(keys),
+        ).reshape(len(origins), len(destinations))
+        missing = np.isnan(times)
+        times[missing] = default
+        return cls(times, missing)
+
+    @classmethod
+    def from_index(
+        cls,
+        index: RouteIndex,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+        default: float = MISSING_ROUTE_SECONDS,
+    ) -> "TravelTimeMatrix":
+        times = index.lookup_matrix(
+            index.coordinates.point_ids(origins),
+            index.coordinates.point_ids(destinations),
+        )
+        missing = np.isnan(times)
+        times[missing] = default
+        return cls(times, missing)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.times.shape
+
+
+def convenience_scores(times: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Score every destination (column) of an origins x destinations matrix
+    in one pass. See `BestDestinationFinder.calculate_convenience_score`.
+
+    Sums are accumulated in float64, so scores match the pure Python
+    calculation exactly.
+    """
+    times = times.astype(np.float64)
+    avg_time = times.sum(axis=0) / times.shape[0]
+    max_time = times.max(axis=0)
+    return {
+        "score": avg_time * AVERAGE_WEIGHT + max_time * MAXIMUM_WEIGHT,
+        "avg_time": avg_time,
+        "max_time": max_time,
+    }
+
+
+def top_n_indices(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    Indices of the `top_n` lowest scores, best first.
+
+    Ties are broken by position, as a stable sort of every score would, so
+    rankings are identical to sorting the full list.
+    """
+    if top_n <= 0:
+        return np.array([], dtype=np.intp)
+    if top_n >= len(scores):
+        return np.argsort(scores, kind="stable")
+    threshold = scores[np.argpartition(scores, top_n - 1)[top_n - 1]]
+    # Everything tied with the n-th score is a candidate, in original order
+    candidates = np.flatnonzero(scores <= threshold)
+    order = candidates[np.argsort(scores[candidates], kind="stable")]
+    return order[:top_n]
+
+
+class SubsetScorer:
+    """
+    Scores every destination for any subset of the origins in a matrix.
+
+    Travel times are held per destination (one contiguous row each), along
+    with precomputed per-destination totals and each destination's origins
+    sorted by travel time. Large subsets are then scored from the totals
+    minus the few excluded origins, and their maximum found by walking the
+    sorted order, so a query never costs more than half the matrix.
+    """
+
+    def __init__(self, times: np.ndarray):
+        columns = np.ascontiguousarray(times.T, dtype=np.float64)
+        reachable = np.isfinite(columns)
+        self.times = columns
+        self.finite_times = np.where(reachable, columns, 0.0)
+        self.unreachable = ~reachable
+        self.total = self.finite_times.sum(axis=1)
+        self.total_unreachable = self.unreachable.sum(axis=1)
+        self.slowest_first = np.argsort(-columns, axis=1, kind="stable")
+
+    def scores(self, origin_ids: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Like `convenience_scores`, for the origins at `origin_ids` only.
+        """
+        origin_ids = np.unique(origin_ids)
+        n_destinations, n_origins = self.times.shape
+        if len(origin_ids) == 0:
+            raise ValueError("At least one origin is needed to score destinations")
+
+        if len(origin_ids) <= n_origins // 2:
+            finite_sum = self.finite_times[:, origin_ids].sum(axis=1)
+            unreachable = self.unreachable[:, origin_ids].sum(axis=1)
+            max_time = self.times[:, origin_ids].max(axis=1)
+        else:
+            excluded = np.setdiff1d(np.arange(n_origins), origin_ids)
+            finite_sum = self.total - self.finite_times[:, excluded].sum(axis=1)
+            unreachable = self.total_unreachable - self.unreachable[:, excluded].sum(
+                axis=1
+            )
+            selected = np.zeros(n_origins, dtype=bool)
+            selected[origin_ids] = True
+            # The slowest selected origin is the first one in each row's order
+            first = selected[self.slowest_first].argmax(axis=1)
+            rows = np.arange(n_destinations)
+            max_time = self.times[rows, self.slowest_first[rows, first]]
+
+        avg_time = np.where(unreachable > 0, np.inf, finite_sum / len(origin_ids))
+        return {
+            "score": avg_time * AVERAGE_WEIGHT + max_time * MAXIMUM_WEIGHT,
+            "avg_time": avg_time,
+            "max_time": max_time,
+        }
@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from coordinates import RouteIndex
+from estimator import TravelTimeEstimator
+from metrics import metrics
+from objectives import (
+    Objective,
+    origin_weights,
+    resolve_objective,
+    subset_objective_scores,
+)
+from route_store import open_route_store
+from scenarios import Scenario, resolve_scenario
+from scoring import SubsetScorer, TravelTimeMatrix, top_n_indices
+
+# Files whose (modification time, size) tell us a route store has changed
+Signature = Tuple[Tuple[int, int], ...]
+
+
+def file_signature(*paths: str) -> Signature:
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append((0, 0))
+        else:
+            signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class Rankings:
+    """
+    Everything needed to rank destinations for a config and set of routes,
+    held in memory: the config, the routes of one scenario, the origins'
+    weights and a `SubsetScorer` over the travel time matrix. Never changed
+    once built, so request threads can share it while a replacement is
+    loaded.
+
+    Destinations are scored under `objective` (see `objectives.py`) unless
+    a query names another, as `find-locations` scores them.
+    """
+
+    def __init__(
+        self,
+        config: Dict,
+        index: RouteIndex,
+        estimate_missing: bool = False,
+        objective: Optional[str] = None,
+    ):
+        self.config = config
+        self.index = index
+        self.objective = resolve_objective(objective, config)
+        self.weights = origin_weights(config["origins"])
+        points = [
+            (round(loc["lat"], 4), round(loc["lon"], 4))
+            for loc in config["origins"] + config["destinations"]
+        ]
+        n_origins = len(config["origins"])
+        origins, destinations = points[:n_origins], points[n_origins:]
+        matrix = TravelTimeMatrix.from_index(index, origins, destinations)
+        if estimate_missing:
+            matrix.fill_missing(TravelTimeEstimator(index), origins, destinations)
+        self.scorer = SubsetScorer(matrix.times)
+        self.origin_ids_by_name = {
+            origin["name"]: i for i, origin in enumerate(config["origins"])
+        }
+        self.loaded_at = time.time()
+        self._rank = lru_cache(maxsize=1024)(self._rank_uncached)
+
+    def origin_ids(self, origin_names: List[str]) -> frozenset:
+        unknown = [name for name in origin_names if name not in self.origin_ids_by_name]
+        if unknown:
+            raise ValueError(f"Unknown origins: {', '.join(unknown)}")
+        return frozenset(self.origin_ids_by_name[name] for name in origin_names)
+
+    def resolve_objective(self, name: Optional[str] = None) -> Objective:
+        if name is None:
+            return self.objective
+        return resolve_objective(name, self.config)
+
+    def rank(
+        self,
+        origin_names: Optional[List[str]] = None,
+        top_n: int = 5,
+        objective: Optional[str] = None,
+    ) -> List[Tuple[Dict, float]]:
+        """
+        The `top_n` best destinations and their scores for the named origins,
+        or everyone if none are named, under the named objective or the
+        default one.
+        """
+        if origin_names:
+            origin_ids = self.origin_ids(origin_names)
+        else:
+            origin_ids = frozenset(range(len(self.config["origins"])))
+        objective = self.resolve_objective(objective)
+        ranking = self._rank(origin_ids, top_n, objective.name)
+        return [(self.config["destinations"][i], score) for i, score in ranking]
+
+    def _rank_uncached(
+        self, origin_ids: frozenset, top_n: int, objective_name: str
+    ) -> Tuple[Tuple[int, float], ...]:
+        scores = subset_objective_scores(
+            self.resolve_objective(objective_name),
+            self.scorer,
+            self.weights,
+            origin_ids,
+        )
+        return tuple((int(i), float(scores[i])) for i in top_n_indices(scores, top_n))
+
+
+class RankingService:
+    """
+    Keeps `Rankings` for a config and route store up to date.
+
+    `reload_if_changed` checks whether either file has changed since it was
+    last loaded. A changed route store is read again in full, but if only
+    the config changed the routes already in memory are reused. The new
+    rankings are built before they replace the old ones, so queries are
+    never blocked by a reload.
+    """
+
+    def __init__(
+        self,
+        config_file: str,
+        routes_file: str = "routes.json",
+        scenario: Optional[str] = None,
+        estimate_missing: bool = False,
+        objective: Optional[str] = None,
+    ):
+        self.config_file = config_file
+        self.routes_file = routes_file
+        self.scenario_spec = scenario
+        self.estimate_missing = estimate_missing
+        self.objective = objective
+        self.lock = threading.Lock()
+        self.config_signature = None
+        self.routes_signature = None
+        self.scenario: Optional[Scenario] = None
+        self.rankings: Optional[Rankings] = None
+        self.reloads = 0
+        self.reload_if_changed()
+
+    def routes_signature_now(self) -> Signature:
+        # SQLite may commit to a write-ahead log rather than the database
+        return file_signature(self.routes_file, f"{self.routes_file}-wal")
+
+    def load_config(self) -> Dict:
+        with metrics.phase("load_config"), open(self.config_file, "r") as f:
+            return json.load(f)
+
+    def load_index(self, scenario: Scenario) -> RouteIndex:
+        with metrics.phase("load_routes"):
+            with open_route_store(self.routes_file) as routes:
+                return RouteIndex.from_routes(routes, scenario.mode, scenario.slot)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload whatever has changed on disk. Returns whether anything did.
+        """
+        with self.lock:
+            config_signature = file_signature(self.config_file)
+            routes_signature = self.routes_signature_now()
+            config_changed = config_signature != self.config_signature
+            routes_changed = routes_signature != self.routes_signature
+            if not (config_changed or routes_changed):
+                return False
+
+            config = self.load_config()
+            scenario = resolve_scenario(self.scenario_spec, config)
+            if (
+                routes_changed
+                or self.rankings is None
+                or (scenario.mode, scenario.slot)
+                != (self.scenario.mode, self.scenario.slot)
+            ):
+                index = self.load_index(scenario)
+            else:
+                index = self.rankings.index
+            self.rankings = Rankings(
+                config, index, self.estimate_missing, self.objective
+            )
+            self.scenario = scenario
+            self.config_signature = config_signature
+            self.routes_signature = routes_signature
+            self.reloads += 1
+            return True
+
+    def watch(self, interval: float = 2.0) -> threading.Thread:
+        """
+        Check for changes every `interval` seconds in a background thread.
+        A reload that fails (e.g. the config is mid-edit) keeps the
+        current rankings and is tried again next time.
+        """
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.reload_if_changed():
+                        print(f"Reloaded {self.config_file} and {self.routes_file}")
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error reloading, keeping previous rankings: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def _score(score: float) -> Optional[float]:
+    # JSON has no infinity; a destination someone can't reach has no score
+    return score if np.isfinite(score) else None
+
+
+class RankingRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /rank?origins=Name,Name&top=N&objective=name ranks destinations
+    for the named origins (everyone if none are given) under the named
+    objective (the service's default if none is given). GET /health
+    describes what's loaded.
+    """
+
+    service: RankingService
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/rank":
+            self.rank(query)
+        elif url.path == "/health":
+            rankings = self.service.rankings
+            self.send_json(
+                200,
+                {
+                    "status": "ok",
+                    "scenario": self.service.scenario.name,
+                    "origins": len(rankings.config["origins"]),
+                    "destinations": len(rankings.config["destinations"]),
+                    "routes": len(rankings.index),
+                    "loaded_at": rankings.loaded_at,
+                    "reloads": self.service.reloads,
+                },
+            )
+        else:
+            self.send_json(404, {"error": f"Not found: {url.path}"})
+
+    def rank(self, query: Dict[str, List[str]]):
+        origin_names = [
+            name.strip()
+            for value in query.get("origins", [])
+            for name in value.split(",")
+            if name.strip()
+        ]
+        try:
+            top_n = int(query.get("top", ["5"])[0])
+            if top_n < 1:
+                raise ValueError
+        except ValueError:
+            self.send_json(400, {"error": "top must be a positive integer"})
+            return
+
+        objective = query.get("objective", [None])[0]
+
+        rankings = self.service.rankings
+        try:
+            with metrics.timed("serve.rank"):
+                objective = rankings.resolve_objective(objective)
+                ranking = rankings.rank(origin_names, top_n, objective.name)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(
+            200,
+            {
+                "origins": origin_names or None,
+                "objective": objective.name,
+                "destinations": [
+                    {**destination, "score": _score(score)}
+                    for destination, score in ranking
+                ],
+            },
+        )
+
+    def send_json(self, status: int, body: Dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Logging every request would cost more than answering it
+        pass
+
+
+def make_server(
+    service: RankingService, host: str = "127.0.0.1", port: int = 8000
+) -> ThreadingHTTPServer:
+    handler = type("Handler", (RankingRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
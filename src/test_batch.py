@@ -0,0 +1,155 @@
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+
+from batch import batch_rank, load_teams
+from route_store import open_route_store
+from runner import BestDestinationFinder
+
+CONFIG = {
+    "origins": [
+        {"name": "Alex", "lat": 51.752, "lon": -1.2577},
+        {"name": "Sam", "lat": 52.2053, "lon": 0.1218},
+        {"name": "Jo", "lat": 52.4862, "lon": -1.8904, "weight": 2},
+    ],
+    "destinations": [
+        {"name": "Milton Keynes", "lat": 52.0406, "lon": -0.7594},
+        {"name": "Oxford", "lat": 51.752, "lon": -1.2577},
+        {"name": "Birmingham", "lat": 52.4862, "lon": -1.8904},
+    ],
+}
+
+ROUTES = {
+    "51.75,-1.26->52.04,-0.76": 3600,
+    "51.75,-1.26->51.75,-1.26": 0,
+    "51.75,-1.26->52.49,-1.89": 4800,
+    "52.21,0.12->52.04,-0.76": 3000,
+    "52.21,0.12->51.75,-1.26": 6000,
+    "52.21,0.12->52.49,-1.89": float("inf"),
+    "52.49,-1.89->52.04,-0.76": 4000,
+    "52.49,-1.89->51.75,-1.26": 5000,
+    "52.49,-1.89->52.49,-1.89": 0,
+}
+
+TEAMS = [
+    {"name": "Analysts", "origins": ["Alex", "Sam"]},
+    {"name": "Everyone", "origins": ["Alex", "Sam", "Jo"], "objective": "max"},
+    {
+        "name": "Visitors",
+        "origins": ["Alex", {"name": "Guest", "lat": 52.2053, "lon": 0.1218}],
+        "destinations": ["Oxford", {"name": "MK", "lat": 52.0406, "lon": -0.7594}],
+        "top": 1,
+    },
+    {"name": "Broken", "origins": ["Alex", "Nobody"]},
+    {
+        "name": "Remote",
+        "origins": [{"name": "Lurker", "lat": 53.0, "lon": -2.0, "weight": 0}],
+    },
+    {"name": "Nothing", "origins": ["Alex"], "top": 0},
+]
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "config.json").write_text(json.dumps(CONFIG))
+    routes = open_route_store(str(tmp_path / "routes.db"))
+    routes.put_many(ROUTES)
+    routes.close()
+    with open(tmp_path / "teams.jsonl", "w") as f:
+        for team in TEAMS:
+            f.write(json.dumps(team) + "\n")
+    return tmp_path
+
+
+def run(files, workers):
+    output = io.StringIO()
+    counts = batch_rank(
+        str(files / "config.json"),
+        str(files / "routes.db"),
+        str(files / "teams.jsonl"),
+        output,
+        workers=workers,
+    )
+    return counts, [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_batch_rank(files):
+    counts, results = run(files, workers=1)
+
+    assert counts == {"ranked": 3, "failed": 3}
+    assert [result["team"] for result in results] == [
+        "Analysts",
+        "Everyone",
+        "Visitors",
+        "Broken",
+        "Remote",
+        "Nothing",
+    ]
+    analysts, everyone, visitors, broken, remote, nothing = results
+    # Milton Keynes: 0.7 * 3300 + 0.3 * 3600; Birmingham is unreachable
+    assert [d["name"] for d in analysts["destinations"]] == [
+        "Milton Keynes",
+        "Oxford",
+        "Birmingham",
+    ]
+    assert analysts["destinations"][0]["score"] == pytest.approx(3390)
+    assert analysts["destinations"][2]["score"] is None
+    assert everyone["objective"] == "max"
+    assert everyone["destinations"][0]["score"] == 4000
+    # The guest is at Sam's house, and MK is Milton Keynes
+    assert visitors["destinations"] == [{**CONFIG["destinations"][0], "score": 3390}]
+    assert broken == {"team": "Broken", "error": "Unknown origin: Nobody"}
+    assert "positive weight" in remote["error"]
+    assert "top" in nothing["error"]
+
+
+def test_batch_rank_matches_find_locations(files):
+    _, results = run(files, workers=1)
+    with patch.object(BestDestinationFinder, "load_config", return_value=CONFIG):
+        finder = BestDestinationFinder(None, "config.json", str(files / "routes.db"))
+
+    expected = finder.rank_for(["Alex", "Sam"], 5)
+
+    assert [(d["name"], d["score"]) for d in results[0]["destinations"]] == [
+        (destination["name"], score if score != float("inf") else None)
+        for destination, score in expected
+    ]
+
+
+def test_batch_rank_in_worker_processes(files):
+    assert run(files, workers=2) == run(files, workers=1)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_rank_reports_unreadable_lines(files, workers):
+    with open(files / "teams.jsonl", "a") as f:
+        f.write('{"name": "Cut off", "origins": ["Al\n')
+        f.write('["Alex", "Sam"]\n')
+        f.write(json.dumps(TEAMS[0]) + "\n")
+
+    counts, results = run(files, workers)
+
+    assert counts == {"ranked": 4, "failed": 5}
+    cut_off, not_a_team, analysts = results[-3:]
+    assert cut_off["team"] == f"line {len(TEAMS) + 1}"
+    assert cut_off["error"].startswith("Invalid JSON")
+    assert not_a_team == {
+        "team": f"line {len(TEAMS) + 2}",
+        "error": "A team must be a JSON object",
+    }
+    assert analysts == results[0]
+
+
+def test_load_teams_from_directory(tmp_path):
+    (tmp_path / "b.json").write_text(json.dumps({"origins": ["Sam"]}))
+    (tmp_path / "a.json").write_text(json.dumps({"name": "A", "origins": ["Jo"]}))
+    (tmp_path / "notes.txt").write_text("Not a team")
+
+    teams = list(load_teams(str(tmp_path)))
+
+    assert teams == [
+        {"name": "A", "origins": ["Jo"]},
+        {"name": "b", "origins": ["Sam"]},
+    ]
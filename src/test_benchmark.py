@@ -0,0 +1,67 @@
+import os
+from unittest.mock import patch
+
+import pytest
+from googlemaps.exceptions import ApiError
+
+from benchmark import bench_suite, parse_sizes, synthetic_config
+from fake_maps import FakeMapsClient
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_synthetic_config_is_reproducible_and_in_the_uk():
+    config = synthetic_config(100, 10, seed=1)
+
+    assert config == synthetic_config(100, 10, seed=1)
+    assert config != synthetic_config(100, 10, seed=2)
+    assert len(config["origins"]) == 100
+    assert len(config["destinations"]) == 10
+    for location in config["origins"] + config["destinations"]:
+        assert 49 < location["lat"] < 60
+        assert -8 < location["lon"] < 3
+
+
+def test_fake_client_failures_are_reproducible():
+    def outcomes(client):
+        results = []
+        for i in range(50):
+            try:
+                client.distance_matrix([(51.0 + i / 100, -1.0)], [(52.0, 0.0)])
+                results.append(True)
+            except ApiError as e:
+                assert e.status == "UNKNOWN_ERROR"
+                results.append(False)
+        return results
+
+    first = outcomes(FakeMapsClient(failure_rate=0.3, seed=4))
+
+    assert first == outcomes(FakeMapsClient(failure_rate=0.3, seed=4))
+    assert 5 < first.count(False) < 30
+
+
+def test_parse_sizes():
+    assert parse_sizes("50x20,500x200") == [(50, 20), (500, 200)]
+
+
+@pytest.mark.parametrize("store", ["json", "db"])
+def test_bench_suite(monkeypatch, store):
+    monkeypatch.chdir(REPO_ROOT)  # For index.html
+    with patch("fetching.time.sleep"):
+        report = bench_suite([(40, 10)], failure_rate=0.3, seed=6, store=store)
+
+    (result,) = report["results"]
+    # Failed requests are retried until every route is fetched
+    assert result["routes"] == 400
+    assert result["api"]["failures"] > 0
+    assert result["api"]["elements"] > 400
+    assert set(result["seconds"]) == {
+        "update_routes",
+        "load_config",
+        "load_routes",
+        "find_best_destinations",
+        "build_embedded_html",
+        "build_embedded_html_compact",
+    }
+    counters = result["metrics"]["counters"]
+    assert counters["api.distance_matrix.errors"] == result["api"]["failures"]
@@ -0,0 +1,31 @@
+from coordinates import CoordinateIndex, RouteIndex
+
+
+def test_coordinate_index_ids_are_stable():
+    coordinates = CoordinateIndex()
+    oxford = coordinates.point_id((51.7520, -1.2577))
+    london = coordinates.point_id((51.5072, -0.1276))
+    assert (oxford, london) == (0, 1)
+    # Points sharing a route key share an id
+    assert coordinates.point_id((51.7490, -1.2610)) == oxford
+    assert coordinates.key_id("51.51,-0.13") == london
+    assert coordinates.key(oxford) == "51.75,-1.26"
+
+
+def test_route_index_round_trip():
+    routes = {
+        "51.75,-1.26->52.49,-1.89": 6652,
+        "55.84,-4.20->52.49,-1.89": float("inf"),
+        "51.75,-1.26->52.49,-1.89@driving/mon-09:00": 5000,
+    }
+    index = RouteIndex.from_routes(routes)
+
+    assert len(index) == 2
+    oxford = index.coordinates.point_id((51.75, -1.26))
+    birmingham = index.coordinates.point_id((52.49, -1.89))
+    assert index.get((oxford, birmingham)) == 6652
+    assert index.route_key(oxford, birmingham) == "51.75,-1.26->52.49,-1.89"
+    assert {index.route_key(*ids): index.get(ids) for ids in index} == {
+        "51.75,-1.26->52.49,-1.89": 6652,
+        "55.84,-4.20->52.49,-1.89": float("inf"),
+    }
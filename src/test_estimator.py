@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from coordinates import RouteIndex, coordinate_key
+from estimator import TravelTimeEstimator
+from fake_maps import FakeMapsClient
+from scoring import TravelTimeMatrix
+
+# A grid of origins across the south Midlands, about 10km apart
+ORIGINS = [
+    (round(float(lat), 2), round(float(lon), 2))
+    for lat in np.arange(51.5, 52.55, 0.1)
+    for lon in np.arange(-2.0, -0.45, 0.15)
+]
+DESTINATIONS = [(52.04, -0.76), (52.63, -1.13), (51.48, -3.18), (53.80, -1.55)]
+
+
+def make_index(travel_time, skip=()):
+    routes = {
+        f"{coordinate_key(o)}->{coordinate_key(d)}": travel_time(o, d)
+        for o in ORIGINS
+        for d in DESTINATIONS
+        if (o, d) not in skip
+    }
+    return RouteIndex.from_routes(routes)
+
+
+def test_estimate_matches_distance_model_on_linear_data():
+    client = FakeMapsClient()
+    missing = (ORIGINS[0], DESTINATIONS[1])
+    estimator = TravelTimeEstimator(make_index(client.travel_time, skip=[missing]))
+
+    estimates, confident = estimator.estimate([missing[0]], [missing[1]])
+
+    assert estimates[0] == pytest.approx(client.travel_time(*missing), rel=0.01)
+    assert confident[0]
+
+
+def test_estimate_picks_up_local_effects():
+    # Leicester has a fast rail link, which distance alone can't know about
+    client = FakeMapsClient()
+    leicester = DESTINATIONS[1]
+
+    def travel_time(origin, destination):
+        seconds = client.travel_time(origin, destination)
+        return seconds - 1200 if destination == leicester else seconds
+
+    missing = (ORIGINS[0], leicester)
+    estimator = TravelTimeEstimator(make_index(travel_time, skip=[missing]))
+    estimates, _ = estimator.estimate([missing[0]], [missing[1]])
+    baseline = estimator.model.predict([missing[0]], [missing[1]])[0, 0]
+
+    actual = travel_time(*missing)
+    assert abs(estimates[0] - actual) < abs(baseline - actual) / 2
+
+
+def test_estimates_far_from_known_routes_are_not_confident():
+    estimator = TravelTimeEstimator(make_index(FakeMapsClient().travel_time))
+
+    _, confident = estimator.estimate([(57.48, -4.22)], [(58.97, -2.96)])
+
+    assert not confident[0]
+
+
+def test_estimate_without_known_routes_uses_defaults():
+    estimator = TravelTimeEstimator(RouteIndex())
+
+    estimates, confident = estimator.predict(ORIGINS[:2], DESTINATIONS[:3])
+
+    assert estimates.shape == (2, 3)
+    assert (estimates > 0).all()
+    assert not confident.any()
+
+
+def test_fill_missing_only_replaces_missing_routes():
+    client = FakeMapsClient()
+    missing = (ORIGINS[2], DESTINATIONS[3])
+    index = make_index(client.travel_time, skip=[missing])
+    matrix = TravelTimeMatrix.from_index(index, ORIGINS, DESTINATIONS)
+    known = matrix.times[~matrix.missing].copy()
+
+    matrix.fill_missing(TravelTimeEstimator(index), ORIGINS, DESTINATIONS)
+
+    assert matrix.times[2, 3] == pytest.approx(client.travel_time(*missing), rel=0.01)
+    assert np.array_equal(matrix.times[~matrix.missing], known)
+    assert not matrix.low_confidence.any()
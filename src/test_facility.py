@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from facility import (
+    branch_and_bound_k_median,
+    greedy_k_median,
+    k_median_cost,
+    solve_k_median,
+    swap_local_search,
+)
+
+
+def random_times(seed, n_origins=30, n_destinations=12):
+    rng = np.random.default_rng(seed)
+    origins = rng.random((n_origins, 2))
+    destinations = rng.random((n_destinations, 2))
+    distances = np.linalg.norm(origins[:, None] - destinations[None], axis=2)
+    return distances * 3600 + rng.random((n_origins, n_destinations)) * 600
+
+
+def brute_force_cost(times, k):
+    return min(
+        k_median_cost(times, list(venues))
+        for venues in itertools.combinations(range(times.shape[1]), k)
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_solve_k_median_is_optimal_for_small_problems(seed):
+    times = random_times(seed)
+    k = seed % 4 + 1
+
+    venues, assignment, optimal = solve_k_median(times, k)
+
+    assert optimal
+    assert len(set(venues)) == k
+    assert k_median_cost(times, venues) == pytest.approx(brute_force_cost(times, k))
+    # Everyone is assigned to their quickest chosen venue
+    np.testing.assert_array_equal(
+        times[np.arange(len(times)), np.array(venues)[assignment]],
+        times[:, venues].min(axis=1),
+    )
+
+
+def test_swap_local_search_improves_greedy():
+    # Greedy takes the central venue first, then can't do better than add
+    # one more; the two venues either side serve both clusters better
+    times = np.array(
+        [
+            [10, 50, 100],
+            [10, 50, 100],
+            [100, 50, 10],
+            [100, 50, 10],
+            [60, 45, 60],
+        ],
+        dtype=float,
+    )
+    times = np.hstack([times, np.full((5, 1), 1000.0)])
+
+    greedy = greedy_k_median(times, 2)
+    improved = swap_local_search(times, greedy)
+
+    assert k_median_cost(times, improved) <= k_median_cost(times, greedy)
+    assert sorted(improved) == [0, 2]
+
+
+def test_branch_and_bound_reports_when_out_of_budget():
+    times = random_times(0, 40, 20)
+    venues = greedy_k_median(times, 3)
+
+    _, optimal = branch_and_bound_k_median(times, 3, venues, max_nodes=5)
+
+    assert not optimal
+
+
+def test_unreachable_venues_are_avoided():
+    times = np.array([[np.inf, 500.0, 100.0], [100.0, 500.0, np.inf]])
+
+    venues, assignment, _ = solve_k_median(times, 1)
+
+    assert venues == [1]
+    venues, assignment, _ = solve_k_median(times, 2)
+    assert sorted(venues) == [0, 2]
+    assert [venues[a] for a in assignment] == [2, 0]
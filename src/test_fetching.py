@@ -0,0 +1,80 @@
+import pytest
+from googlemaps.exceptions import ApiError, HTTPError, Timeout
+
+from fetching import TokenBucket, call_with_backoff, fetch_all, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=1, clock=clock, sleep=clock.sleep)
+    for _ in range(21):
+        bucket.acquire()
+    # One token up front, then one every 1/10th of a second
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_is_retryable():
+    assert is_retryable(ApiError("OVER_QUERY_LIMIT"))
+    assert is_retryable(Timeout())
+    assert is_retryable(HTTPError(503))
+    assert not is_retryable(HTTPError(403))
+    assert not is_retryable(ApiError("REQUEST_DENIED"))
+    assert not is_retryable(ValueError("bug"))
+
+
+def test_call_with_backoff_retries_transient_errors():
+    delays = []
+    responses = [ApiError("OVER_QUERY_LIMIT"), Timeout(), "ok"]
+
+    def flaky():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert call_with_backoff(flaky, base_delay=1.0, sleep=delays.append) == "ok"
+    assert len(delays) == 2
+    assert 1.0 <= delays[0] <= 1.1
+    assert 2.0 <= delays[1] <= 2.2
+
+
+def test_call_with_backoff_gives_up():
+    def always_over_limit():
+        raise ApiError("OVER_QUERY_LIMIT")
+
+    with pytest.raises(ApiError):
+        call_with_backoff(always_over_limit, retries=3, sleep=lambda _: None)
+
+
+def test_fetch_all_preserves_job_order():
+    def double(x):
+        if x == 3:
+            raise ValueError("bad job")
+        return x * 2
+
+    jobs = [(i,) for i in range(10)]
+    results = list(fetch_all(double, jobs, workers=4))
+    assert [job for job, _, _ in results] == jobs
+    assert [result for _, result, _ in results if result is not None] == [
+        0,
+        2,
+        4,
+        8,
+        10,
+        12,
+        14,
+        16,
+        18,
+    ]
+    assert isinstance(results[3][2], ValueError)
@@ -0,0 +1,25 @@
+from geocode_cache import GeocodeCache
+
+
+def test_geocode_cache_persists(tmp_path):
+    path = str(tmp_path / "geocode.db")
+    cache = GeocodeCache(path)
+    cache.put_many({"51.75,-1.26": "Oxford, UK", "52.49,-1.89": "Birmingham, UK"})
+    cache.close()
+
+    cache = GeocodeCache(path)
+    assert cache.get_many(["51.75,-1.26", "53.48,-2.24"]) == {
+        "51.75,-1.26": "Oxford, UK"
+    }
+
+
+def test_geocode_cache_keeps_recent_addresses_in_memory(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geocode.db"), maxsize=2)
+    cache.put_many({"51.75,-1.26": "Oxford, UK", "52.49,-1.89": "Birmingham, UK"})
+    cache.get_many(["51.75,-1.26"])
+    cache.put_many({"53.48,-2.24": "Manchester, UK"})
+
+    # Birmingham was least recently used, so it's only on disk now
+    assert list(cache.recent) == ["51.75,-1.26", "53.48,-2.24"]
+    assert cache.get_many(["52.49,-1.89"]) == {"52.49,-1.89": "Birmingham, UK"}
+    assert list(cache.recent) == ["53.48,-2.24", "52.49,-1.89"]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from fake_maps import FakeMapsClient
+from estimator import DistanceModel
+from meeting_point import MeetingPointOptimiser, geometric_median
+from runner import RouteUpdater
+
+
+def test_geometric_median_ignores_outlier():
+    points = np.array([[51.0, -1.0], [51.0, -1.0], [51.0, -1.0], [57.0, -4.0]])
+    # The centroid is dragged towards Scotland; the median stays put
+    assert geometric_median(points) == pytest.approx([51.0, -1.0], abs=0.01)
+
+
+@pytest.fixture
+def updater():
+    config = {
+        "origins": [
+            {"name": "Oxford", "lat": 51.752, "lon": -1.2577},
+            {"name": "Cambridge", "lat": 52.2053, "lon": 0.1218},
+            {"name": "London", "lat": 51.5072, "lon": -0.1276},
+            {"name": "Bristol", "lat": 51.4545, "lon": -2.5879},
+            {"name": "Birmingham", "lat": 52.4862, "lon": -1.8904},
+        ],
+        "destinations": [
+            {"name": "Milton Keynes", "lat": 52.0406, "lon": -0.7594},
+            {"name": "Newcastle", "lat": 54.9783, "lon": -1.6178},
+        ],
+    }
+    with patch.object(RouteUpdater, "load_config", return_value=config):
+        updater = RouteUpdater(
+            "AIzaDummyKeyForTesting", "config.json", routes_file=":memory:"
+        )
+    updater.gmaps = FakeMapsClient()
+    updater.update_routes(batched=True)
+    updater.gmaps = FakeMapsClient()
+    return updater
+
+
+def test_distance_model_fits_cached_routes(updater):
+    model = DistanceModel.fit(updater.route_index)
+    client = updater.gmaps
+    assert model.seconds_per_km == pytest.approx(3600 / client.speed_kmh, rel=0.01)
+    assert model.intercept == pytest.approx(client.overhead_seconds, abs=5)
+
+
+def test_suggest_without_budget_makes_no_requests(updater):
+    suggestions = MeetingPointOptimiser(updater).suggest(3)
+
+    assert updater.gmaps.calls == 0
+    assert len(suggestions) == 3
+    assert [s["score"] for s in suggestions] == sorted(s["score"] for s in suggestions)
+    assert {s["source"] for s in suggestions} <= {"cached", "estimated"}
+
+
+def test_suggest_probes_within_budget(updater):
+    optimiser = MeetingPointOptimiser(updater, budget=2)
+    suggestions = optimiser.suggest(3)
+
+    assert updater.gmaps.calls == optimiser.requests_used <= 2
+    probed = [s for s in suggestions if s["source"] == "probed"]
+    assert len(probed) == 2
+    # Probed points are stored, and become hubs for later searches
+    hubs = [hub["name"] for hub in optimiser.known_hubs()]
+    assert {s["name"] for s in probed} <= set(hubs)
+    updater.gmaps = FakeMapsClient()
+    again = MeetingPointOptimiser(updater).suggest(3)
+    assert updater.gmaps.calls == 0
+    assert any(s["hub"] in {p["name"] for p in probed} for s in again)
+
+
+def test_suggest_scores_under_objective_and_weights(updater):
+    for origin in updater.config["origins"]:
+        origin["weight"] = 0
+    updater.config["origins"][3]["weight"] = 1  # Only Bristol counts
+
+    optimiser = MeetingPointOptimiser(updater, objective="max")
+    suggestions = optimiser.suggest(1)
+
+    # The best place for a meeting of one is on their doorstep
+    bristol = updater.config["origins"][3]
+    assert suggestions[0]["lat"] == pytest.approx(bristol["lat"], abs=0.5)
+    assert suggestions[0]["lon"] == pytest.approx(bristol["lon"], abs=0.5)
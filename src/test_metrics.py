@@ -0,0 +1,63 @@
+import json
+from itertools import count
+
+import pytest
+
+from metrics import MAX_LATENCY_SAMPLES, Metrics, percentile
+
+
+def test_percentile():
+    samples = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert percentile(samples, 50) == 5
+    assert percentile(samples, 90) == 9
+    assert percentile(samples, 99) == 10
+    assert percentile([3], 50) == 3
+
+
+def test_metrics_summary(tmp_path):
+    ticks = count()
+    metrics = Metrics(clock=lambda: next(ticks) * 0.2)  # Each block takes 200ms
+    metrics.increment("api.requests")
+    metrics.increment("api.requests", 2)
+    for _ in range(3):
+        with metrics.timed("api.call"):
+            pass
+    with pytest.raises(RuntimeError):
+        with metrics.timed("api.call"):
+            raise RuntimeError
+    with metrics.phase("fetch"):
+        pass
+    with metrics.phase("fetch"):
+        pass
+
+    summary = metrics.summary()
+
+    assert summary["counters"] == {"api.requests": 3}
+    latency = summary["latency"]["api.call"]
+    assert latency["count"] == 4
+    assert latency["p50_ms"] == pytest.approx(200)
+    assert latency["histogram"]["<=250ms"] == 4
+    assert sum(latency["histogram"].values()) == 4
+    assert summary["phases"]["fetch"]["count"] == 2
+    assert summary["phases"]["fetch"]["seconds"] == pytest.approx(0.4)
+
+    metrics.write_json(str(tmp_path / "metrics.json"))
+    assert json.loads((tmp_path / "metrics.json").read_text()) == json.loads(
+        json.dumps(summary)
+    )
+    metrics.reset()
+    assert metrics.summary() == {"counters": {}, "latency": {}, "phases": {}}
+
+
+def test_latency_memory_is_bounded():
+    metrics = Metrics()
+    for i in range(MAX_LATENCY_SAMPLES + 100):
+        metrics.observe("serve.rank", 10.0 if i < 100 else 0.01)
+
+    assert len(metrics.latencies["serve.rank"].recent) == MAX_LATENCY_SAMPLES
+    latency = metrics.summary()["latency"]["serve.rank"]
+    assert latency["count"] == MAX_LATENCY_SAMPLES + 100
+    assert latency["max_ms"] == pytest.approx(10000)
+    assert latency["histogram"]["<=10000ms"] == 100
+    # Percentiles are of the recent samples, after the slow start
+    assert latency["p99_ms"] == pytest.approx(10)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from metrics import percentile
+from objectives import (
+    BUILTIN_OBJECTIVES,
+    Objective,
+    evaluate_objectives,
+    resolve_objective,
+)
+from scoring import convenience_scores
+
+# Three origins (rows) to two destinations (columns)
+TIMES = np.array([[1000.0, 3000.0], [2000.0, np.inf], [6000.0, 1000.0]])
+
+
+def test_default_objective_matches_convenience_scores():
+    rng = np.random.default_rng(0)
+    times = (rng.random((50, 8)) * 10000).astype(np.float32)
+
+    scores = evaluate_objectives([resolve_objective(None, {})], times)
+
+    np.testing.assert_array_equal(
+        scores["convenience"], convenience_scores(times)["score"]
+    )
+
+
+def test_builtin_objectives():
+    scores = evaluate_objectives(list(BUILTIN_OBJECTIVES.values()), TIMES)
+
+    assert scores["mean"][0] == pytest.approx(3000)
+    assert scores["max"].tolist() == [6000, np.inf]
+    assert scores["p90"].tolist() == [6000, np.inf]
+    assert scores["mean_squares"][0] == pytest.approx(np.sqrt(41e6 / 3))
+    assert scores["co2"][0] == pytest.approx(9000 / 3600 * 2.0)
+    assert scores["co2"][1] == np.inf
+
+
+def test_percentiles_match_nearest_rank():
+    rng = np.random.default_rng(1)
+    times = rng.random((37, 5)) * 10000
+    objectives = [Objective(f"p{q}", "percentile", percentile=q) for q in (50, 90)]
+
+    scores = evaluate_objectives(objectives, times)
+
+    for q in (50, 90):
+        expected = [percentile(sorted(column), q) for column in times.T]
+        np.testing.assert_array_equal(scores[f"p{q}"], expected)
+
+
+def test_weights_and_caps():
+    weights = np.array([2.0, 0.0, 1.0])
+    objectives = [
+        Objective("mean", average_weight=1, maximum_weight=0),
+        Objective("median", "percentile", percentile=50),
+        Objective("capped", average_weight=1, maximum_weight=0, cap_minutes=50),
+    ]
+
+    scores = evaluate_objectives(objectives, TIMES, weights)
+
+    # The second origin doesn't count, so the second destination is reachable
+    assert scores["mean"].tolist() == pytest.approx([8000 / 3, 7000 / 3])
+    assert scores["median"].tolist() == [1000, 3000]
+    assert scores["capped"].tolist() == pytest.approx([5000 / 3, 7000 / 3])
+    assert evaluate_objectives(objectives[2:], TIMES)["capped"][1] == np.inf
+    with pytest.raises(ValueError):
+        evaluate_objectives(objectives, TIMES, np.zeros(3))
+
+
+def test_config_objectives():
+    config = {"objectives": {"fair": {"average_weight": 0.5, "maximum_weight": 0.5}}}
+
+    assert resolve_objective("fair", config).maximum_weight == 0.5
+    assert resolve_objective("p95", config).percentile == 95
+    with pytest.raises(ValueError, match="Unknown objective 'fair'"):
+        resolve_objective("fair", {})
+    with pytest.raises(ValueError, match="Unknown objective kind"):
+        Objective("bad", "median")
@@ -0,0 +1,147 @@
+import json
+
+import numpy as np
+import pytest
+
+from metrics import metrics
+from route_payload import pack_route_matrix, ranking_tables, unpack_route_matrix
+from runner import build_embedded_html
+
+CONFIG = {
+    "origins": [
+        {"name": "Oxford", "lat": 51.752, "lon": -1.2577},
+        {"name": "Cambridge", "lat": 52.2053, "lon": 0.1218},
+    ],
+    "destinations": [
+        {"name": "Milton Keynes", "lat": 52.0406, "lon": -0.7594},
+        {"name": "Newcastle", "lat": 54.9783, "lon": -1.6178},
+        {"name": "Oxford", "lat": 51.752, "lon": -1.2577},
+    ],
+}
+
+ROUTES = {
+    "51.75,-1.26->52.04,-0.76": 3620,
+    "51.75,-1.26->54.98,-1.62": 14400,
+    "51.75,-1.26->51.75,-1.26": 0,
+    "52.21,0.12->52.04,-0.76": float("inf"),
+    "52.21,0.12->51.75,-1.26": 6000,
+    "53.00,-2.00->52.04,-0.76": 999,  # Not in the config
+}
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_pack_route_matrix_round_trip(compress):
+    payload = pack_route_matrix(CONFIG, ROUTES, compress=compress)
+    origins, destinations, seconds = unpack_route_matrix(
+        json.loads(json.dumps(payload))
+    )
+
+    assert payload["bits"] == 16
+    assert origins == ["51.75,-1.26", "52.21,0.12"]
+    assert destinations == ["52.04,-0.76", "54.98,-1.62", "51.75,-1.26"]
+    # Times are rounded to the minute; missing routes are NaN
+    np.testing.assert_array_equal(seconds, [[3600, 14400, 0], [np.inf, np.nan, 6000]])
+
+
+def test_pack_route_matrix_widens_for_long_routes():
+    routes = {"51.75,-1.26->52.04,-0.76": 70000 * 60}
+
+    payload = pack_route_matrix(CONFIG, routes)
+    _, _, seconds = unpack_route_matrix(payload)
+
+    assert payload["bits"] == 32
+    assert seconds[0, 0] == 70000 * 60
+    assert np.isnan(seconds[1, 1])
+
+
+def test_ranking_tables():
+    tables = ranking_tables(CONFIG, ROUTES)
+
+    # A row per destination, a column per origin; missing routes take 1800s
+    assert tables["times"] == [[3620, None], [14400, 1800], [0, 6000]]
+    assert tables["sums"] == [3620, 16200, 6000]
+    assert tables["unreachable"] == [1, 0, 0]
+    assert tables["slowest_first"] == [[1, 0], [0, 1], [1, 0]]
+
+
+def test_build_embedded_html_compact(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "index.html").write_text(
+        "<script>async function loadData() {\n}</script>"
+    )
+    (tmp_path / "config.json").write_text(json.dumps(CONFIG))
+    (tmp_path / "routes.json").write_text(json.dumps({"a->b": 1}))
+
+    build_embedded_html("config.json", "routes.json", "out.html", compact=True)
+    html = (tmp_path / "out.html").read_text()
+
+    assert "routes = await decodeRouteMatrix(" in html
+    assert "a->b" not in html
+    assert "initRanking(" not in html
+
+
+def test_build_embedded_html_precompute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "index.html").write_text(
+        "<script>async function loadData() {\n}</script>"
+    )
+    (tmp_path / "config.json").write_text(json.dumps(CONFIG))
+    (tmp_path / "routes.json").write_text(json.dumps(ROUTES))
+
+    build_embedded_html("config.json", "routes.json", "out.html", precompute=True)
+    html = (tmp_path / "out.html").read_text()
+
+    tables = json.dumps(ranking_tables(CONFIG, ROUTES))
+    assert f"initRanking({tables});" in html
+
+
+def test_build_embedded_html_marks_estimates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "index.html").write_text(
+        "<script>async function loadData() {\n}</script>"
+    )
+    (tmp_path / "config.json").write_text(json.dumps(CONFIG))
+    (tmp_path / "routes.json").write_text(json.dumps(ROUTES))
+
+    metrics.reset()
+    build_embedded_html(
+        "config.json", "routes.json", "out.html", estimate_missing=True, compact=True
+    )
+    html = (tmp_path / "out.html").read_text()
+
+    phases = metrics.summary()["phases"]
+    assert {"load_config", "load_routes", "estimate", "encode"} <= set(phases)
+
+    start = html.index("estimatedRoutes = ") + len("estimatedRoutes = ")
+    estimated = json.loads(html[start : html.index(";", start)])
+    # Cambridge to Newcastle is the only route we don't have
+    assert list(estimated) == ["52.21,0.12->54.98,-1.62"]
+    assert isinstance(estimated["52.21,0.12->54.98,-1.62"], bool)
+
+
+def test_build_embedded_html_objectives(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "index.html").write_text(
+        "<script>async function loadData() {\n}</script>"
+    )
+    config = {**CONFIG, "objectives": {"fair": {"maximum_weight": 0.5}}}
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    (tmp_path / "routes.json").write_text(json.dumps(ROUTES))
+
+    build_embedded_html("config.json", "routes.json", "out.html", objective="fair")
+    html = (tmp_path / "out.html").read_text()
+
+    start = html.index("objectives = ") + len("objectives = ")
+    objectives = json.loads(html[start : html.index(";", start)])
+    assert [objective["name"] for objective in objectives] == [
+        "fair",
+        "convenience",
+        "mean",
+        "max",
+        "p90",
+        "p95",
+        "mean_squares",
+        "co2",
+    ]
+    assert objectives[0]["maximum_weight"] == 0.5
+    assert objectives[4]["kind"] == "percentile"
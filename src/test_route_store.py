@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from migrate_to_json import migrate_routes
+from route_store import (
+    JSONRouteStore,
+    SQLiteRouteStore,
+    format_route_key,
+    open_route_store,
+    parse_route_key,
+    scenario_suffix,
+)
+
+
+def test_route_key_round_trip():
+    assert format_route_key("51.75,-1.26", "52.49,-1.89") == "51.75,-1.26->52.49,-1.89"
+    key = format_route_key("51.75,-1.26", "52.49,-1.89", "driving", "mon-09:00")
+    assert key == "51.75,-1.26->52.49,-1.89@driving/mon-09:00"
+    assert parse_route_key(key) == (
+        "51.75,-1.26",
+        "52.49,-1.89",
+        "driving",
+        "mon-09:00",
+    )
+    assert scenario_suffix("driving", "mon-09:00") == "driving/mon-09:00"
+    assert scenario_suffix() == ""
+
+
+def test_open_route_store_picks_backend(tmp_path):
+    assert isinstance(open_route_store(str(tmp_path / "routes.json")), JSONRouteStore)
+    assert isinstance(open_route_store(str(tmp_path / "routes.db")), SQLiteRouteStore)
+    assert isinstance(open_route_store(":memory:"), SQLiteRouteStore)
+
+
+@pytest.mark.parametrize("filename", ["routes.json", "routes.db"])
+def test_route_store_persists(tmp_path, filename):
+    path = str(tmp_path / filename)
+    with open_route_store(path) as store:
+        store["51.75,-1.26->52.49,-1.89"] = 6652
+        store.put_many(
+            {
+                "51.75,-1.26->51.52,-0.13": 3600,
+                "55.84,-4.20->50.82,-0.14": float("inf"),
+            }
+        )
+        store["51.75,-1.26->52.49,-1.89"] = 6000  # upsert
+
+    store = open_route_store(path)
+    assert len(store) == 3
+    assert store["51.75,-1.26->52.49,-1.89"] == 6000
+    assert store["55.84,-4.20->50.82,-0.14"] == float("inf")
+    assert "51.75,-1.26->53.48,-2.24" not in store
+    assert store.get_many(["51.75,-1.26->51.52,-0.13", "51.75,-1.26->53.48,-2.24"]) == {
+        "51.75,-1.26->51.52,-0.13": 3600
+    }
+
+
+def test_json_route_store_reader_leaves_file_alone(tmp_path):
+    path = tmp_path / "routes.json"
+    store = open_route_store(str(path))
+    store["51.75,-1.26->52.49,-1.89"] = 6652
+    store.close()
+    os.utime(path, ns=(1, 1))
+
+    store = open_route_store(str(path))
+    assert len(store) == 1
+    store.close()
+    assert path.stat().st_mtime_ns == 1
+
+
+def test_migrate_routes(tmp_path):
+    routes = {f"51.{i:02d},-1.26->52.49,-1.89": 1000 + i for i in range(25)}
+    source = tmp_path / "routes.json"
+    source.write_text(json.dumps(routes))
+    store = open_route_store(str(source))
+    store.put_many({"51.03,-1.26->52.49,-1.89": 1003}, fetched_at=1.0, status="ok")
+    store.save()
+
+    count = migrate_routes(str(source), str(tmp_path / "routes.db"), batch_size=10)
+
+    assert count == 25
+    dest = open_route_store(str(tmp_path / "routes.db"))
+    assert dict(dest.items()) == routes
+    assert dest.fetch_info(routes) == {"51.03,-1.26->52.49,-1.89": (1.0, "ok")}
+
+
+@pytest.mark.parametrize("filename", ["routes.json", "routes.db"])
+def test_route_store_records_fetch_info(tmp_path, filename):
+    path = str(tmp_path / filename)
+    store = open_route_store(path)
+    store.put_many({"51.75,-1.26->52.49,-1.89": 6652}, fetched_at=1000.0, status="ok")
+    store.put_many({"51.75,-1.26->51.52,-0.13": 3600})
+    store.put_many({"51.75,-1.26->52.49,-1.89": 6000}, status="error")
+    store.close()
+
+    store = open_route_store(path)
+    keys = ["51.75,-1.26->52.49,-1.89", "51.75,-1.26->51.52,-0.13"]
+    assert store.fetch_info(keys) == {"51.75,-1.26->52.49,-1.89": (1000.0, "error")}
+    if filename.endswith(".json"):
+        # The routes file itself stays a plain mapping of key to duration
+        assert json.loads((tmp_path / filename).read_text()) == {
+            "51.75,-1.26->52.49,-1.89": 6000,
+            "51.75,-1.26->51.52,-0.13": 3600,
+        }
+
+
+def test_sqlite_route_store_adds_fetch_info_to_old_databases(tmp_path):
+    path = str(tmp_path / "routes.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE routes (origin TEXT NOT NULL, destination TEXT NOT NULL,"
+        " mode TEXT NOT NULL, slot TEXT NOT NULL, duration NUMERIC,"
+        " PRIMARY KEY (origin, destination, mode, slot)) WITHOUT ROWID"
+    )
+    connection.execute(
+        "INSERT INTO routes VALUES ('51.75,-1.26', '52.49,-1.89', 'transit',"
+        " 'thu-14:00', 6652)"
+    )
+    connection.commit()
+    connection.close()
+
+    store = SQLiteRouteStore(path)
+    assert store["51.75,-1.26->52.49,-1.89"] == 6652
+    assert store.fetch_info(["51.75,-1.26->52.49,-1.89"]) == {}
+    store.put_many({"51.75,-1.26->52.49,-1.89": 6000}, fetched_at=1000.0, status="ok")
+    assert store.fetch_info(["51.75,-1.26->52.49,-1.89"]) == {
+        "51.75,-1.26->52.49,-1.89": (1000.0, "ok")
+    }
+
+
+@pytest.mark.parametrize("filename", ["routes.json", "routes.db"])
+def test_route_store_prune_origins(tmp_path, filename):
+    store = open_route_store(str(tmp_path / filename))
+    store.put_many(
+        {
+            "51.75,-1.26->52.49,-1.89": 6652,
+            "51.75,-1.26->52.49,-1.89@driving/mon-09:00": 4000,
+            "52.21,0.12->52.49,-1.89": 7000,
+            "53.48,-2.24->52.49,-1.89": 5000,
+        }
+    )
+
+    assert store.prune_origins(["51.75,-1.26", "53.00,-2.00"]) == 2
+    assert sorted(store) == [
+        "51.75,-1.26->52.49,-1.89",
+        "51.75,-1.26->52.49,-1.89@driving/mon-09:00",
+    ]
+
+
+def test_json_route_store_checkpoints_to_a_journal(tmp_path):
+    path = str(tmp_path / "routes.json")
+    store = open_route_store(path)
+    store["51.75,-1.26->52.49,-1.89"] = 6652
+    store["51.75,-1.26->51.52,-0.13"] = 3600
+    store.save()
+
+    store.put_many({"55.84,-4.20->50.82,-0.14": 9000}, fetched_at=1000.0, status="ok")
+    del store["51.75,-1.26->51.52,-0.13"]
+    store.checkpoint()
+    store.checkpoint()  # Nothing new to journal
+    store["51.75,-1.26->52.49,-1.89"] = 1  # Lost, as if we crashed now
+
+    # Only the journal was written, one line per checkpoint
+    assert json.loads((tmp_path / "routes.json").read_text()) == {
+        "51.75,-1.26->52.49,-1.89": 6652,
+        "51.75,-1.26->51.52,-0.13": 3600,
+    }
+    journal = tmp_path / "routes.journal.jsonl"
+    assert len(journal.read_text().splitlines()) == 1
+
+    # A crash mid-append leaves a partial line, which readers skip without
+    # touching the file, in case another process is still writing it
+    partial = '{"routes": {"51.75,-1.26'
+    with open(journal, "a") as f:
+        f.write(partial)
+    store = open_route_store(path)
+    assert dict(store.items()) == {
+        "51.75,-1.26->52.49,-1.89": 6652,
+        "55.84,-4.20->50.82,-0.14": 9000,
+    }
+    assert store.fetch_info(["55.84,-4.20->50.82,-0.14"]) == {
+        "55.84,-4.20->50.82,-0.14": (1000.0, "ok")
+    }
+    assert journal.read_text().endswith(partial)
+
+    # The next writer drops it before appending
+    store["53.48,-2.24->52.49,-1.89"] = 5000
+    store.checkpoint()
+    lines = journal.read_text().splitlines()
+    assert len(lines) == 2
+    assert all(json.loads(line) for line in lines)
+
+    store.close()
+    assert not journal.exists()
+    assert json.loads((tmp_path / "routes.json").read_text()) == {
+        "51.75,-1.26->52.49,-1.89": 6652,
+        "55.84,-4.20->50.82,-0.14": 9000,
+        "53.48,-2.24->52.49,-1.89": 5000,
+    }
@@ -1,8 +1,26 @@
 import pytest
 from unittest.mock import patch, mock_open, MagicMock
 import json
+import os
 import sqlite3
-from runner import BestDestinationFinder, RouteUpdater
+import subprocess
+import sys
+import time
+import numpy as np
+from googlemaps.exceptions import ApiError
+from runner import (
+    BestDestinationFinder,
+    RouteUpdater,
+    annotate_destinations,
+    best_of_scenarios,
+    convert_staff_locations,
+    interpolate_staff_locations,
+    prune_routes,
+)
+from fake_maps import FakeMapsClient
+from metrics import metrics
+from objectives import evaluate_objectives
+from route_store import open_route_store
 
 
 @pytest.fixture
@@ -98,7 +116,7 @@ def test_get_address(mock_config):
 
     address = finder.get_address((39.9526, -75.1652))  # Philadelphia
     assert isinstance(address, str)
-    assert address != "Address not found"
+    assert address is not None
 
 
 def test_json_caching(mock_config):
@@ -132,3 +150,658 @@ def test_json_caching(mock_config):
     assert updater.routes[route_key] == 1800
 
     updater.close()
+
+
+@pytest.fixture
+def large_config():
+    # Roughly the size of our real team: 60 staff and 30 hubs, spread over the UK
+    return {
+        "origins": [
+            {"name": f"Person {i}", "lat": 50.5 + i * 0.07, "lon": -3.5 + i * 0.05}
+            for i in range(60)
+        ],
+        "destinations": [
+            {"name": f"Hub {j}", "lat": 51.0 + j * 0.11, "lon": -2.5 + j * 0.03}
+            for j in range(30)
+        ],
+    }
+
+
+def make_updater(config, client, routes_file=":memory:", scenario=None):
+    with patch.object(RouteUpdater, "load_config", return_value=config):
+        updater = RouteUpdater(
+            "AIzaDummyKeyForTesting",
+            "mock_config.json",
+            routes_file=routes_file,
+            scenario=scenario,
+        )
+    updater.gmaps = client
+    return updater
+
+
+def test_batched_update_routes(large_config):
+    client = FakeMapsClient()
+    updater = make_updater(large_config, client)
+
+    updater.update_routes(batched=True)
+
+    assert client.elements == 60 * 30
+    assert client.calls == 18
+    for origins, destinations, _ in client.requests:
+        assert len(origins) <= 25
+        assert len(destinations) <= 25
+        assert len(origins) * len(destinations) <= 100
+
+    origin = (50.5, -3.5)
+    destination = (51.0 + 29 * 0.11, -2.5 + 29 * 0.03)
+    route_key = updater.route_key(origin, destination)
+    assert updater.routes[route_key] == client.travel_time(origin, destination)
+
+
+def test_batched_update_routes_only_fetches_missing(large_config):
+    client = FakeMapsClient()
+    updater = make_updater(large_config, client)
+    updater.update_routes(batched=True)
+
+    large_config["origins"].append({"name": "New starter", "lat": 53.48, "lon": -2.24})
+    client = FakeMapsClient()
+    updater.gmaps = client
+    updater.update_routes(batched=True)
+
+    assert client.elements == 30
+    assert client.calls == 2
+
+
+def test_batched_matches_sequential(mock_config):
+    sequential = make_updater(mock_config, FakeMapsClient())
+    sequential.update_routes()
+    batched = make_updater(mock_config, FakeMapsClient())
+    batched.update_routes(batched=True)
+
+    assert sequential.gmaps.calls == 4
+    assert batched.gmaps.calls == 1
+    assert dict(sequential.routes.items()) == dict(batched.routes.items())
+
+
+def test_concurrent_update_routes_is_faster_and_deterministic(mock_config):
+    serial = make_updater(mock_config, FakeMapsClient(latency=0.05))
+    start = time.perf_counter()
+    serial.update_routes()
+    serial_time = time.perf_counter() - start
+
+    concurrent = make_updater(mock_config, FakeMapsClient(latency=0.05))
+    start = time.perf_counter()
+    concurrent.update_routes(workers=4)
+    concurrent_time = time.perf_counter() - start
+
+    assert concurrent.gmaps.calls == serial.gmaps.calls == 4
+    assert sorted(concurrent.routes.items()) == sorted(serial.routes.items())
+    assert concurrent_time < serial_time / 2
+
+
+def test_update_routes_retries_over_query_limit(mock_config):
+    client = FakeMapsClient()
+    responses = [ApiError("OVER_QUERY_LIMIT")]
+
+    def distance_matrix(*args, **kwargs):
+        if responses:
+            raise responses.pop(0)
+        return FakeMapsClient.distance_matrix(client, *args, **kwargs)
+
+    client.distance_matrix = distance_matrix
+    updater = make_updater(mock_config, client)
+    with patch("fetching.time.sleep") as sleep:
+        updater.update_routes(batched=True)
+
+    sleep.assert_called_once()
+    assert client.calls == 1
+    assert float("inf") not in updater.routes.values()
+
+
+def test_update_routes_checkpoints_and_resumes(large_config, tmp_path):
+    routes_file = str(tmp_path / "routes.json")
+    client = FakeMapsClient()
+    real_distance_matrix = client.distance_matrix
+
+    def crash_after_five_calls(*args, **kwargs):
+        if client.calls == 5:
+            raise KeyboardInterrupt
+        return real_distance_matrix(*args, **kwargs)
+
+    client.distance_matrix = crash_after_five_calls
+    with patch.object(RouteUpdater, "load_config", return_value=large_config):
+        updater = RouteUpdater("AIzaDummyKeyForTesting", "config.json", routes_file)
+    updater.gmaps = client
+    checkpoints = MagicMock(wraps=updater.routes.checkpoint)
+    updater.routes.checkpoint = checkpoints
+    saves = MagicMock(wraps=updater.routes.save)
+    updater.routes.save = saves
+
+    with pytest.raises(KeyboardInterrupt):
+        updater.update_routes(batched=True, checkpoint_every=200)
+
+    # Checkpoints after 200 and 400 routes, then a final save on the way out
+    assert checkpoints.call_count == 2
+    assert saves.call_count == 1
+    with open(routes_file) as f:
+        assert len(json.load(f)) == 500
+    assert not (tmp_path / "routes.json.tmp").exists()
+    assert not (tmp_path / "routes.journal.jsonl").exists()
+
+    client = FakeMapsClient()
+    with patch.object(RouteUpdater, "load_config", return_value=large_config):
+        updater = RouteUpdater("AIzaDummyKeyForTesting", "config.json", routes_file)
+    updater.gmaps = client
+    updater.update_routes(batched=True)
+
+    assert client.elements == 60 * 30 - 500
+    with open(routes_file) as f:
+        assert len(json.load(f)) == 60 * 30
+
+
+def test_update_routes_stops_when_quota_exhausted(mock_config):
+    client = FakeMapsClient()
+    client.distance_matrix = MagicMock(side_effect=ApiError("OVER_DAILY_LIMIT"))
+    updater = make_updater(mock_config, client)
+
+    updater.update_routes()
+
+    assert client.distance_matrix.call_count == 1
+    assert len(updater.routes) == 0
+
+
+def test_update_routes_prunes_hopeless_destinations(large_config):
+    far_away = [
+        {"name": "Inverness", "lat": 57.48, "lon": -4.22},
+        {"name": "Aberdeen", "lat": 57.15, "lon": -2.09},
+        {"name": "Glasgow", "lat": 55.86, "lon": -4.25},
+        {"name": "Penzance", "lat": 50.12, "lon": -5.54},
+    ]
+    large_config["destinations"] += far_away
+    full = make_updater(large_config, FakeMapsClient())
+    full.update_routes(batched=True)
+    pruned = make_updater(large_config, FakeMapsClient())
+    metrics.reset()
+    pruned.update_routes(batched=True, prune_top=3)
+
+    skipped = {d for _, d in pruned.missing_routes()}
+    assert skipped and skipped <= set(pruned.get_coordinates(far_away))
+    assert pruned.gmaps.elements == full.gmaps.elements - 60 * len(skipped)
+    # Only the routes actually fetched are cache misses
+    counters = metrics.summary()["counters"]
+    assert counters["routes.cache_misses"] == pruned.gmaps.elements
+
+    # The top 3 are exactly what a full refresh would find
+    full_scores, _ = full.lower_bound_scores(200.0)
+    pruned_scores, complete = pruned.lower_bound_scores(200.0)
+    top = np.argsort(full_scores, kind="stable")[:3]
+    assert complete[top].all()
+    assert list(np.argsort(pruned_scores, kind="stable")[:3]) == list(top)
+
+
+def test_update_routes_prunes_under_weighted_objective(large_config):
+    far_away = [
+        {"name": "Inverness", "lat": 57.48, "lon": -4.22},
+        {"name": "Aberdeen", "lat": 57.15, "lon": -2.09},
+        {"name": "Glasgow", "lat": 55.86, "lon": -4.25},
+        {"name": "Penzance", "lat": 50.12, "lon": -5.54},
+    ]
+    large_config["destinations"] += far_away
+    for i, origin in enumerate(large_config["origins"]):
+        origin["weight"] = [0, 1, 3][i % 3]
+    full = make_updater(large_config, FakeMapsClient())
+    full.update_routes(batched=True)
+    pruned = make_updater(large_config, FakeMapsClient())
+    pruned.update_routes(batched=True, prune_top=3, objective="mean")
+
+    skipped = {d for _, d in pruned.missing_routes()}
+    assert skipped and skipped <= set(pruned.get_coordinates(far_away))
+    full_scores, _ = full.lower_bound_scores(200.0, "mean")
+    pruned_scores, complete = pruned.lower_bound_scores(200.0, "mean")
+    top = np.argsort(full_scores, kind="stable")[:3]
+    assert complete[top].all()
+    assert list(np.argsort(pruned_scores, kind="stable")[:3]) == list(top)
+
+
+def test_update_routes_caches_scenarios_separately(mock_config):
+    client = FakeMapsClient()
+    updater = make_updater(mock_config, client)
+    updater.update_routes(batched=True)
+    assert client.calls == 1
+
+    client.distance_matrix = MagicMock(wraps=client.distance_matrix)
+    driving = make_updater(mock_config, client, scenario="driving/mon-09:00")
+    driving.routes = updater.routes
+    driving.update_routes(batched=True)
+
+    assert client.distance_matrix.call_args.kwargs["mode"] == "driving"
+    assert "departure_time" in client.distance_matrix.call_args.kwargs
+    assert "40.71,-74.01->39.95,-75.17" in updater.routes
+    assert "40.71,-74.01->39.95,-75.17@driving/mon-09:00" in updater.routes
+    assert len(updater.routes) == 8
+
+
+def test_update_routes_refreshes_stale_routes(mock_config):
+    config = dict(mock_config, scenarios={"default": {"ttl_days": 30}})
+    client = FakeMapsClient()
+    updater = make_updater(config, client)
+    updater.update_routes(batched=True)
+
+    stale_key = "40.71,-74.01->39.95,-75.17"
+    fetched_at, _ = updater.routes.fetch_info([stale_key])[stale_key]
+    updater.routes.put_many(
+        {stale_key: updater.routes[stale_key]},
+        fetched_at=fetched_at - 31 * 24 * 60 * 60,
+    )
+    assert updater.missing_routes() == [((40.7128, -74.006), (39.9526, -75.1652))]
+
+    client.elements = 0
+    updater.update_routes(batched=True)
+    assert client.elements == 1
+    assert updater.missing_routes() == []
+
+
+def test_best_of_scenarios(mock_config, tmp_path):
+    routes_file = str(tmp_path / "routes.json")
+    afternoon = make_updater(mock_config, FakeMapsClient(), routes_file)
+    afternoon.update_routes(batched=True)
+    afternoon.close()
+    # Mornings are quicker to Philadelphia, but Boston hasn't been fetched
+    morning = make_updater(
+        mock_config,
+        FakeMapsClient(overhead_seconds=0),
+        routes_file,
+        scenario="transit/thu-09:00",
+    )
+    morning.fetch_routes(
+        [
+            (o, (39.9526, -75.1652))
+            for o in morning.get_coordinates(mock_config["origins"])
+        ]
+    )
+    morning.close()
+
+    finders = []
+    for scenario in ["default", "transit/thu-09:00"]:
+        with patch.object(
+            BestDestinationFinder, "load_config", return_value=mock_config
+        ):
+            finders.append(
+                BestDestinationFinder(
+                    "AIzaDummyKeyForTesting",
+                    "mock_config.json",
+                    routes_file,
+                    scenario=scenario,
+                )
+            )
+    ranking = best_of_scenarios(finders, top_n=2)
+
+    (first, first_score, first_scenario), (second, _, second_scenario) = ranking
+    assert first["name"] == "Philadelphia"
+    assert first_scenario.slot == "thu-09:00"
+    assert first_score == pytest.approx(finders[1].scores()[0])
+    assert second["name"] == "Boston"
+    assert second_scenario.name == "default"
+
+
+def age_routes(updater, days, keys=None):
+    """Pretend the cached routes were fetched `days` earlier than they were."""
+    keys = list(updater.routes) if keys is None else keys
+    for key, (fetched_at, _) in updater.routes.fetch_info(keys).items():
+        updater.routes.put_many(
+            {key: updater.routes[key]}, fetched_at=fetched_at - days * 24 * 60 * 60
+        )
+
+
+def test_update_routes_retries_errors(mock_config):
+    client = FakeMapsClient()
+    responses = [ApiError("INVALID_REQUEST")]
+
+    def distance_matrix(*args, **kwargs):
+        if responses:
+            raise responses.pop(0)
+        return FakeMapsClient.distance_matrix(client, *args, **kwargs)
+
+    client.distance_matrix = distance_matrix
+    updater = make_updater(mock_config, client)
+    updater.update_routes()
+
+    failed = "40.71,-74.01->39.95,-75.17"
+    assert updater.routes[failed] == float("inf")
+    assert updater.routes.fetch_info([failed])[failed][1] == "error"
+    assert updater.missing_routes() == []
+
+    updater.update_routes(retry_errors=True)
+    assert updater.routes[failed] == client.travel_time(
+        (40.7128, -74.006), (39.9526, -75.1652)
+    )
+    assert updater.routes.fetch_info([failed])[failed][1] == "ok"
+
+
+def write_legacy_routes(updater, routes_file, routes):
+    """Cache routes as they were before fetch times and statuses were kept."""
+    store = open_route_store(routes_file)
+    store.put_many(
+        {updater.route_key(*pair): duration for pair, duration in routes.items()}
+    )
+    store.close()
+
+
+@pytest.mark.parametrize("routes_name", ["routes.json", "routes.db"])
+def test_update_routes_refreshes_legacy_routes_by_age(
+    mock_config, tmp_path, routes_name
+):
+    routes_file = str(tmp_path / routes_name)
+    client = FakeMapsClient()
+    updater = make_updater(mock_config, client, routes_file)
+    pairs = [
+        (origin, destination)
+        for origin in updater.get_coordinates(mock_config["origins"])
+        for destination in updater.get_coordinates(mock_config["destinations"])
+    ]
+    write_legacy_routes(updater, routes_file, {pair: 1234 for pair in pairs})
+    updater = make_updater(mock_config, client, routes_file)
+
+    # With no age limit, routes of unknown age are kept
+    assert updater.missing_routes() == []
+    assert updater.missing_routes(max_age_days=90) == pairs
+
+    updater.update_routes(max_age_days=90, batched=True)
+    assert client.elements == 4
+    assert updater.routes[updater.route_key(*pairs[0])] == client.travel_time(*pairs[0])
+    assert updater.missing_routes(max_age_days=90) == []
+
+
+@pytest.mark.parametrize("routes_name", ["routes.json", "routes.db"])
+def test_update_routes_retries_legacy_unreachable_routes(
+    mock_config, tmp_path, routes_name
+):
+    routes_file = str(tmp_path / routes_name)
+    client = FakeMapsClient()
+    updater = make_updater(mock_config, client, routes_file)
+    pairs = [
+        (origin, destination)
+        for origin in updater.get_coordinates(mock_config["origins"])
+        for destination in updater.get_coordinates(mock_config["destinations"])
+    ]
+    write_legacy_routes(
+        updater, routes_file, {**{pair: 1234 for pair in pairs}, pairs[1]: float("inf")}
+    )
+    updater = make_updater(mock_config, client, routes_file)
+    assert updater.routes[updater.route_key(*pairs[1])] == float("inf")
+
+    assert updater.missing_routes() == []
+    assert updater.missing_routes(retry_errors=True) == [pairs[1]]
+
+    updater.update_routes(retry_errors=True)
+    assert client.elements == 1
+    failed = updater.route_key(*pairs[1])
+    assert updater.routes[failed] == client.travel_time(*pairs[1])
+    assert updater.routes.fetch_info([failed])[failed][1] == "ok"
+
+
+def test_update_routes_refreshes_oldest_within_budget(large_config):
+    client = FakeMapsClient()
+    updater = make_updater(large_config, client)
+    updater.update_routes(batched=True)
+    age_routes(updater, 5)
+    # Person 0's routes are the oldest
+    person_0 = updater.get_coordinates(large_config["origins"][:1])[0]
+    age_routes(
+        updater,
+        5,
+        [
+            updater.route_key(person_0, destination)
+            for destination in updater.get_coordinates(large_config["destinations"])
+        ],
+    )
+
+    assert len(updater.missing_routes(max_age_days=7)) == 30
+    client.calls = 0
+    updater.update_routes(max_age_days=7, budget=5)
+
+    assert client.calls == 5
+    assert len(updater.missing_routes(max_age_days=7)) == 25
+    assert updater.missing_routes(max_age_days=20) == []
+
+
+def fake_reverse_geocode(lat_lng):
+    if lat_lng == (42.36, -71.06):
+        raise ApiError("INVALID_REQUEST")
+    return [{"formatted_address": f"Somewhere near {lat_lng[0]}, {lat_lng[1]}"}]
+
+
+def test_get_addresses_caches_lookups(mock_config, tmp_path):
+    geocode_file = str(tmp_path / "geocode.db")
+    with patch.object(BestDestinationFinder, "load_config", return_value=mock_config):
+        finder = BestDestinationFinder(
+            "AIzaDummyKeyForTesting", "mock_config.json", geocode_file=geocode_file
+        )
+    finder.gmaps.reverse_geocode = MagicMock(side_effect=fake_reverse_geocode)
+
+    points = [(39.9526, -75.1652), (39.9501, -75.1701), (42.3601, -71.0589)]
+    addresses = finder.get_addresses(points, workers=4)
+
+    # Both Philadelphia points round to the same key, so share one request
+    assert addresses == [
+        "Somewhere near 39.95, -75.17",
+        "Somewhere near 39.95, -75.17",
+        None,
+    ]
+    assert finder.gmaps.reverse_geocode.call_count == 2
+    finder.close()
+
+    with patch.object(BestDestinationFinder, "load_config", return_value=mock_config):
+        finder = BestDestinationFinder(
+            "AIzaDummyKeyForTesting", "mock_config.json", geocode_file=geocode_file
+        )
+    finder.gmaps.reverse_geocode = MagicMock(side_effect=fake_reverse_geocode)
+    assert finder.get_address((39.9526, -75.1652)) == "Somewhere near 39.95, -75.17"
+    # Only the failed lookup is tried again
+    finder.get_addresses(points)
+    finder.gmaps.reverse_geocode.assert_called_once_with((42.36, -71.06))
+
+
+def test_annotate_destinations(mock_config, tmp_path):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(mock_config))
+
+    with patch("googlemaps.Client.reverse_geocode", side_effect=fake_reverse_geocode):
+        annotate_destinations(
+            "AIzaDummyKeyForTesting",
+            str(config_file),
+            geocode_file=str(tmp_path / "geocode.db"),
+        )
+
+    destinations = json.loads(config_file.read_text())["destinations"]
+    assert [d.get("address") for d in destinations] == [
+        "Somewhere near 39.95, -75.17",
+        None,
+    ]
+
+
+def test_empty_geocode_results_are_not_saved(mock_config, tmp_path):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(mock_config))
+    geocode_file = str(tmp_path / "geocode.db")
+    reverse_geocode = MagicMock(return_value=[])
+
+    for _ in range(2):
+        with patch("googlemaps.Client.reverse_geocode", reverse_geocode):
+            annotate_destinations(
+                "AIzaDummyKeyForTesting", str(config_file), geocode_file=geocode_file
+            )
+
+    # Nothing was cached, so the second run asked again
+    assert reverse_geocode.call_count == 4
+    destinations = json.loads(config_file.read_text())["destinations"]
+    assert all("address" not in d for d in destinations)
+
+
+PEOPLE_JS = """export default [
+  { name: "Alex Walker", location: [51.752, -1.2577], github: "alexw" },
+  {
+    location: [52.2053, 0.1218],
+    name: 'Sam O\\'Brien',
+    github: "sam", // Moved from Oxford
+  },
+  { name: "No Location Yet", github: "new" },
+  { name: "Jo Leaver", location: [53.4808, -2.2426], links: { github: "jo" } },
+];
+"""
+
+
+def test_convert_staff_locations(tmp_path):
+    (tmp_path / "people.js").write_text(PEOPLE_JS)
+
+    assert convert_staff_locations(str(tmp_path / "people.js")) == {
+        "origins": [
+            {"name": "Alex Walker", "lat": 51.752, "lon": -1.2577},
+            {"name": "Sam O'Brien", "lat": 52.2053, "lon": 0.1218},
+        ],
+        # Jo's entry has nested braces, which we can't read
+        "unparsed": ["No Location Yet", "Jo Leaver"],
+    }
+
+
+def test_interpolate_staff_locations_reports_changes(mock_config, tmp_path):
+    mock_config["origins"] = [
+        {"name": "Alex Walker", "lat": 51.752, "lon": -1.2577},
+        {"name": "Sam O'Brien", "lat": 51.752, "lon": -1.2577, "weight": 2},
+        {"name": "Jo Leaver", "lat": 53.4808, "lon": -2.2426},
+        {"name": "Former Colleague", "lat": 53.4808, "lon": -2.2426},
+    ]
+    (tmp_path / "people.js").write_text(PEOPLE_JS)
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(mock_config))
+
+    changes = interpolate_staff_locations(str(tmp_path / "people.js"), str(config_file))
+
+    assert changes["added"] == []
+    assert [(old["lat"], new["lat"]) for old, new in changes["moved"]] == [
+        (51.752, 52.2053)
+    ]
+    # Jo couldn't be read, so is kept rather than removed
+    assert [origin["name"] for origin in changes["removed"]] == ["Former Colleague"]
+    config = json.loads(config_file.read_text())
+    # Sam moved, but still counts twice
+    assert config["origins"] == [
+        {"name": "Alex Walker", "lat": 51.752, "lon": -1.2577},
+        {"name": "Sam O'Brien", "lat": 52.2053, "lon": 0.1218, "weight": 2},
+        {"name": "Jo Leaver", "lat": 53.4808, "lon": -2.2426},
+    ]
+    assert config["destinations"] == mock_config["destinations"]
+
+
+def test_update_locations_only_fetches_changed_origins(mock_config):
+    client = FakeMapsClient()
+    updater = make_updater(mock_config, client)
+    updater.update_routes()
+    calls = client.calls
+
+    moved = {"name": "Los Angeles", "lat": 37.7749, "lon": -122.4194}
+    updater.config["origins"][1] = moved
+    missing = updater.missing_routes(origins=[moved])
+    updater.fetch_routes(missing, batched=True)
+
+    assert [origin for origin, _ in missing] == [(37.7749, -122.4194)] * 2
+    assert client.calls == calls + 1
+    assert prune_routes(updater.routes, updater.config["origins"]) == 2
+    assert len(updater.routes) == 4
+
+
+def test_update_routes_records_metrics(mock_config):
+    client = FakeMapsClient()
+    updater = make_updater(mock_config, client)
+    metrics.reset()
+
+    updater.update_routes()
+    updater.update_routes()  # Everything is cached by now
+    summary = metrics.summary()
+
+    counters = summary["counters"]
+    assert counters["api.distance_matrix.requests"] == client.calls == 4
+    assert counters["routes.cache_misses"] == counters["routes.fetched"] == 4
+    assert counters["routes.cache_hits"] == 4
+    assert summary["latency"]["api.distance_matrix"]["count"] == 4
+    assert {"load_routes", "fetch", "save"} <= set(summary["phases"])
+
+
+def test_ranking_needs_no_api_key(mock_config):
+    with patch.object(BestDestinationFinder, "load_config", return_value=mock_config):
+        finder = BestDestinationFinder(None, "mock_config.json", ":memory:")
+
+    assert len(finder.find_best_destinations(2)) == 2
+    assert "gmaps" not in finder.__dict__
+    with pytest.raises(ValueError, match="GOOGLE_MAPS_API_KEY"):
+        finder.gmaps
+
+
+def test_ranking_all_origins_counts_their_weights(mock_config):
+    mock_config = dict(
+        mock_config,
+        origins=[
+            dict(mock_config["origins"][0], weight=4),
+            dict(mock_config["origins"][1], weight=0.5),
+        ],
+    )
+    client = FakeMapsClient()
+    updater = make_updater(mock_config, client, routes_file=":memory:")
+    updater.update_routes()
+    with patch.object(BestDestinationFinder, "load_config", return_value=mock_config):
+        finder = BestDestinationFinder(None, "mock_config.json", objective="mean")
+    finder.routes = updater.routes
+
+    times = finder.travel_time_matrix().times
+    expected = evaluate_objectives([finder.objective], times, [4, 0.5])["mean"]
+    unweighted = evaluate_objectives([finder.objective], times)["mean"]
+    assert not np.allclose(expected, unweighted)
+    ranking = finder.find_best_destinations(2)
+    assert [score for _, score in ranking] == pytest.approx(sorted(expected))
+    np.testing.assert_allclose(finder.scores(), expected)
+
+    origins = mock_config["origins"]
+    travel_times = finder.calculate_travel_times(
+        finder.get_coordinates(origins), (39.9526, -75.1652)
+    )
+    assert finder.calculate_convenience_score(travel_times, origins) == pytest.approx(
+        expected[0]
+    )
+
+
+def test_importing_cli_does_not_import_googlemaps():
+    # In a fresh interpreter, as other tests have imported googlemaps here
+    src = os.path.dirname(os.path.abspath(__file__))
+    check_imports = (
+        f"import sys; sys.path.insert(0, {src!r}); import cli;"
+        " print('googlemaps' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check_imports],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_find_best_venue_set(mock_config):
+    client = FakeMapsClient()
+    updater = make_updater(mock_config, client, routes_file=":memory:")
+    updater.update_routes()
+    with patch.object(BestDestinationFinder, "load_config", return_value=mock_config):
+        finder = BestDestinationFinder(None, "mock_config.json")
+    finder.routes = updater.routes
+
+    venues, groups, optimal = finder.find_best_venue_set(2)
+
+    # Philadelphia is quicker than Boston from both, leaving Boston unused
+    assert optimal
+    assert [venue["name"] for venue in venues] == ["Philadelphia", "Boston"]
+    assert [[origin["name"] for origin in group] for group in groups] == [
+        ["New York City", "Los Angeles"],
+        [],
+    ]
+    venues, groups, _ = finder.find_best_venue_set(1, ["Los Angeles"])
+    assert len(venues) == 1
+    assert groups == [[mock_config["origins"][1]]]
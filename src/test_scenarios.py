@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pytest
+
+from scenarios import Scenario, load_scenarios, resolve_scenario
+
+CONFIG = {
+    "scenarios": {
+        "morning": {"mode": "transit", "slot": "thu-09:00", "ttl_days": 30},
+        "drive": {"mode": "driving", "slot": "mon-08:30"},
+    }
+}
+
+
+def test_arrival_time_is_next_matching_slot():
+    wednesday = datetime(2024, 10, 30, 16, 45)
+    thursday = datetime(2024, 10, 31, 9, 0)
+
+    assert Scenario("morning", slot="thu-09:00").arrival_time(wednesday) == thursday
+    assert Scenario("morning", slot="wed-09:00").arrival_time(wednesday) == (
+        datetime(2024, 10, 30, 9, 0)
+    )
+
+
+def test_request_options():
+    when = datetime(2024, 10, 31, 9, 0)
+
+    assert Scenario("default").request_options(when) == {
+        "mode": "transit",
+        "transit_mode": "bus|subway|train",
+        "arrival_time": when,
+    }
+    assert Scenario("drive", mode="driving").request_options(when) == {
+        "mode": "driving",
+        "departure_time": when,
+    }
+
+
+def test_is_stale():
+    day = 24 * 60 * 60
+    scenario = Scenario("morning", ttl_days=30)
+
+    assert scenario.is_stale(0, 31 * day)
+    assert not scenario.is_stale(0, 29 * day)
+    assert scenario.is_stale(None, 31 * day)
+    assert Scenario("default").is_stale(None, 0, max_age_days=90)
+    assert not Scenario("default").is_stale(0, 1000 * day)
+    assert not Scenario("default").is_stale(None, 1000 * day)
+
+
+def test_invalid_scenarios():
+    with pytest.raises(ValueError, match="travel mode"):
+        Scenario("walk", mode="walking")
+    with pytest.raises(ValueError, match="time slot"):
+        Scenario("late", slot="thu-25:00")
+
+
+def test_resolve_scenario():
+    assert set(load_scenarios(CONFIG)) == {"default", "morning", "drive"}
+    assert resolve_scenario(None, CONFIG).name == "default"
+    assert resolve_scenario("morning", CONFIG).ttl_days == 30
+
+    adhoc = resolve_scenario("rail/fri-17:00", CONFIG)
+    assert (adhoc.mode, adhoc.slot) == ("rail", "fri-17:00")
+
+    with pytest.raises(ValueError, match="Unknown scenario"):
+        resolve_scenario("evening", CONFIG)
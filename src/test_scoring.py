@@ -0,0 +1,121 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from objectives import Objective, resolve_objective
+from runner import BestDestinationFinder
+from scoring import TravelTimeMatrix, convenience_scores, top_n_indices
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def legacy_ranking(finder):
+    """The ranking as calculated before the vectorised scoring engine."""
+    origins = finder.get_coordinates(finder.config["origins"])
+    destinations = finder.get_coordinates(finder.config["destinations"])
+    all_destinations = []
+    for i, dest in enumerate(destinations):
+        travel_times = finder.calculate_travel_times(origins, dest)
+        score = finder.calculate_convenience_score(travel_times)
+        all_destinations.append((finder.config["destinations"][i], score))
+    return sorted(all_destinations, key=lambda x: x[1])
+
+
+def test_matrix_from_routes():
+    routes = {
+        "51.75,-1.26->52.49,-1.89": 6652,
+        "51.75,-1.26->51.52,-0.13": float("inf"),
+        "55.84,-4.20->52.49,-1.89": 19580,
+    }
+    matrix = TravelTimeMatrix.from_routes(
+        routes, [(51.75, -1.26), (55.84, -4.2)], [(52.49, -1.89), (51.52, -0.13)]
+    )
+    assert matrix.times.dtype == np.float32
+    assert matrix.times.tolist() == [[6652, float("inf")], [19580, 1800]]
+    assert matrix.missing.tolist() == [[False, False], [False, True]]
+
+
+def test_convenience_scores():
+    times = np.array([[1800, 600], [2400, 600], [3000, float("inf")]], np.float32)
+    scores = convenience_scores(times)
+    assert scores["score"][0] == pytest.approx(2400 * 0.7 + 3000 * 0.3)
+    assert scores["score"][1] == float("inf")
+
+
+def test_top_n_indices_breaks_ties_by_position():
+    scores = np.array([5.0, 1.0, 3.0, 1.0, 3.0, float("inf"), 3.0])
+    assert top_n_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_n_indices(scores, 10).tolist() == [1, 3, 2, 4, 6, 0, 5]
+
+
+def test_rankings_match_legacy_implementation():
+    with open(os.path.join(REPO_ROOT, "locations_config.json")) as f:
+        config = json.load(f)
+    with patch.object(BestDestinationFinder, "load_config", return_value=config):
+        finder = BestDestinationFinder(
+            "AIzaDummyKeyForTesting",
+            "locations_config.json",
+            routes_file=os.path.join(REPO_ROOT, "routes.json"),
+        )
+
+    expected = legacy_ranking(finder)
+    actual = finder.find_best_destinations(len(config["destinations"]))
+    assert actual == expected
+    assert finder.find_best_destinations(5) == expected[:5]
+
+
+@pytest.fixture
+def real_finder():
+    with open(os.path.join(REPO_ROOT, "locations_config.json")) as f:
+        config = json.load(f)
+    with patch.object(BestDestinationFinder, "load_config", return_value=config):
+        return BestDestinationFinder(
+            "AIzaDummyKeyForTesting",
+            "locations_config.json",
+            routes_file=os.path.join(REPO_ROOT, "routes.json"),
+        )
+
+
+@pytest.mark.parametrize("team_size", [1, 3, 20, 45, 50])
+def test_rank_for_matches_full_ranking_of_subset(real_finder, team_size):
+    rng = np.random.default_rng(team_size)
+    origins = real_finder.config["origins"]
+    team = [origins[i] for i in sorted(rng.choice(len(origins), team_size, False))]
+
+    ranking = real_finder.rank_for([origin["name"] for origin in team], 10)
+
+    real_finder.config = dict(real_finder.config, origins=team)
+    assert ranking == legacy_ranking(real_finder)[:10]
+
+
+@pytest.mark.parametrize(
+    "objective",
+    [
+        resolve_objective("p90", {}),
+        resolve_objective("co2", {}),
+        Objective("fair", average_weight=0.5, maximum_weight=0.5, cap_minutes=120),
+    ],
+)
+def test_rank_for_under_other_objectives(real_finder, objective):
+    real_finder.objective = objective
+    team = real_finder.config["origins"][::3]
+
+    ranking = real_finder.rank_for([origin["name"] for origin in team], 10)
+
+    real_finder.config = dict(real_finder.config, origins=team)
+    assert ranking == legacy_ranking(real_finder)[:10]
+
+
+def test_rank_for_caches_queries(real_finder):
+    first = real_finder.rank_for(["Alex Walker", "Alice Wong"], 3)
+    second = real_finder.rank_for(["Alice Wong", "Alex Walker"], 3)
+    assert first == second
+    assert real_finder._rank_subset.cache_info().hits == 1
+
+
+def test_rank_for_rejects_unknown_origins(real_finder):
+    with pytest.raises(ValueError, match="Nobody"):
+        real_finder.rank_for(["Alex Walker", "Nobody"])
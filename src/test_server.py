@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from route_store import open_route_store
+from runner import BestDestinationFinder
+from server import RankingService, make_server
+
+CONFIG = {
+    "origins": [
+        {"name": "Alex", "lat": 51.752, "lon": -1.2577},
+        {"name": "Sam", "lat": 52.2053, "lon": 0.1218},
+    ],
+    "destinations": [
+        {"name": "Milton Keynes", "lat": 52.0406, "lon": -0.7594},
+        {"name": "Oxford", "lat": 51.752, "lon": -1.2577},
+    ],
+}
+
+ROUTES = {
+    "51.75,-1.26->52.04,-0.76": 3600,
+    "51.75,-1.26->51.75,-1.26": 0,
+    "52.21,0.12->52.04,-0.76": 3000,
+    "52.21,0.12->51.75,-1.26": 6000,
+}
+
+
+@pytest.fixture(params=["routes.json", "routes.db"])
+def service(request, tmp_path):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(CONFIG))
+    routes = open_route_store(str(tmp_path / request.param))
+    routes.put_many(ROUTES)
+    routes.close()
+    return RankingService(str(config_file), str(tmp_path / request.param))
+
+
+@pytest.fixture
+def server_url(service):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def get_json(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_rank(server_url):
+    status, body = get_json(f"{server_url}/rank?top=1")
+    assert status == 200
+    # Milton Keynes: 0.7 * 3300 + 0.3 * 3600
+    assert body["destinations"] == [{**CONFIG["destinations"][0], "score": 3390.0}]
+
+    status, body = get_json(f"{server_url}/rank?origins=Alex&top=2")
+    assert [d["name"] for d in body["destinations"]] == ["Oxford", "Milton Keynes"]
+    assert body["origins"] == ["Alex"]
+
+
+@pytest.mark.parametrize("objective", [None, "mean", "p90"])
+def test_rank_matches_find_locations(service, objective):
+    config = dict(
+        CONFIG,
+        origins=[dict(CONFIG["origins"][0], weight=3), CONFIG["origins"][1]],
+    )
+    with open(service.config_file, "w") as f:
+        json.dump(config, f)
+    os.utime(service.config_file, ns=(1, 1))
+    service.reload_if_changed()
+    finder = BestDestinationFinder(
+        None, service.config_file, service.routes_file, objective=objective
+    )
+
+    for origin_names, expected in [
+        (["Alex"], finder.rank_for(["Alex"], 2)),
+        (None, finder.find_best_destinations(2)),
+    ]:
+        ranking = service.rankings.rank(origin_names, 2, objective)
+        assert [(d["name"], score) for d, score in ranking] == [
+            (d["name"], pytest.approx(score)) for d, score in expected
+        ]
+    if objective != "p90":
+        # Alex counts three times, so Oxford wins
+        assert ranking[0][0]["name"] == "Oxford"
+
+
+def test_rank_by_objective(server_url):
+    status, body = get_json(f"{server_url}/rank?top=1&objective=max")
+    assert status == 200
+    assert body["objective"] == "max"
+    assert body["destinations"][0]["score"] == 3600.0
+
+
+def test_rank_rejects_bad_queries(server_url):
+    assert get_json(f"{server_url}/rank?objective=fastest")[0] == 400
+    assert get_json(f"{server_url}/rank?origins=Nobody")[0] == 400
+    assert get_json(f"{server_url}/rank?top=zero")[0] == 400
+    assert get_json(f"{server_url}/nowhere")[0] == 404
+
+
+def test_load_index_closes_the_store(service):
+    stores = []
+
+    def open_and_watch(path):
+        routes = open_route_store(path)
+        routes.close = MagicMock(wraps=routes.close)
+        stores.append(routes)
+        return routes
+
+    with patch("server.open_route_store", side_effect=open_and_watch):
+        service.load_index(service.scenario)
+    [routes] = stores
+    routes.close.assert_called_once_with()
+
+
+def test_reloads_changed_files(service):
+    assert not service.reload_if_changed()
+    index = service.rankings.index
+
+    config = dict(CONFIG, origins=CONFIG["origins"][:1])
+    with open(service.config_file, "w") as f:
+        json.dump(config, f)
+    os.utime(service.config_file, ns=(1, 1))  # Make sure the change shows
+
+    assert service.reload_if_changed()
+    # Only the config changed, so the routes weren't read again
+    assert service.rankings.index is index
+    assert service.rankings.rank()[0][0]["name"] == "Oxford"
+
+    routes = open_route_store(service.routes_file)
+    routes["51.75,-1.26->52.04,-0.76"] = 60
+    routes.close()
+    os.utime(service.routes_file, ns=(2, 2))
+
+    assert service.reload_if_changed()
+    assert service.rankings.index is not index
+    scores = {d["name"]: score for d, score in service.rankings.rank(top_n=2)}
+    assert scores == {"Oxford": 0.0, "Milton Keynes": 60.0}